@@ -1,22 +1,21 @@
-from datetime import date, datetime, time
-from typing import Optional, Dict, Any, List
-import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Dict, Any, List, Iterator
+import asyncio
+import json
 
-from fastapi import APIRouter, Query, Depends, Request
+from fastapi import APIRouter, Query, Depends, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from sqlmodel import Session, select, create_engine
+from sqlmodel import Session, select
 
 from sqlalchemy.exc import SQLAlchemyError
 
 from fastapi import Body
 from fastapi import HTTPException
 
-from passlib.hash import bcrypt
-
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt
 from pydantic import BaseModel
-from .auth import create_access_token, verify_user_credentials
+from .auth import create_access_token, verify_user_credentials, current_user_id, hash_password
 
 from .models import (
     User, Goal, GoalType, MealLog, WaterLog, WeightLog, OnboardingSubmission, SQLModel, MealDraft
@@ -24,18 +23,35 @@ from .models import (
 from .schemas import (
     DashboardResponse, Targets, MealItem, WaterItem, WeightBlock, Totals,
     OnboardingSubmitRequest, OnboardingSubmitResponse,
-    MealDraftResponse, ConfirmMealRequest, ConfirmMealResponse
+    MealDraftResponse, ConfirmMealRequest, ConfirmMealResponse,
+    HistoryDay, HistoryResponse, MealDraftStatusResponse,
+    SyncBatchRequest, SyncBatchResponse, SyncItemResult, DeltaSyncResponse,
+)
+from .queries import (
+    dashboard_summary, meal_rows_for_day, water_rows_for_day, goal_history, summaries_for_range,
+    dashboard_version, user_version,
 )
+from .rollups import apply_meal_delta, apply_water_delta, refresh_day_weight, rebuild_daily_summaries
+from .gpt import (
+    InvalidMealAnalysis, MealAnalysis, MealRequest, read_meal_request, prepare_meal_request, lookup_meal_analysis,
+    run_meal_analysis, run_until_disconnected,
+    stream_meal_analysis, remember_meal_analysis, parse_meal_analysis,
+)
+from .gpt_usage import check_gpt_budget, record_draft_usage, record_usage
+from .json_stream import JsonFieldStream
+from .jobs import JobQueue
+from .sync import apply_sync_batch
+from .changes import changes_since
+from .idempotency import IdempotentRoute
+from .etags import etag_headers, etag_response, make_etag, not_modified
+from .dashboard_cache import dashboard_cache, mark_dirty
+from .responses import trusted_json
+from .metrics import render_metrics
 from .config import settings
+from .db import engine, db_writer
 
-router = APIRouter()
-
-# Shared HTTP Bearer auth dependency (used by multiple endpoints)
-security = HTTPBearer()
+router = APIRouter(route_class=IdempotentRoute)
 
-# ensure ./data exists
-os.makedirs("data", exist_ok=True)
-engine = create_engine("sqlite:///./data/calorie_tracker.db", echo=False)
 
 
 # ======================================================
@@ -97,6 +113,7 @@ def init_db_with_seed() -> None:
             session.add(WeightLog(user_id=1, on_date=d, kg=78.0 - i * 0.4))
 
         session.commit()
+        rebuild_daily_summaries(session, [1])
 
 
 # ======================================================
@@ -107,18 +124,6 @@ def format_hhmm(dt: datetime) -> str:
     return dt.strftime("%H:%M")
 
 
-def sum_macros(meals: List[MealLog]) -> Dict[str, float]:
-    total = {"kcal": 0.0, "protein_g": 0.0, "fat_g": 0.0, "carbs_g": 0.0, "sugar_g": 0.0, "fiber_g": 0.0}
-    for m in meals:
-        total["kcal"] += float(m.kcal)
-        total["protein_g"] += float(m.protein_g)
-        total["fat_g"] += float(m.fat_g)
-        total["carbs_g"] += float(m.carbs_g)
-        total["sugar_g"] += float(m.sugar_g)
-        total["fiber_g"] += float(m.fiber_g)
-    return total
-
-
 # ======================================================
 #  Healthcheck
 # ======================================================
@@ -129,6 +134,18 @@ def healthz() -> Dict[str, Any]:
     return {"status": "ok"}
 
 
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    """Request histograms and cache counters in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/healthz/cache")
+def cache_stats() -> Dict[str, Any]:
+    """Dashboard response cache counters (items, hits, misses, hit_rate, evictions, invalidations)."""
+    return {"status": "ok", "dashboard": dashboard_cache.stats()}
+
+
 # ======================================================
 #  Auth
 # ======================================================
@@ -144,12 +161,11 @@ class LoginResponse(BaseModel):
 @router.post("/api/auth/login", response_model=LoginResponse)
 def login(payload: LoginRequest) -> LoginResponse:
     """Login by name/password and get JWT token."""
-    with Session(engine) as session:
-        user = verify_user_credentials(session, payload.name, payload.password)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
-        token = create_access_token({"sub": str(user.id)})
-        return LoginResponse(status="ok", token=token)
+    user = verify_user_credentials(payload.name, payload.password)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    token = create_access_token({"sub": str(user.id)})
+    return trusted_json(LoginResponse(status="ok", token=token))
 
 # ======================================================
 #  Dashboard
@@ -157,85 +173,195 @@ def login(payload: LoginRequest) -> LoginResponse:
 
 @router.get("/api/dashboard", response_model=DashboardResponse)
 def get_dashboard(
+    request: Request,
     date_: Optional[date] = Query(default=None, alias="date"),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-) -> DashboardResponse:
+    user_id: int = Depends(current_user_id),
+) -> Response:
     """Get nutrition dashboard for a specific date.
 
     Auth: Requires Bearer JWT in `Authorization` header (e.g., `Authorization: Bearer <token>`).
+
+    Returns an `ETag`; repeat the request with `If-None-Match` to get `304 Not Modified`
+    while nothing for that day, the goal or the profile has changed.
     """
     target_date = date_ or date.today()
-    # Auth: require bearer token to determine user_id
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if (cached := cached_dashboard(request, user_id, target_date)) is not None:
+        return cached
+    token = dashboard_cache.token(user_id)
     with Session(engine) as session:
-        goal_obj = session.exec(select(Goal).where(Goal.user_id == user_id).order_by(Goal.created_at.desc()).limit(1)).first()
-        targets = None
-        if goal_obj:
-            targets = Targets(
-                goal=goal_obj.goal_type,
-                calories=goal_obj.calories_kcal,
-                protein_g=goal_obj.protein_g,
-                fat_g=goal_obj.fat_g,
-                carbs_g=goal_obj.carbs_g,
-                sugar_g=goal_obj.sugar_g,
-                fiber_g=goal_obj.fiber_g,
-            )
+        stamp = session.exec(dashboard_version(user_id, target_date)).first()
+        etag = dashboard_etag(user_id, target_date, stamp)
+        if (unchanged := not_modified(request, etag)) is not None:
+            return unchanged
+        summary = session.exec(dashboard_summary(user_id, target_date)).one()
+        meal_rows = session.exec(meal_rows_for_day(user_id, target_date)).all()
+        water_rows = session.exec(water_rows_for_day(user_id, target_date)).all()
+    dashboard = build_dashboard(target_date, summary, meal_rows, water_rows)
+    return dashboard_response(user_id, target_date, etag, dashboard, token)
+
+
+def dashboard_etag(user_id: int, target_date: date, stamp: Any) -> str:
+    """ETag дашборда из строки dashboard_version (None — пользователя нет, ответ будет пустым)."""
+    user_version, day_version = stamp if stamp is not None else (None, 0)
+    return make_etag("dashboard", user_id, target_date, user_version, day_version)
+
+
+def weight_list_etag(user_id: int, version: Optional[int], date_from: Optional[date], date_to: Optional[date]) -> str:
+    return make_etag("weight", user_id, version, date_from, date_to)
+
+
+def cached_dashboard(request: Request, user_id: int, target_date: date) -> Optional[Response]:
+    """Ответ (или 304) из dashboard_cache без обращения к базе; None — дня нет в кэше."""
+    cached = dashboard_cache.get(user_id, target_date)
+    if cached is None:
+        return None
+    etag, body = cached
+    return not_modified(request, etag) or etag_response(etag, body)
+
+
+def dashboard_response(user_id: int, target_date: date, etag: str, dashboard: DashboardResponse, token: int) -> Response:
+    """Сериализует дашборд один раз: те же байты уходят клиенту и в кэш."""
+    body = dashboard.model_dump_json().encode("utf-8")
+    dashboard_cache.put(user_id, target_date, etag, body, token)
+    return etag_response(etag, body)
+
+
+def build_dashboard(target_date: date, summary: Any, meal_rows: List[Any], water_rows: List[Any]) -> DashboardResponse:
+    """Собирает DashboardResponse из строк dashboard_summary / meal_rows_for_day / water_rows_for_day."""
+    targets = None
+    if summary.goal_type is not None:
+        targets = Targets(
+            goal=summary.goal_type,
+            calories=summary.goal_calories,
+            protein_g=summary.goal_protein_g,
+            fat_g=summary.goal_fat_g,
+            carbs_g=summary.goal_carbs_g,
+            sugar_g=summary.goal_sugar_g,
+            fiber_g=summary.goal_fiber_g,
+        )
 
-        from sqlalchemy import func
+    meals = [MealItem(time=format_hhmm(m.eaten_at), name=m.name, kcal=m.kcal, protein_g=m.protein_g,
+                      fat_g=m.fat_g, carbs_g=m.carbs_g, sugar_g=m.sugar_g, fiber_g=m.fiber_g)
+             for m in meal_rows]
+    water = [WaterItem(time=format_hhmm(w.drank_at), ml=w.ml) for w in water_rows]
+
+    weight_block = WeightBlock(start_kg=summary.start_weight_kg or 0.0, today_kg=summary.today_kg)
+
+    totals = Totals(
+        kcal=round(summary.kcal, 1),
+        protein_g=round(summary.protein_g, 1),
+        fat_g=round(summary.fat_g, 1),
+        carbs_g=round(summary.carbs_g, 1),
+        sugar_g=round(summary.sugar_g, 1),
+        fiber_g=round(summary.fiber_g, 1),
+        water_ml=summary.water_ml,
+    )
 
-        # Отладочная печать всех записей
-        all_meals = list(session.exec(select(MealLog).where(MealLog.user_id == user_id)))
+    return DashboardResponse(
+        date=target_date,
+        targets=targets,
+        meals=meals,
+        water=water,
+        weight=weight_block,
+        totals=totals,
+    )
+
+
+# ======================================================
+#  History (multi-day)
+# ======================================================
+
+# Диапазоны длиннее этого отдаются построчно (NDJSON), а не одним JSON-документом
+HISTORY_NDJSON_THRESHOLD_DAYS = 92
+
+
+def _targets_from_goal(goal: Optional[Goal]) -> Optional[Targets]:
+    if goal is None:
+        return None
+    return Targets(
+        goal=goal.goal_type,
+        calories=goal.calories_kcal,
+        protein_g=goal.protein_g,
+        fat_g=goal.fat_g,
+        carbs_g=goal.carbs_g,
+        sugar_g=goal.sugar_g,
+        fiber_g=goal.fiber_g,
+    )
 
-        # Фильтрация по дате с использованием SQLite DATE()
-        meals_rows = list(session.exec(
-            select(MealLog)
-            .where((MealLog.user_id == user_id) &
-                   (func.date(MealLog.eaten_at) == str(target_date)))
-            .order_by(MealLog.eaten_at.asc())
-        ))
-        meals = [MealItem(time=format_hhmm(m.eaten_at), name=m.name, kcal=m.kcal, protein_g=m.protein_g,
-                          fat_g=m.fat_g, carbs_g=m.carbs_g, sugar_g=m.sugar_g, fiber_g=m.fiber_g) for m in meals_rows]
-
-        water_rows = list(session.exec(
-            select(WaterLog)
-            .where((WaterLog.user_id == user_id) &
-                   (WaterLog.drank_at >= datetime.combine(target_date, time.min)) &
-                   (WaterLog.drank_at <= datetime.combine(target_date, time.max)))
-            .order_by(WaterLog.drank_at.asc())
-        ))
-        water = [WaterItem(time=format_hhmm(w.drank_at), ml=w.ml) for w in water_rows]
-
-        user = session.exec(select(User).where(User.id == user_id)).first()
-        start_weight = user.start_weight_kg if user else 0.0
-        w_row = session.exec(select(WeightLog).where(
-            (WeightLog.user_id == user_id) & (WeightLog.on_date == target_date)
-        )).first()
-        weight_block = WeightBlock(start_kg=start_weight, today_kg=w_row.kg if w_row else None)
-
-        macros_sum = sum_macros(meals_rows)
-        totals = Totals(
-            kcal=round(macros_sum["kcal"], 1),
-            protein_g=round(macros_sum["protein_g"], 1),
-            fat_g=round(macros_sum["fat_g"], 1),
-            carbs_g=round(macros_sum["carbs_g"], 1),
-            sugar_g=round(macros_sum["sugar_g"], 1),
-            fiber_g=round(macros_sum["fiber_g"], 1),
-            water_ml=sum(w.ml for w in water_rows),
-        )
 
-        return DashboardResponse(
-            date=target_date,
-            targets=targets,
-            meals=meals,
-            water=water,
-            weight=weight_block,
+def iter_history_days(session: Session, user_id: int, date_from: date, date_to: date) -> Iterator[HistoryDay]:
+    """Один проход по DailySummary за диапазон + история целей; дни без записей заполняются нулями.
+
+    Цели дня — последняя цель, созданная до конца этого дня (None, если целей ещё не было).
+    """
+    goals = list(session.exec(goal_history(user_id)))
+    summaries = session.exec(summaries_for_range(user_id, date_from, date_to).execution_options(yield_per=500))
+    summary = next(summaries, None)
+
+    goal_idx = -1
+    day = date_from
+    while day <= date_to:
+        day_end = datetime.combine(day + timedelta(days=1), time.min)
+        while goal_idx + 1 < len(goals) and goals[goal_idx + 1].created_at < day_end:
+            goal_idx += 1
+
+        if summary is not None and summary.day == day:
+            totals = Totals(
+                kcal=round(summary.kcal, 1),
+                protein_g=round(summary.protein_g, 1),
+                fat_g=round(summary.fat_g, 1),
+                carbs_g=round(summary.carbs_g, 1),
+                sugar_g=round(summary.sugar_g, 1),
+                fiber_g=round(summary.fiber_g, 1),
+                water_ml=summary.water_ml,
+            )
+            meal_count, weight_kg = summary.meal_count, summary.weight_kg
+            summary = next(summaries, None)
+        else:
+            totals = Totals(kcal=0, protein_g=0, fat_g=0, carbs_g=0, sugar_g=0, fiber_g=0, water_ml=0)
+            meal_count, weight_kg = 0, None
+
+        yield HistoryDay(
+            date=day,
+            targets=_targets_from_goal(goals[goal_idx] if goal_idx >= 0 else None),
             totals=totals,
+            meal_count=meal_count,
+            weight_kg=weight_kg,
         )
+        day += timedelta(days=1)
+
+
+@router.get("/api/history", response_model=HistoryResponse)
+def get_history(
+    request: Request,
+    date_to: Optional[date] = Query(default=None, alias="to", description="End date (YYYY-MM-DD), inclusive. Defaults to today."),
+    date_from: Optional[date] = Query(default=None, alias="from", description="Start date (YYYY-MM-DD), inclusive. Defaults to 6 days before `to`."),
+    user_id: int = Depends(current_user_id),
+):
+    """Per-day totals, targets and weight for a date range (for week/month charts).
+
+    Ranges longer than ~3 months (or requests with `Accept: application/x-ndjson`) are streamed
+    as NDJSON: one `HistoryDay` object per line.
+
+    Auth: Requires Bearer JWT in `Authorization` header.
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=6)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="`from` must not be after `to`")
+
+    wants_ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    if wants_ndjson or (date_to - date_from).days >= HISTORY_NDJSON_THRESHOLD_DAYS:
+        def stream() -> Iterator[str]:
+            with Session(engine) as session:
+                for day in iter_history_days(session, user_id, date_from, date_to):
+                    yield day.model_dump_json() + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    with Session(engine) as session:
+        days = list(iter_history_days(session, user_id, date_from, date_to))
+        return trusted_json(HistoryResponse(date_from=date_from, date_to=date_to, days=days))
 
 
 # ======================================================
@@ -246,7 +372,7 @@ def get_dashboard(
 def add_water_log(
     ml: int = Body(..., embed=True),
     drank_at: Optional[datetime] = Body(None, embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    user_id: int = Depends(current_user_id)
 ) -> Dict[str, Any]:
     """
     Add a new water log entry.
@@ -256,23 +382,17 @@ def add_water_log(
 
     Returns: status, id, ml, drank_at.
     """
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload['sub'])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     if ml <= 0:
         raise HTTPException(status_code=422, detail="ml must be a positive integer")
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         log = WaterLog(
             user_id=user_id,
             ml=ml,
             drank_at=drank_at or datetime.utcnow()
         )
         session.add(log)
-        session.commit()
-        session.refresh(log)
+        apply_water_delta(session, log)
+        session.flush()
         return {
             "status": "ok",
             "id": log.id,
@@ -280,11 +400,13 @@ def add_water_log(
             "drank_at": log.drank_at
         }
 
+    return db_writer.run(write)
+
 
 @router.delete("/api/water/{log_id}")
 def delete_water_log(
     log_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    user_id: int = Depends(current_user_id)
 ) -> Dict[str, Any]:
     """
     Delete a water log entry by ID.
@@ -293,20 +415,16 @@ def delete_water_log(
 
     Returns: status, id.
     """
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload['sub'])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         log = session.get(WaterLog, log_id)
         if log is None or log.user_id != user_id:
             return {"status": "not_found", "id": log_id}
+        apply_water_delta(session, log, sign=-1)
         session.delete(log)
-        session.commit()
         return {"status": "deleted", "id": log_id}
 
+    return db_writer.run(write)
+
 
 # ======================================================
 #  Weight logging
@@ -316,7 +434,7 @@ def delete_water_log(
 def add_weight_log(
     kg: float = Body(..., embed=True),
     on_date: Optional[date] = Body(None, embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Create a new weight entry for the authenticated user.
@@ -327,26 +445,18 @@ def add_weight_log(
 
     Returns: {status, id, kg, on_date}
     """
-    # Auth
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
     if kg is None or kg <= 0:
         raise HTTPException(status_code=422, detail="kg must be a positive number")
 
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         entry = WeightLog(
             user_id=user_id,
             on_date=on_date or date.today(),
             kg=float(kg),
         )
         session.add(entry)
-        session.commit()
-        session.refresh(entry)
+        session.flush()
+        refresh_day_weight(session, user_id, entry.on_date)
         return {
             "status": "ok",
             "id": entry.id,
@@ -354,28 +464,28 @@ def add_weight_log(
             "on_date": entry.on_date,
         }
 
+    return db_writer.run(write)
+
 
 @router.get("/api/weight")
 def list_weight_logs(
+    request: Request,
     date_from: Optional[date] = Query(None, description="Start date (YYYY-MM-DD), inclusive"),
     date_to: Optional[date] = Query(None, description="End date (YYYY-MM-DD), inclusive"),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Get all weight entries for the authenticated user.
     Optional date range filter via query params `date_from` and/or `date_to`.
 
+    Supports `If-None-Match` (returns `304 Not Modified` until a weight entry changes).
+
     Returns: {status, items:[{id, on_date, kg}, ...]}
     """
-    # Auth
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
     with Session(engine) as session:
+        etag = weight_list_etag(user_id, session.exec(user_version(user_id)).first(), date_from, date_to)
+        if (cached := not_modified(request, etag)) is not None:
+            return cached
         stmt = select(WeightLog).where(WeightLog.user_id == user_id)
         if date_from:
             stmt = stmt.where(WeightLog.on_date >= date_from)
@@ -385,42 +495,37 @@ def list_weight_logs(
 
         rows = list(session.exec(stmt))
         items = [{"id": w.id, "on_date": w.on_date, "kg": float(w.kg)} for w in rows]
-        return {"status": "ok", "items": items}
+        return trusted_json({"status": "ok", "items": items}, headers=etag_headers(etag))
 
 
 @router.delete("/api/weight/{weight_id}")
 def delete_weight_log(
     weight_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Delete a specific weight entry by ID.
 
     Returns: {status: "deleted" | "not_found", id}
     """
-    # Auth
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         entry = session.get(WeightLog, weight_id)
         if entry is None or entry.user_id != user_id:
             return {"status": "not_found", "id": weight_id}
         session.delete(entry)
-        session.commit()
+        session.flush()
+        refresh_day_weight(session, user_id, entry.on_date)
         return {"status": "deleted", "id": weight_id}
 
+    return db_writer.run(write)
+
 
 @router.patch("/api/weight/{weight_id}")
 def update_weight_log(
     weight_id: int,
     kg: Optional[float] = Body(None, embed=True),
     on_date: Optional[date] = Body(None, embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Update a specific weight entry. Supply one or both of the fields.
@@ -431,32 +536,27 @@ def update_weight_log(
 
     Returns: {status, id, kg, on_date}
     """
-    # Auth
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
     if kg is None and on_date is None:
         raise HTTPException(status_code=422, detail="Provide at least one of: kg, on_date")
     if kg is not None and kg <= 0:
         raise HTTPException(status_code=422, detail="kg must be a positive number")
 
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         entry = session.get(WeightLog, weight_id)
         if entry is None or entry.user_id != user_id:
             raise HTTPException(status_code=404, detail="Weight entry not found")
 
+        old_date = entry.on_date
         if kg is not None:
             entry.kg = float(kg)
         if on_date is not None:
             entry.on_date = on_date
 
         session.add(entry)
-        session.commit()
-        session.refresh(entry)
+        session.flush()
+        refresh_day_weight(session, user_id, entry.on_date)
+        if old_date != entry.on_date:
+            refresh_day_weight(session, user_id, old_date)
         return {
             "status": "ok",
             "id": entry.id,
@@ -464,6 +564,8 @@ def update_weight_log(
             "on_date": entry.on_date,
         }
 
+    return db_writer.run(write)
+
 # ======================================================
 #  User profile editing
 # ======================================================
@@ -483,7 +585,7 @@ def update_user_and_goal(
     carbs_g: Optional[float] = Body(None),
     sugar_g: Optional[float] = Body(None),
     fiber_g: Optional[float] = Body(None),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Update user and goal fields.
@@ -491,14 +593,10 @@ def update_user_and_goal(
     Accepts any subset of user or goal fields.
     Requires Bearer JWT.
     """
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    # bcrypt — до очереди писателя, чтобы не держать его на хэшировании
+    password_hash = hash_password(password) if password else None
 
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         user = session.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -509,7 +607,7 @@ def update_user_and_goal(
         if gender: user.gender = gender
         if height_cm: user.height_cm = height_cm
         if start_weight_kg: user.start_weight_kg = start_weight_kg
-        if password: user.password_hash = bcrypt.hash(password[:72])
+        if password_hash: user.password_hash = password_hash
 
         # Get the most recent goal
         goal = session.exec(
@@ -530,8 +628,6 @@ def update_user_and_goal(
                 updated_at=datetime.utcnow(),
             )
             session.add(goal)
-            session.commit()
-            session.refresh(goal)
 
         # Update goal fields
         if goal_type: goal.goal_type = goal_type
@@ -551,11 +647,12 @@ def update_user_and_goal(
             except Exception:
                 pass
 
+        user.version = (user.version or 0) + 1  # сбрасывает ETag дашборда и /api/weight
+        mark_dirty(session, user_id)
+
         session.add(user)
         session.add(goal)
-        session.commit()
-        session.refresh(user)
-        session.refresh(goal)
+        session.flush()
 
         return {
             "status": "ok",
@@ -578,179 +675,350 @@ def update_user_and_goal(
             },
         }
 
+    return db_writer.run(write)
+
 # ======================================================
 #  Meal Draft (photo + text -> GPT)
 # ======================================================
 
 from fastapi import File, UploadFile, Form
 
-# ======================================================
-#  GPT API Helper
-# ======================================================
-from openai import OpenAI
+# Helper: extract subset for UI from GPT response
+def _draft_visible_from_gpt(resp: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "total_kcal": resp.get("total_kcal"),
+        "portion_weight_grams": resp.get("portion_weight_grams"),
+        "portion_weight_oz": resp.get("portion_weight_oz"),
+        "cooking_method": resp.get("cooking_method"),
+        "macros": resp.get("macros"),
+        "satiety_hours": resp.get("satiety_hours"),
+    }
 
-def call_gpt_for_meal_analysis(images: Optional[List[UploadFile]], text_description: Optional[str]) -> Dict[str, Any]:
-    """Отправляет одно или несколько изображений и/или текст в OpenAI Responses API и возвращает структурированный анализ блюда.
 
-    Обновлено: Responses API в текущей конфигурации ожидает строковый `image_url`.
-    Поэтому код конвертирует загруженный файл в data URL (`data:<mime>;base64,...`) и передает его как
-    `{"type":"input_image","image_url": data_url}`. Это позволяет работать локально без внешнего хостинга.
-    """
-    import json
-    import base64
-    from fastapi import HTTPException
+draft_jobs = JobQueue(workers=settings.MEAL_DRAFT_WORKERS, maxsize=settings.MEAL_DRAFT_QUEUE_SIZE)
 
-    api_key = settings.OPENAI_API_KEY
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Missing OPENAI_API_KEY in environment")
 
-    client = OpenAI(api_key=api_key)
+def _save_meal_draft(
+    user_id: int,
+    gpt_response: Optional[Dict[str, Any]],
+    status: str = "pending",
+    analysis: Optional[MealAnalysis] = None,
+) -> int:
+    """Сохраняет результат GPT в MealDraft (или пустой драфт со статусом analyzing) вместе с расходом
+    `analysis`; возвращает draft_id."""
+    def write(session: Session) -> int:
+        draft = MealDraft(
+            user_id=user_id,
+            status=status,
+            gpt_result=gpt_response,                         # full GPT JSON
+            visible_data=_draft_visible_from_gpt(gpt_response) if gpt_response else None,  # subset for UI
+        )
+        session.add(draft)
+        session.flush()  # ensure INSERT happens before commit
+        if status == "pending" and draft.gpt_result is None:
+            raise HTTPException(status_code=500, detail="Failed to persist GPT result to draft")
+        if analysis is not None:
+            draft.image_bytes_saved = analysis.image_bytes_saved
+            record_draft_usage(session, draft, analysis)
+        return draft.id
 
-    input_content: List[Dict[str, Any]] = []
+    try:
+        return db_writer.run(write)
+    except SQLAlchemyError as e:
+        # Most common case if migrations not applied: table does not exist
+        # (the writer has already rolled back) — return a clear error to the client
+        raise HTTPException(
+            status_code=500,
+            detail=f"Database error while saving draft (likely missing migrations / table). Error: {str(e.__class__.__name__)}"
+        )
 
-    # Подготовка изображений: превращаем каждое в data URL
-    if images:
-        for idx, img in enumerate(images):
-            try:
-                try:
-                    img.file.seek(0)
-                except Exception:
-                    pass
-                file_bytes = img.file.read()
-                if not file_bytes:
-                    raise HTTPException(status_code=400, detail=f"Uploaded image #{idx+1} is empty")
-                content_type = img.content_type or "image/jpeg"
-                b64 = base64.b64encode(file_bytes).decode("utf-8")
-                data_url = f"data:{content_type};base64,{b64}"
-                input_content.append({
-                    "type": "input_image",
-                    "image_url": data_url
-                })
-            except HTTPException:
-                raise
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Failed to prepare image #{idx+1} for GPT: {e}")
-
-    if text_description:
-        input_content.append({"type": "input_text", "text": text_description})
-
-    if not input_content:
-        raise HTTPException(status_code=400, detail="No image or text provided for GPT analysis")
-
-    response = client.responses.create(
-        model=settings.OPENAI_MODEL,
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "I will send optionally one or more photos of food, a text description (e.g., “chicken cutlets with rice and tzatziki”).\n"
-                    "Based on this, return a structured JSON object with all the nutritional and contextual data filled out as consistently as possible.\n"
-                    "Return format (JSON):\n"
-                    "{\n"
-                    "  \"total_kcal\": 0,\n"
-                    "  \"portion_weight_grams\": 0,\n"
-                    "  \"portion_weight_oz\": 0,\n"
-                    "  \"cooking_method\": \"steamed\",\n"
-                    "  \"macros\": {\n"
-                    "    \"protein_g\": 0,\n"
-                    "    \"fat_g\": 0,\n"
-                    "    \"carbohydrates_g\": 0,\n"
-                    "    \"sugar_g\": 0,\n"
-                    "    \"fiber_g\": 0,\n"
-                    "    \"salt_g\": 0,\n"
-                    "    \"water_ml\": 0\n"
-                    "  },\n"
-                    "  \"satiety_hours\": 0,\n"
-                    "  \"ingredients_detected\": []\n"
-                    "}\n\n"
-                    "Allowed values for cooking_method: raw, boiled, steamed, baked, grilled, fried, air-fried, roasted, sous-vide, microwaved, blanched, stewed, braised, poached, deep-fried, pan-seared, slow-cooked, mixed-method.\n"
-                    "Additional Instructions: If no weight is mentioned, estimate based on typical meal appearance. Prefer accuracy over completeness — return null if uncertain. Round macros to integers; round weight to nearest 5g or 0.1oz; estimate satiety_hours by macro balance."
-                )
-            },
-            {
-                "role": "user",
-                "content": input_content
-            }
-        ]
-    )
 
-    out_text = getattr(response, "output_text", None)
-    if out_text:
-        try:
-            return json.loads(out_text)
-        except Exception:
-            return {"raw": out_text}
+def _finish_meal_draft(draft_id: int, status: str, gpt_response: Dict[str, Any], analysis: Optional[MealAnalysis] = None) -> None:
+    """Записывает результат фонового анализа (и его расход) в драфт, если он всё ещё в статусе analyzing."""
+    def write(session: Session) -> None:
+        draft = session.get(MealDraft, draft_id)
+        if draft is None or draft.status != "analyzing":
+            return
+        draft.status = status
+        draft.gpt_result = gpt_response
+        draft.visible_data = _draft_visible_from_gpt(gpt_response) if status == "pending" else None
+        if analysis is not None:
+            draft.image_bytes_saved = analysis.image_bytes_saved
+            record_draft_usage(session, draft, analysis)
+        session.add(draft)
+
+    db_writer.run(write)
+
+
+def fail_stale_meal_drafts() -> int:
+    """Помечает как failed драфты, чей фоновый анализ прервался (например, рестартом процесса)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.MEAL_DRAFT_STALE_SECONDS)
+    def write(session: Session) -> int:
+        drafts = list(session.exec(
+            select(MealDraft).where(MealDraft.status == "analyzing").where(MealDraft.created_at < cutoff)
+        ))
+        for draft in drafts:
+            draft.status = "failed"
+            draft.gpt_result = {"error": "Analysis was interrupted"}
+            session.add(draft)
+        return len(drafts)
 
     try:
-        return response.model_dump()
-    except Exception:
-        return {"raw": str(response)}
+        return db_writer.run(write)
+    except SQLAlchemyError:
+        # таблиц ещё нет (миграции не применены) — нечего чинить
+        return 0
 
-# Helper: extract subset for UI from GPT response
-def _draft_visible_from_gpt(resp: Dict[str, Any]) -> Dict[str, Any]:
+
+def _spent_analysis(e: HTTPException) -> Optional[MealAnalysis]:
+    """Расход вызова, ответ которого не прошёл валидацию (токены потрачены и идут в лимиты)."""
+    usage = getattr(e, "usage", None)
+    return MealAnalysis({}, False, usage=usage) if usage is not None else None
+
+
+async def _analyze_draft_job(draft_id: int, req: MealRequest) -> None:
+    try:
+        analysis = await run_meal_analysis(req)
+        await run_in_threadpool(_finish_meal_draft, draft_id, "pending", analysis.result, analysis)
+    except HTTPException as e:
+        await run_in_threadpool(_finish_meal_draft, draft_id, "failed", {"error": str(e.detail)}, _spent_analysis(e))
+    except Exception as e:
+        await run_in_threadpool(_finish_meal_draft, draft_id, "failed", {"error": e.__class__.__name__})
+    finally:
+        draft_jobs.notify(draft_id)
+
+
+def _check_gpt_budget(user_id: int) -> None:
+    with Session(engine) as session:
+        check_gpt_budget(session, user_id)
+
+
+def _draft_status_payload(draft: MealDraft) -> Dict[str, Any]:
+    gpt_result = draft.gpt_result or {}
     return {
-        "total_kcal": resp.get("total_kcal"),
-        "portion_weight_grams": resp.get("portion_weight_grams"),
-        "portion_weight_oz": resp.get("portion_weight_oz"),
-        "cooking_method": resp.get("cooking_method"),
-        "macros": resp.get("macros"),
-        "satiety_hours": resp.get("satiety_hours"),
+        "status": "ok",
+        "draft_id": draft.id,
+        "draft_status": draft.status,
+        "suggestion": gpt_result if draft.status not in ("analyzing", "failed") else None,
+        "error": gpt_result.get("error") if draft.status == "failed" else None,
+        "image_bytes_saved": draft.image_bytes_saved or 0,
     }
 
+
+def _load_draft_status(draft_id: int, user_id: int) -> Dict[str, Any]:
+    with Session(engine) as session:
+        draft = session.get(MealDraft, draft_id)
+        if draft is None or draft.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Draft not found")
+        return _draft_status_payload(draft)
+
+
 @router.post("/api/meal/draft", response_model=MealDraftResponse)
-def create_meal_draft(
+async def create_meal_draft(
+    request: Request,
     images: Optional[List[UploadFile]] = File(None),
     text_description: Optional[str] = Form(None),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    wait: bool = Query(False, description="Analyze inline and return the suggestion in this response"),
+    user_id: int = Depends(current_user_id)
 ) -> Dict[str, Any]:
     """
     Accepts one or more images and an optional text description, sends them to GPT for meal analysis.
 
-    Returns: GPT suggestion.
-    """
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload['sub'])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    By default the analysis runs in a background worker: the response carries `draft_id` with
+    `draft_status="analyzing"`, and the result is fetched via `GET /api/meal/draft/{draft_id}`
+    (long-poll with `timeout`) or `GET /api/meal/draft/{draft_id}/events` (SSE).
+    With `wait=true` the model is called inline (cancelled if the client disconnects).
+
+    Images are downscaled, stripped of EXIF and re-encoded before upload to the model
+    (see IMAGE_* settings); `image_bytes_saved` reports the reduction. For background analysis the
+    images are processed before the job is queued, so it is reported right away (and again by
+    `GET /api/meal/draft/{draft_id}`).
+
+    Identical requests (same normalized text, image bytes, model and prompt version) are served
+    from the GPT result cache immediately; `cache` in the response is `hit` or `miss`.
+
+    Requests that need a model call are refused with 429 (and `Retry-After`) once the user's daily
+    GPT limits (GPT_USER_DAILY_CALLS / _TOKENS / _COST_USD) are used up; cache hits are not limited.
 
-    # --- Call GPT directly (no base64, no DB draft yet) ---
-    gpt_response = call_gpt_for_meal_analysis(images, text_description)
-    if not gpt_response or (isinstance(gpt_response, dict) and gpt_response.get("error")):
-        raise HTTPException(status_code=500, detail="Failed to get GPT response")
+    Returns: draft_id, draft_status and (when ready) the GPT suggestion.
+    """
+    req = await read_meal_request(images, text_description)
+    analysis = await lookup_meal_analysis(req)
+    if analysis is None:
+        await run_in_threadpool(_check_gpt_budget, user_id)
+    if analysis is None and not wait:
+        # в очередь попадают уменьшенные изображения: полная очередь не держит исходные загрузки
+        req = await prepare_meal_request(req)
+        draft_id = await run_in_threadpool(_save_meal_draft, user_id, None, "analyzing")
+        try:
+            draft_jobs.submit(lambda: _analyze_draft_job(draft_id, req))
+        except HTTPException as e:
+            await run_in_threadpool(_finish_meal_draft, draft_id, "failed", {"error": str(e.detail)})
+            raise
+        return trusted_json({
+            "status": "ok",
+            "draft_id": draft_id,
+            "draft_status": "analyzing",
+            "suggestion": None,
+            "cache": "miss",
+            "image_bytes_saved": req.image_bytes_saved,
+        })
+
+    if analysis is None:
+        try:
+            analysis = await run_until_disconnected(request, run_meal_analysis(req))
+        except InvalidMealAnalysis as e:
+            # драфт не создаётся, но потраченные токены учитываются
+            if e.usage is not None:
+                await run_in_threadpool(db_writer.run, lambda session: record_usage(session, user_id, e.usage))
+            raise
+    gpt_response = analysis.result
 
     # Save the GPT result to the MealDraft table for later confirmation/editing.
-    try:
-        with Session(engine) as session:
-            draft = MealDraft(
-                user_id=user_id,
-                status="pending",
-                gpt_result=gpt_response,                         # full GPT JSON
-                visible_data=_draft_visible_from_gpt(gpt_response),  # subset for UI
-            )
-            session.add(draft)
-            session.flush()  # ensure INSERT happens before commit
-            if draft.gpt_result is None:
-                raise HTTPException(status_code=500, detail="Failed to persist GPT result to draft")
-            session.commit()
-            session.refresh(draft)
-            return {
-                "status": "ok",
-                "draft_id": draft.id,
-                "suggestion": gpt_response
-            }
-    except SQLAlchemyError as e:
-        # Most common case if migrations not applied: table does not exist
-        # Rollback and return a clear error to the client
+    draft_id = await run_in_threadpool(_save_meal_draft, user_id, gpt_response, "pending", analysis)
+    # suggestion — вложенный dict от GPT: без повторной валидации по MealDraftResponse
+    return trusted_json({
+        "status": "ok",
+        "draft_id": draft_id,
+        "draft_status": "pending",
+        "suggestion": gpt_response,
+        "cache": "hit" if analysis.cache_hit else "miss",
+        "image_bytes_saved": analysis.image_bytes_saved,
+    })
+
+
+async def _fail_interrupted_draft(draft_id: int) -> None:
+    await run_in_threadpool(_finish_meal_draft, draft_id, "failed", {"error": "Stream was interrupted"})
+    draft_jobs.notify(draft_id)
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/api/meal/draft/stream")
+async def create_meal_draft_stream(
+    images: Optional[List[UploadFile]] = File(None),
+    text_description: Optional[str] = Form(None),
+    user_id: int = Depends(current_user_id)
+) -> StreamingResponse:
+    """
+    Streaming variant of `POST /api/meal/draft` (Server-Sent Events).
+
+    Events:
+      - `draft`: {draft_id} — draft created with status `analyzing`
+      - `field`: {name, value} — a top-level field of the GPT answer (e.g. `total_kcal`, `macros`,
+        `ingredients_detected`) as soon as its value is complete
+      - `done`: {draft_id, draft_status, suggestion, cache, image_bytes_saved} — the assembled object, persisted to MealDraft
+      - `error`: {draft_id, detail}
+    """
+    req = await read_meal_request(images, text_description)
+    cached = await lookup_meal_analysis(req)
+    if cached is None:
+        await run_in_threadpool(_check_gpt_budget, user_id)
+
+    async def events():
+        if cached is not None:
+            draft_id = await run_in_threadpool(_save_meal_draft, user_id, cached.result, "pending", cached)
+            yield _sse("draft", {"draft_id": draft_id})
+            for name, value in cached.result.items():
+                yield _sse("field", {"name": name, "value": value})
+            yield _sse("done", {"draft_id": draft_id, "draft_status": "pending", "suggestion": cached.result, "cache": "hit",
+                                "image_bytes_saved": 0})
+            return
+
+        draft_id = await run_in_threadpool(_save_meal_draft, user_id, None, "analyzing")
+        yield _sse("draft", {"draft_id": draft_id})
+        finished = False
+        usage = []
         try:
-            session.rollback()
-        except Exception:
-            pass
-        raise HTTPException(
-            status_code=500,
-            detail=f"Database error while saving draft (likely missing migrations / table). Error: {str(e.__class__.__name__)}"
-        )
+            parser = JsonFieldStream()
+            async for delta in stream_meal_analysis(req, usage.append):
+                for name, value in parser.feed(delta):
+                    yield _sse("field", {"name": name, "value": value})
+
+            gpt_response = parse_meal_analysis(parser.text, usage[-1] if usage else None)
+            sent = usage[-1].image_bytes if usage else 0
+            analysis = MealAnalysis(gpt_response, False, req.image_bytes_in, sent, usage[-1] if usage else None)
+            await run_in_threadpool(_finish_meal_draft, draft_id, "pending", gpt_response, analysis)
+            finished = True
+            await remember_meal_analysis(req, gpt_response)
+            yield _sse("done", {"draft_id": draft_id, "draft_status": "pending", "suggestion": gpt_response, "cache": "miss",
+                                "image_bytes_saved": analysis.image_bytes_saved})
+        except HTTPException as e:
+            await run_in_threadpool(_finish_meal_draft, draft_id, "failed", {"error": str(e.detail)}, _spent_analysis(e))
+            finished = True
+            yield _sse("error", {"draft_id": draft_id, "detail": e.detail})
+        finally:
+            if not finished:
+                # клиент закрыл поток (или непредвиденная ошибка) — не оставляем драфт в analyzing;
+                # запись в потоке и под shield, чтобы не блокировать цикл и пережить отмену задачи
+                await asyncio.shield(_fail_interrupted_draft(draft_id))
+            else:
+                draft_jobs.notify(draft_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/api/meal/draft/{draft_id}", response_model=MealDraftStatusResponse)
+async def get_meal_draft(
+    draft_id: int,
+    timeout: float = Query(0, ge=0, description="Long-poll: wait up to this many seconds while the draft is analyzing"),
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Get a meal draft's status and, once analysis finished, its GPT suggestion.
+
+    With `timeout > 0` the request is held (up to MEAL_DRAFT_LONG_POLL_MAX_SECONDS) until the draft
+    leaves the `analyzing` state.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(timeout, settings.MEAL_DRAFT_LONG_POLL_MAX_SECONDS)
+    while True:
+        # подписка до чтения статуса: уведомление между чтением и ожиданием не теряется
+        with draft_jobs.listen(draft_id) as finished:
+            result = await run_in_threadpool(_load_draft_status, draft_id, user_id)
+            remaining = deadline - loop.time()
+            if result["draft_status"] != "analyzing" or remaining <= 0:
+                return trusted_json(result)
+            # Событие приходит от воркера этого процесса; короткий интервал покрывает другие процессы
+            await draft_jobs.wait(finished, min(1.0, remaining))
+
+
+@router.get("/api/meal/draft/{draft_id}/events")
+async def stream_meal_draft_events(
+    request: Request,
+    draft_id: int,
+    user_id: int = Depends(current_user_id),
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream for a meal draft: emits a `status` event with the same payload as
+    `GET /api/meal/draft/{draft_id}` whenever the status changes, and closes once the draft is no
+    longer `analyzing`.
+    """
+    first = await run_in_threadpool(_load_draft_status, draft_id, user_id)
+
+    async def events():
+        result, last_status = first, None
+        idle = 0.0
+        while True:
+            if result["draft_status"] != last_status:
+                last_status = result["draft_status"]
+                yield f"event: status\ndata: {json.dumps(result)}\n\n"
+                idle = 0.0
+            if last_status != "analyzing" or await request.is_disconnected():
+                return
+            # подписка до чтения статуса: уведомление между чтением и ожиданием не теряется
+            with draft_jobs.listen(draft_id) as finished:
+                result = await run_in_threadpool(_load_draft_status, draft_id, user_id)
+                timed_out = result["draft_status"] == "analyzing" and not await draft_jobs.wait(finished, 1.0)
+            if timed_out:
+                idle += 1.0
+                if idle >= 15.0:
+                    yield ": keep-alive\n\n"
+                    idle = 0.0
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 # ======================================================
@@ -761,94 +1029,57 @@ def create_meal_draft(
 def confirm_meal_draft(
     draft_id: int,
     payload: ConfirmMealRequest,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    user_id: int = Depends(current_user_id)
 ) -> Dict[str, Any]:
     """
     Confirm a pending meal draft: merge front-end edits with GPT draft, create MealLog, and mark draft as confirmed.
     """
-    token = credentials.credentials
-    try:
-        decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(decoded["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         draft = session.get(MealDraft, draft_id)
         if draft is None or draft.user_id != user_id:
             raise HTTPException(status_code=404, detail="Draft not found")
         if str(draft.status).lower() != "pending":
             raise HTTPException(status_code=409, detail="Draft is not pending")
 
-        src_gpt = draft.gpt_result or {}
-        src_vis = draft.visible_data or {}
-
-        def pick(field: str):
-            val = getattr(payload, field, None)
-            if val is not None:
-                return val
-            if field in src_vis and src_vis.get(field) is not None:
-                return src_vis.get(field)
-            return src_gpt.get(field)
-
-        # Base fields
-        title = pick("title") or "Meal"
-        total_kcal = pick("total_kcal") or 0
-        portion_weight_grams = pick("portion_weight_grams") or 0
-        portion_weight_oz = pick("portion_weight_oz") or 0
-        cooking_method = pick("cooking_method")
-        satiety_hours = pick("satiety_hours") or 0
-        ingredients_detected = pick("ingredients_detected") or []
-        time_of_day = pick("time_of_day")
-        location = pick("location")
-        extra_data = pick("extra_data") or {}
-
-        # eaten_at: explicit from payload or now
-        eaten_at = payload.eaten_at or datetime.utcnow()
-
-        # Macros merge
-        base_macros = src_vis.get("macros") or src_gpt.get("macros") or {}
-        mp = payload.macros.model_dump(exclude_none=True) if payload.macros else {}
-        macros = {**base_macros, **mp}
-
-        protein_g = float(macros.get("protein_g") or 0)
-        fat_g = float(macros.get("fat_g") or 0)
-        carbs_g = float(macros.get("carbohydrates_g") or 0)
-        sugar_g = float(macros.get("sugar_g") or 0)
-        fiber_g = float(macros.get("fiber_g") or 0)
-        salt_g = float(macros.get("salt_g") or 0)
-        water_ml = int(macros.get("water_ml") or 0)
+        # gpt_result уже провалидирован по MealAnalysisResult при записи драфта, так что
+        # правки клиента просто накладываются поверх него (и поверх его macros)
+        fields = {**(draft.gpt_result or {}), **payload.model_dump(exclude_none=True, exclude={"macros", "eaten_at"})}
+        macros = {**(fields.get("macros") or {}), **(payload.macros.model_dump(exclude_none=True) if payload.macros else {})}
+
+        def number(source: Dict[str, Any], name: str) -> float:
+            return float(source.get(name) or 0)
 
         meal = MealLog(
             user_id=user_id,
-            eaten_at=eaten_at,
-            name=title,
-            kcal=float(total_kcal or 0),
-            protein_g=protein_g,
-            fat_g=fat_g,
-            carbs_g=carbs_g,
-            sugar_g=sugar_g,
-            fiber_g=fiber_g,
+            eaten_at=payload.eaten_at or datetime.utcnow(),
+            name=fields.get("title") or "Meal",
+            kcal=number(fields, "total_kcal"),
+            protein_g=number(macros, "protein_g"),
+            fat_g=number(macros, "fat_g"),
+            carbs_g=number(macros, "carbohydrates_g"),
+            sugar_g=number(macros, "sugar_g"),
+            fiber_g=number(macros, "fiber_g"),
             draft_id=draft.id,
-            portion_weight_grams=float(portion_weight_grams or 0),
-            portion_weight_oz=float(portion_weight_oz or 0),
-            cooking_method=cooking_method,
-            satiety_hours=float(satiety_hours or 0),
-            ingredients=ingredients_detected,
-            time_of_day=time_of_day,
-            location=location,
-            salt_g=salt_g,
-            water_ml=water_ml,
-            extra_data=extra_data,
+            portion_weight_grams=number(fields, "portion_weight_grams"),
+            portion_weight_oz=number(fields, "portion_weight_oz"),
+            cooking_method=fields.get("cooking_method"),
+            satiety_hours=number(fields, "satiety_hours"),
+            ingredients=fields.get("ingredients_detected") or [],
+            time_of_day=fields.get("time_of_day"),
+            location=fields.get("location"),
+            salt_g=number(macros, "salt_g"),
+            water_ml=int(macros.get("water_ml") or 0),
+            extra_data=fields.get("extra_data") or {},
         )
 
         session.add(meal)
         session.flush()
+        apply_meal_delta(session, meal)
 
         # Update draft status and persist what was confirmed
         draft.status = "confirmed"
         draft.visible_data = {
-            "title": title,
+            "title": meal.name,
             "total_kcal": meal.kcal,
             "portion_weight_grams": meal.portion_weight_grams,
             "portion_weight_oz": meal.portion_weight_oz,
@@ -870,11 +1101,11 @@ def confirm_meal_draft(
         }
 
         session.add(draft)
-        session.commit()
-        session.refresh(meal)
 
         return {"status": "ok", "meal_id": meal.id, "draft_id": draft.id}
 
+    return db_writer.run(write)
+
 
 
 # ======================================================
@@ -885,7 +1116,7 @@ def confirm_meal_draft(
 def delete_meal_log(
     meal_id: int,
     delete_draft: bool = Query(True, description="Also soft-delete associated draft (set status='deleted'); defaults to true"),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: int = Depends(current_user_id),
 ) -> Dict[str, Any]:
     """
     Delete a MealLog entry by ID.
@@ -898,15 +1129,7 @@ def delete_meal_log(
       - meal_id
       - (optional) draft_id, draft_status
     """
-    # Auth
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
-    with Session(engine) as session:
+    def write(session: Session) -> Dict[str, Any]:
         meal = session.get(MealLog, meal_id)
         if meal is None or meal.user_id != user_id:
             return {"status": "not_found", "meal_id": meal_id}
@@ -920,13 +1143,79 @@ def delete_meal_log(
                 session.add(draft)
                 draft_info = {"draft_id": draft.id, "draft_status": "deleted"}
 
+        apply_meal_delta(session, meal, sign=-1)
         session.delete(meal)
-        session.commit()
 
         resp: Dict[str, Any] = {"status": "deleted", "meal_id": meal_id}
         resp.update(draft_info)
         return resp
 
+    return db_writer.run(write)
+
+# ======================================================
+#  Offline sync
+# ======================================================
+
+@router.post("/api/sync/batch", response_model=SyncBatchResponse)
+def sync_batch(
+    payload: SyncBatchRequest,
+    user_id: int = Depends(current_user_id),
+) -> SyncBatchResponse:
+    """
+    Apply a queue of offline log operations in one transaction.
+
+    Body (JSON):
+      - operations: list of {idempotency_key, op: create|update|delete, type: water|weight|meal, id?, data}
+        - water data: ml, drank_at
+        - weight data: kg, on_date
+        - meal data: name, kcal, protein_g, fat_g, carbs_g, sugar_g, fiber_g, salt_g, water_ml,
+          eaten_at, time_of_day, location, ingredients, extra_data
+        - `id` (server id) is required for update/delete.
+
+    Re-sending an operation with an already applied idempotency_key returns the stored result
+    (`replayed: true`) without writing again. Invalid operations are reported per item and do
+    not abort the batch.
+
+    Returns: {status, results:[{idempotency_key, status, id, replayed, error}, ...]} in request order.
+    """
+    if len(payload.operations) > settings.SYNC_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=413, detail=f"Too many operations: at most {settings.SYNC_BATCH_MAX_OPERATIONS} per batch")
+
+    def write(session: Session) -> List[SyncItemResult]:
+        return apply_sync_batch(session, user_id, payload.operations)
+
+    return trusted_json(SyncBatchResponse(results=db_writer.run(write)))
+
+
+@router.get("/api/sync", response_model=DeltaSyncResponse)
+def delta_sync(
+    since: int = Query(0, ge=0, description="Cursor from the previous /api/sync response; 0 for a full sync"),
+    limit: int = Query(500, ge=1, le=5000, description="Max number of changed rows per page"),
+    user_id: int = Depends(current_user_id),
+) -> DeltaSyncResponse:
+    """
+    Get meals, water, weight and goals changed since the client's last sync.
+
+    - **since**: int, cursor returned by the previous call (0 = everything).
+    - **limit**: int, page size; when `has_more` is true, call again with the returned cursor.
+
+    The change log is kept for CHANGELOG_RETENTION_SECONDS (30 days by default). A cursor older
+    than that may have missed deletions: the response then has `reset: true` and is the first page
+    of a full sync (as for `since=0`) — drop the local copy and continue with the returned cursor.
+
+    Returns: {status, cursor, has_more, reset, changes:{meal|water|weight|goal: [row, ...]}, deleted:{...: [id, ...]}}
+    """
+    with Session(engine) as session:
+        page = changes_since(session, user_id, since, limit)
+        return trusted_json(DeltaSyncResponse(
+            cursor=page["cursor"],
+            has_more=page["has_more"],
+            reset=page["reset"],
+            changes={entity: [obj.model_dump() for obj in rows] for entity, rows in page["upserts"].items()},
+            deleted=page["deleted"],
+        ))
+
+
 # ======================================================
 #  Onboarding
 # ======================================================
@@ -934,7 +1223,10 @@ def delete_meal_log(
 @router.post("/api/onboarding/submit", response_model=OnboardingSubmitResponse)
 def submit_onboarding(payload: OnboardingSubmitRequest) -> OnboardingSubmitResponse:
     """Submit onboarding data (from front-end form)."""
-    with Session(engine) as session:
+    # bcrypt — до очереди писателя, чтобы не держать его на хэшировании
+    password_hash = hash_password(payload.auth.password)
+
+    def write(session: Session) -> int:
         # --- User registration during onboarding ---
         existing_user = session.exec(select(User).where(User.name == payload.auth.name)).first()
         if existing_user:
@@ -942,7 +1234,7 @@ def submit_onboarding(payload: OnboardingSubmitRequest) -> OnboardingSubmitRespo
 
         new_user = User(
             name=payload.auth.name,
-            password_hash=bcrypt.hash(payload.auth.password[:72]),
+            password_hash=password_hash,
             avatar_id=payload.auth.avatar_id,
             gender=payload.profile.gender,
             age=payload.profile.age,
@@ -950,14 +1242,11 @@ def submit_onboarding(payload: OnboardingSubmitRequest) -> OnboardingSubmitRespo
             start_weight_kg=payload.profile.weight_kg
         )
         session.add(new_user)
-        session.commit()
-        session.refresh(new_user)
+        session.flush()
         user_id = new_user.id
 
-        token = create_access_token({"sub": str(new_user.id)})
-
         # --- Sanitize payload before storing (remove password from auth) ---
-        sanitized_data = payload.dict()
+        sanitized_data = payload.model_dump()
         if sanitized_data.get("auth"):
             sanitized_data["auth"].pop("password", None)
 
@@ -988,8 +1277,6 @@ def submit_onboarding(payload: OnboardingSubmitRequest) -> OnboardingSubmitRespo
             sugar_g=payload.macros.sugar_g,
         )
         session.add(onboarding)
-        session.commit()
-        session.refresh(onboarding)
 
         # --- Create goal ---
         goal = Goal(
@@ -1003,19 +1290,20 @@ def submit_onboarding(payload: OnboardingSubmitRequest) -> OnboardingSubmitRespo
             sugar_g=payload.macros.sugar_g or 0,
         )
         session.add(goal)
-        session.commit()
-        session.refresh(goal)
+        session.flush()
 
         # --- Update user goal linkage ---
         new_user.current_goal_id = goal.id
         new_user.updated_at = datetime.utcnow()
         session.add(new_user)
-        session.commit()
-
-        return OnboardingSubmitResponse(
-            status="ok",
-            token=token,
-            message="Onboarding completed successfully"
-        )
+        return user_id
+
+    user_id = db_writer.run(write)
+    token = create_access_token({"sub": str(user_id)})
+    return OnboardingSubmitResponse(
+        status="ok",
+        token=token,
+        message="Onboarding completed successfully"
+    )
 # init DB on import
 #init_db_with_seed()
\ No newline at end of file
@@ -0,0 +1,307 @@
+# app/api_async.py
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, Query, Request, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .api import build_dashboard, cached_dashboard, dashboard_etag, dashboard_response, weight_list_etag
+from .auth import current_user_id
+from .dashboard_cache import dashboard_cache
+from .db import get_async_engine
+from .etags import etag_headers, not_modified
+from .idempotency import IdempotentRoute
+from .models import MealDraft, MealLog, WaterLog, WeightLog
+from .queries import dashboard_summary, dashboard_version, meal_rows_for_day, user_version, water_rows_for_day
+from .responses import trusted_json
+from .rollups import apply_meal_delta, apply_water_delta, refresh_day_weight
+from .schemas import DashboardResponse
+
+# Асинхронные версии самых частых эндпоинтов (дашборд и логи воды/веса/еды).
+# Подключаются вместо синхронных при ASYNC_DB=true (см. include_routers); запросы
+# не занимают поток threadpool, а ждут базу в event loop через AsyncSession.
+# Пересчёт DailySummary переиспользует синхронные функции из rollups через run_sync.
+router = APIRouter(route_class=IdempotentRoute)
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[AsyncSession]:
+    """Сессия для записи; на SQLite транзакция открывается как BEGIN IMMEDIATE.
+
+    Групповой коммит WriteQueue здесь не используется: конкурентные писатели
+    ждут блокировку через busy_timeout, а IMMEDIATE исключает взаимоблокировку
+    при повышении блокировки с чтения на запись.
+    """
+    engine = get_async_engine().execution_options(sqlite_begin="IMMEDIATE")
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+
+
+def include_routers(app: FastAPI, sync_router: APIRouter) -> None:
+    """Подключает асинхронные маршруты и те синхронные, у которых нет асинхронной версии."""
+    overridden = {(route.path, method) for route in router.routes for method in route.methods}
+    rest = APIRouter()
+    rest.routes = [
+        route for route in sync_router.routes
+        if not any((route.path, method) in overridden for method in getattr(route, "methods", ()))
+    ]
+    app.include_router(router)
+    app.include_router(rest)
+
+
+# ======================================================
+#  Dashboard
+# ======================================================
+
+@router.get("/api/dashboard", response_model=DashboardResponse)
+async def get_dashboard(
+    request: Request,
+    date_: Optional[date] = Query(default=None, alias="date"),
+    user_id: int = Depends(current_user_id),
+) -> Response:
+    """Get nutrition dashboard for a specific date.
+
+    Auth: Requires Bearer JWT in `Authorization` header (e.g., `Authorization: Bearer <token>`).
+
+    Returns an `ETag`; repeat the request with `If-None-Match` to get `304 Not Modified`
+    while nothing for that day, the goal or the profile has changed.
+    """
+    target_date = date_ or date.today()
+    if (cached := cached_dashboard(request, user_id, target_date)) is not None:
+        return cached
+    token = dashboard_cache.token(user_id)
+    async with read_session() as session:
+        stamp = (await session.exec(dashboard_version(user_id, target_date))).first()
+        etag = dashboard_etag(user_id, target_date, stamp)
+        if (unchanged := not_modified(request, etag)) is not None:
+            return unchanged
+        summary = (await session.exec(dashboard_summary(user_id, target_date))).one()
+        meal_rows = (await session.exec(meal_rows_for_day(user_id, target_date))).all()
+        water_rows = (await session.exec(water_rows_for_day(user_id, target_date))).all()
+    dashboard = build_dashboard(target_date, summary, meal_rows, water_rows)
+    return dashboard_response(user_id, target_date, etag, dashboard, token)
+
+
+# ======================================================
+#  Water logging
+# ======================================================
+
+@router.post("/api/water")
+async def add_water_log(
+    ml: int = Body(..., embed=True),
+    drank_at: Optional[datetime] = Body(None, embed=True),
+    user_id: int = Depends(current_user_id)
+) -> Dict[str, Any]:
+    """
+    Add a new water log entry.
+
+    - **ml**: int, required. Amount of water in milliliters.
+    - **drank_at**: datetime, optional. When the water was consumed. Defaults to now.
+
+    Returns: status, id, ml, drank_at.
+    """
+    if ml <= 0:
+        raise HTTPException(status_code=422, detail="ml must be a positive integer")
+    async with write_session() as session:
+        log = WaterLog(user_id=user_id, ml=ml, drank_at=drank_at or datetime.utcnow())
+        session.add(log)
+        await session.run_sync(apply_water_delta, log)
+        await session.flush()
+        await session.commit()
+    return {"status": "ok", "id": log.id, "ml": log.ml, "drank_at": log.drank_at}
+
+
+@router.delete("/api/water/{log_id}")
+async def delete_water_log(
+    log_id: int,
+    user_id: int = Depends(current_user_id)
+) -> Dict[str, Any]:
+    """
+    Delete a water log entry by ID.
+
+    - **log_id**: int, required. WaterLog ID.
+
+    Returns: status, id.
+    """
+    async with write_session() as session:
+        log = await session.get(WaterLog, log_id)
+        if log is None or log.user_id != user_id:
+            return {"status": "not_found", "id": log_id}
+        await session.run_sync(apply_water_delta, log, -1)
+        await session.delete(log)
+        await session.commit()
+    return {"status": "deleted", "id": log_id}
+
+
+# ======================================================
+#  Weight logging
+# ======================================================
+
+@router.post("/api/weight")
+async def add_weight_log(
+    kg: float = Body(..., embed=True),
+    on_date: Optional[date] = Body(None, embed=True),
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Create a new weight entry for the authenticated user.
+
+    Body (JSON):
+      - kg: float, required (> 0)
+      - on_date: date (YYYY-MM-DD), optional. Defaults to today's date.
+
+    Returns: {status, id, kg, on_date}
+    """
+    if kg is None or kg <= 0:
+        raise HTTPException(status_code=422, detail="kg must be a positive number")
+
+    async with write_session() as session:
+        entry = WeightLog(user_id=user_id, on_date=on_date or date.today(), kg=float(kg))
+        session.add(entry)
+        await session.flush()
+        await session.run_sync(refresh_day_weight, user_id, entry.on_date)
+        await session.commit()
+    return {"status": "ok", "id": entry.id, "kg": entry.kg, "on_date": entry.on_date}
+
+
+@router.get("/api/weight")
+async def list_weight_logs(
+    request: Request,
+    date_from: Optional[date] = Query(None, description="Start date (YYYY-MM-DD), inclusive"),
+    date_to: Optional[date] = Query(None, description="End date (YYYY-MM-DD), inclusive"),
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Get all weight entries for the authenticated user.
+    Optional date range filter via query params `date_from` and/or `date_to`.
+
+    Supports `If-None-Match` (returns `304 Not Modified` until a weight entry changes).
+
+    Returns: {status, items:[{id, on_date, kg}, ...]}
+    """
+    stmt = select(WeightLog.id, WeightLog.on_date, WeightLog.kg).where(WeightLog.user_id == user_id)
+    if date_from:
+        stmt = stmt.where(WeightLog.on_date >= date_from)
+    if date_to:
+        stmt = stmt.where(WeightLog.on_date <= date_to)
+    stmt = stmt.order_by(WeightLog.on_date.asc())
+
+    async with read_session() as session:
+        version = (await session.exec(user_version(user_id))).first()
+        etag = weight_list_etag(user_id, version, date_from, date_to)
+        if (cached := not_modified(request, etag)) is not None:
+            return cached
+        rows = (await session.exec(stmt)).all()
+    items = [{"id": w.id, "on_date": w.on_date, "kg": float(w.kg)} for w in rows]
+    return trusted_json({"status": "ok", "items": items}, headers=etag_headers(etag))
+
+
+@router.delete("/api/weight/{weight_id}")
+async def delete_weight_log(
+    weight_id: int,
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Delete a specific weight entry by ID.
+
+    Returns: {status: "deleted" | "not_found", id}
+    """
+    async with write_session() as session:
+        entry = await session.get(WeightLog, weight_id)
+        if entry is None or entry.user_id != user_id:
+            return {"status": "not_found", "id": weight_id}
+        await session.delete(entry)
+        await session.flush()
+        await session.run_sync(refresh_day_weight, user_id, entry.on_date)
+        await session.commit()
+    return {"status": "deleted", "id": weight_id}
+
+
+@router.patch("/api/weight/{weight_id}")
+async def update_weight_log(
+    weight_id: int,
+    kg: Optional[float] = Body(None, embed=True),
+    on_date: Optional[date] = Body(None, embed=True),
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Update a specific weight entry. Supply one or both of the fields.
+
+    Body (JSON):
+      - kg: float (> 0), optional
+      - on_date: date (YYYY-MM-DD), optional
+
+    Returns: {status, id, kg, on_date}
+    """
+    if kg is None and on_date is None:
+        raise HTTPException(status_code=422, detail="Provide at least one of: kg, on_date")
+    if kg is not None and kg <= 0:
+        raise HTTPException(status_code=422, detail="kg must be a positive number")
+
+    async with write_session() as session:
+        entry = await session.get(WeightLog, weight_id)
+        if entry is None or entry.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Weight entry not found")
+
+        old_date = entry.on_date
+        if kg is not None:
+            entry.kg = float(kg)
+        if on_date is not None:
+            entry.on_date = on_date
+
+        session.add(entry)
+        await session.flush()
+        await session.run_sync(refresh_day_weight, user_id, entry.on_date)
+        if old_date != entry.on_date:
+            await session.run_sync(refresh_day_weight, user_id, old_date)
+        await session.commit()
+    return {"status": "ok", "id": entry.id, "kg": entry.kg, "on_date": entry.on_date}
+
+
+# ======================================================
+#  Delete Meal Log
+# ======================================================
+
+@router.delete("/api/meal/{meal_id}")
+async def delete_meal_log(
+    meal_id: int,
+    delete_draft: bool = Query(True, description="Also soft-delete associated draft (set status='deleted'); defaults to true"),
+    user_id: int = Depends(current_user_id),
+) -> Dict[str, Any]:
+    """
+    Delete a MealLog entry by ID.
+
+    - **meal_id**: int, required. MealLog ID.
+    - **delete_draft**: bool, optional (default: True). If True and the meal was created from a draft, mark the draft as 'deleted' too.
+
+    Returns:
+      - status: "deleted" | "not_found"
+      - meal_id
+      - (optional) draft_id, draft_status
+    """
+    async with write_session() as session:
+        meal = await session.get(MealLog, meal_id)
+        if meal is None or meal.user_id != user_id:
+            return {"status": "not_found", "meal_id": meal_id}
+
+        resp: Dict[str, Any] = {"status": "deleted", "meal_id": meal_id}
+        if delete_draft and meal.draft_id:
+            draft = await session.get(MealDraft, meal.draft_id)
+            if draft and draft.user_id == user_id:
+                # soft-delete the draft to avoid FK issues and keep audit trail
+                draft.status = "deleted"
+                session.add(draft)
+                resp.update({"draft_id": draft.id, "draft_status": "deleted"})
+
+        await session.run_sync(apply_meal_delta, meal, -1)
+        await session.delete(meal)
+        await session.commit()
+    return resp
@@ -1,13 +1,70 @@
 # app/auth.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlmodel import Session, select
-import bcrypt
 from .models import User
 from .config import settings
+from .passwords import password_hasher, needs_rehash
+from .metrics import timed
+from .db import db_writer, engine
 
 
+# Shared HTTP Bearer auth dependency (used by multiple endpoints)
+security = HTTPBearer()
+
+
+# ======================================================
+#  Keys
+# ======================================================
+
+def _is_asymmetric(algorithm: str) -> bool:
+    return algorithm[:2] in ("RS", "ES", "PS")
+
+
+@lru_cache(maxsize=1)
+def _signing_key() -> str:
+    """HS* — SECRET_KEY; RS*/ES*/PS* — приватный ключ PEM из JWT_PRIVATE_KEY_PATH (читается один раз)."""
+    if not _is_asymmetric(settings.ALGORITHM):
+        return settings.SECRET_KEY
+    if not settings.JWT_PRIVATE_KEY_PATH:
+        raise RuntimeError(f"JWT_PRIVATE_KEY_PATH is required for ALGORITHM={settings.ALGORITHM}")
+    with open(settings.JWT_PRIVATE_KEY_PATH) as f:
+        return f.read()
+
+
+@lru_cache(maxsize=1)
+def _verification_key() -> str:
+    if not _is_asymmetric(settings.ALGORITHM):
+        return settings.SECRET_KEY
+    if not settings.JWT_PUBLIC_KEY_PATH:
+        raise RuntimeError(f"JWT_PUBLIC_KEY_PATH is required for ALGORITHM={settings.ALGORITHM}")
+    with open(settings.JWT_PUBLIC_KEY_PATH) as f:
+        return f.read()
+
+
+def load_jwt_keys() -> None:
+    """Загружает ключи при старте, чтобы ошибка конфигурации проявилась сразу, а не на первом запросе."""
+    _verification_key()
+    try:
+        _signing_key()
+    except RuntimeError:
+        # узел может только проверять токены (есть публичный ключ, нет приватного)
+        if not _is_asymmetric(settings.ALGORITHM):
+            raise
+
+
+# ======================================================
+#  Tokens
+# ======================================================
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """Создаёт JWT access token."""
@@ -16,28 +73,105 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
         expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return jwt.encode(to_encode, _signing_key(), algorithm=settings.ALGORITHM)
 
 def decode_access_token(token: str) -> dict | None:
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        return jwt.decode(token, _verification_key(), algorithms=[settings.ALGORITHM])
     except Exception:
         return None
 
-def hash_password(password: str) -> str:
-    """Хэширует пароль с усечением до 72 байт (ограничение bcrypt)."""
-    return bcrypt.hashpw(password[:72].encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """Проверяет пароль с учётом ограничения 72 байт для bcrypt."""
+class VerifiedTokenCache:
+    """Ограниченный LRU-кэш проверенных токенов: sha256(token) -> (user_id, exp).
+
+    Запись живёт до `exp` самого токена, поэтому кэш не продлевает срок действия.
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[bytes, tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> int | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            user_id, exp = item
+            if exp <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return user_id
+
+    def put(self, key: bytes, user_id: int, exp: float) -> None:
+        with self._lock:
+            self._items[key] = (user_id, exp)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+_token_cache = VerifiedTokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+
+def user_id_from_token(token: str) -> int | None:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    user_id = _token_cache.get(key)
+    if user_id is not None:
+        return user_id
+
+    payload = decode_access_token(token)
     try:
-        return bcrypt.checkpw(password[:72].encode("utf-8"), password_hash.encode("utf-8"))
+        user_id = int(payload["sub"])
     except Exception:
-        return False
+        return None
+    if isinstance(payload.get("exp"), (int, float)):
+        _token_cache.put(key, user_id, float(payload["exp"]))
+    return user_id
+
+
+async def current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
+    """FastAPI dependency: user_id из Bearer JWT (401, если токен невалиден или истёк)."""
+    with timed("auth"):
+        user_id = user_id_from_token(credentials.credentials)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return user_id
 
-def verify_user_credentials(session: Session, username: str, password: str):
-    """Возвращает пользователя при корректной паре (логин/пароль), иначе None."""
-    user = session.exec(select(User).where(User.name == username)).first()
+def hash_password(password: str) -> str:
+    """Хэширует пароль с усечением до 72 байт (ограничение bcrypt) в пуле процессов (429 при перегрузке)."""
+    with timed("bcrypt"):
+        return password_hasher.hash(password)
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Проверяет пароль с учётом ограничения 72 байт для bcrypt в пуле процессов (429 при перегрузке)."""
+    with timed("bcrypt"):
+        return password_hasher.verify(password, password_hash)
+
+def verify_user_credentials(username: str, password: str) -> Optional[User]:
+    """Возвращает пользователя при корректной паре (логин/пароль), иначе None.
+
+    Если хэш создан с другим BCRYPT_ROUNDS, пароль прозрачно перехэшируется.
+    Читающая сессия закрывается до bcrypt и до записи: без WAL её SHARED-блокировка
+    не дала бы писателю (db_writer) закоммитить новый хэш.
+    """
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.name == username)).first()
     if not user:
         return None
-    return user if verify_password(password, user.password_hash) else None
\ No newline at end of file
+    if not verify_password(password, user.password_hash):
+        return None
+    if needs_rehash(user.password_hash):
+        password_hash = hash_password(password)
+
+        def write(session: Session) -> None:
+            stored = session.get(User, user.id)
+            if stored is not None:
+                stored.password_hash = password_hash
+                session.add(stored)
+
+        db_writer.run(write)
+        user.password_hash = password_hash
+    return user
@@ -0,0 +1,123 @@
+# app/cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TwoTierCache:
+    """Кэш JSON-значений: LRU в памяти процесса + персистентный SQLite-файл.
+
+    - TTL применяется к обоим уровням (по времени записи).
+    - Дисковый уровень вытесняет давно не читанные записи, когда суммарный размер
+      превышает `max_bytes`. Размер ведётся счётчиком в памяти, а не SUM по таблице
+      на каждую запись; раз в `PURGE_EVERY_PUTS` записей удаляются просроченные строки
+      и счётчик пересчитывается (заодно учитывая записи других процессов).
+    """
+
+    PURGE_EVERY_PUTS = 256
+
+    def __init__(self, path: str, memory_items: int = 256, ttl_seconds: float = 30 * 24 * 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.memory_items = memory_items
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._total = 0  # суммарный size строк на диске
+        self._puts = 0
+
+    # --- disk tier ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)")
+            self._purge(self._conn, time.time())
+        return self._conn
+
+    def _purge(self, db: sqlite3.Connection, now: float) -> None:
+        """Удаляет просроченные строки и пересчитывает суммарный размер."""
+        db.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY_PUTS == 0:
+            self._purge(db, now)
+        if self._total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+            victims.append((key,))
+            freed += size
+            if self._total - freed <= self.max_bytes:
+                break
+        db.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self._total -= freed
+
+    # --- public API ---
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                created_at, value = hit
+                if now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            db = self._db()
+            row = db.execute("SELECT value, created_at, size FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value_json, created_at, size = row
+            if now - created_at >= self.ttl_seconds:
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._total -= size
+                return None
+            db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            value = json.loads(value_json)
+            self._remember(key, created_at, value)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        value_json = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, value)
+            db = self._db()
+            size = len(value_json.encode("utf-8"))
+            old = db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value_json, size, now, now),
+            )
+            self._total += size - (old[0] if old else 0)
+            self._evict(db, now)
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,151 @@
+# app/changes.py
+"""Журнал изменений для дельта-синхронизации (GET /api/sync?since=<cursor>).
+
+Каждое изменение MealLog/WaterLog/WeightLog/Goal через ORM записывается в ChangeLog
+в той же транзакции (событие after_flush), включая удаления — они становятся
+tombstone-записями. Пакетные вставки мимо ORM (sync.py) пишут журнал сами через
+`record_changes`.
+
+Курсор — ChangeLog.id. На SQLite записи идут через одного писателя, поэтому id
+фиксируются строго по порядку; на PostgreSQL параллельные транзакции могут
+закоммитить id не по порядку, и клиенту стоит начинать следующую синхронизацию
+с небольшим запасом (повторно полученные строки безопасны — это upsert).
+
+Журнал хранится CHANGELOG_RETENTION_SECONDS (`purge_changes`, не чаще раза в
+CHANGELOG_PURGE_INTERVAL_SECONDS из обычной записи). Перед удалением последняя
+запись каждой живой строки переписывается свежей, поэтому полная синхронизация
+(since=0) по-прежнему возвращает все данные — ценой того, что строки старше срока
+хранения раз в этот срок приходят клиентам повторно. Удалённые tombstone-записи
+не вернуть, поэтому самый старый поддерживаемый курсор — id первой оставшейся
+записи журнала минус 1 (`oldest_cursor`); с курсором старше `changes_since`
+отвечает полной выгрузкой с `reset=True`.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from sqlalchemy import delete, event, exists, func, literal
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, SQLModel, select
+
+from .config import settings
+from .models import ChangeLog, Goal, MealLog, WaterLog, WeightLog
+
+
+TRACKED: Dict[Type[SQLModel], str] = {MealLog: "meal", WaterLog: "water", WeightLog: "weight", Goal: "goal"}
+MODELS: Dict[str, Type[SQLModel]] = {entity: model for model, entity in TRACKED.items()}
+
+
+def record_changes(session: Session, user_id: int, entity: str, entity_ids: Iterable[int], op: str = "upsert") -> None:
+    rows = [
+        {"user_id": user_id, "entity": entity, "entity_id": entity_id, "op": op, "changed_at": datetime.utcnow()}
+        for entity_id in entity_ids
+    ]
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _log_changes(session: OrmSession, flush_context: Any) -> None:
+    now = datetime.utcnow()
+    rows: List[Dict[str, Any]] = []
+    for objects, op in ((session.new, "upsert"), (session.dirty, "upsert"), (session.deleted, "delete")):
+        for obj in objects:
+            entity = TRACKED.get(type(obj))
+            if entity is None or obj.id is None:
+                continue
+            if op == "upsert" and obj in session.dirty and not session.is_modified(obj):
+                continue
+            rows.append({"user_id": obj.user_id, "entity": entity, "entity_id": obj.id, "op": op, "changed_at": now})
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+        _maybe_purge(session.connection(), now)
+
+
+# ======================================================
+#  Retention
+# ======================================================
+
+_last_purge = 0.0
+
+
+def _maybe_purge(connection: Connection, now: datetime) -> None:
+    global _last_purge
+    if time.monotonic() - _last_purge < settings.CHANGELOG_PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = time.monotonic()
+    purge_changes(connection, now)
+
+
+def purge_changes(connection: Connection, now: datetime) -> None:
+    """Удаляет записи журнала старше CHANGELOG_RETENTION_SECONDS (кроме самой новой записи).
+
+    Последняя запись живой строки перед этим дублируется с текущим временем, чтобы
+    since=0 её не потерял; устаревшие tombstone-записи удаляются насовсем.
+    """
+    table = ChangeLog.__table__
+    newer = table.alias("newer")
+    cutoff = now - timedelta(seconds=settings.CHANGELOG_RETENTION_SECONDS)
+    latest_alive = (
+        select(table.c.user_id, table.c.entity, table.c.entity_id, literal("upsert"), literal(now, table.c.changed_at.type))
+        .where(table.c.changed_at < cutoff)
+        .where(table.c.op == "upsert")
+        .where(~exists().where(newer.c.entity == table.c.entity)
+               .where(newer.c.entity_id == table.c.entity_id)
+               .where(newer.c.id > table.c.id))
+    )
+    connection.execute(table.insert().from_select(["user_id", "entity", "entity_id", "op", "changed_at"], latest_alive))
+    newest = select(func.max(table.c.id)).scalar_subquery()
+    connection.execute(delete(table).where(table.c.changed_at < cutoff).where(table.c.id < newest))
+
+
+def oldest_cursor(session: Session) -> int:
+    """Самый старый курсор, с которого дельта ещё полная (более ранние tombstone-записи удалены)."""
+    first = session.exec(select(func.min(ChangeLog.id))).one()
+    return first - 1 if first is not None else 0
+
+
+# ======================================================
+#  Delta
+# ======================================================
+
+def changes_since(session: Session, user_id: int, since: int, limit: int) -> Dict[str, Any]:
+    """Последнее состояние каждой строки, изменённой после курсора `since` (не больше `limit` строк).
+
+    Курсор старше `oldest_cursor` мог пропустить удаления: вместо дельты отдаётся первая
+    страница полной синхронизации (since=0) с `reset=True` — клиент сбрасывает локальную копию.
+    """
+    reset = 0 < since < oldest_cursor(session)
+    if reset:
+        since = 0
+    latest = (
+        select(ChangeLog.entity, ChangeLog.entity_id, func.max(ChangeLog.id).label("seq"))
+        .where(ChangeLog.user_id == user_id)
+        .where(ChangeLog.id > since)
+        .group_by(ChangeLog.entity, ChangeLog.entity_id)
+        .order_by(func.max(ChangeLog.id))
+        .limit(limit)
+    )
+    changed = session.exec(latest).all()
+
+    ids_by_entity: Dict[str, List[int]] = {}
+    for row in changed:
+        ids_by_entity.setdefault(row.entity, []).append(row.entity_id)
+
+    upserts: Dict[str, List[Any]] = {entity: [] for entity in MODELS}
+    deleted: Dict[str, List[int]] = {entity: [] for entity in MODELS}
+    for entity, ids in ids_by_entity.items():
+        model = MODELS[entity]
+        alive = {
+            obj.id: obj
+            for obj in session.exec(select(model).where(model.user_id == user_id).where(model.id.in_(ids)))
+        }
+        for entity_id in ids:
+            if entity_id in alive:
+                upserts[entity].append(alive[entity_id])
+            else:
+                deleted[entity].append(entity_id)
+
+    cursor: Optional[int] = changed[-1].seq if changed else since
+    return {"cursor": cursor, "has_more": len(changed) == limit, "reset": reset, "upserts": upserts, "deleted": deleted}
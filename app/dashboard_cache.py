@@ -0,0 +1,153 @@
+# app/dashboard_cache.py
+"""Кэш готовых ответов GET /api/dashboard по ключу (user_id, день).
+
+Хранится сериализованный JSON вместе с ETag, так что попадание (и 304 по
+If-None-Match) не обращается к базе совсем — прошлые дни почти не меняются и
+после первого просмотра отдаются из памяти.
+
+Инвалидация write-through: rollups отмечают затронутые ключи в session.info
+(`mark_dirty`), а после коммита транзакции они удаляются из кэша. Изменение
+профиля, цели или веса сбрасывает все дни пользователя. Чтобы читатель,
+начавший запрос до коммита, не положил в кэш устаревший ответ, `put` принимает
+токен поколения пользователя, полученный до чтения, и игнорирует запись, если
+с тех пор была инвалидация.
+
+Кэш живёт в памяти процесса: при нескольких воркерах инвалидация доходит только
+до процесса-писателя, поэтому TTL ограничивает возможное устаревание.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from .config import settings
+from .metrics import register_collector
+
+
+Key = Tuple[int, date]
+ALL_DAYS = None  # mark_dirty(session, user_id) — сбросить все дни пользователя
+
+_INFO_KEY = "dashboard_cache_dirty"
+
+
+class DashboardCache:
+    """Ограниченный LRU: (user_id, day) -> (created_at, etag, json-байты), плюс счётчики попаданий."""
+
+    def __init__(self, max_items: int, ttl_seconds: float):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[Key, Tuple[float, str, bytes]]" = OrderedDict()
+        self._days: Dict[int, Set[date]] = {}
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    def token(self, user_id: int) -> int:
+        """Поколение пользователя; взять до чтения из базы и передать в put."""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id: int, day: date) -> Optional[Tuple[str, bytes]]:
+        key = (user_id, day)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and time.monotonic() - item[0] >= self.ttl_seconds:
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1], item[2]
+
+    def put(self, user_id: int, day: date, etag: str, body: bytes, token: int) -> None:
+        if not self.enabled:
+            return
+        key = (user_id, day)
+        with self._lock:
+            if self._generations.get(user_id, 0) != token:
+                return  # между чтением и записью в кэш данные изменились
+            self._items[key] = (time.monotonic(), etag, body)
+            self._items.move_to_end(key)
+            self._days.setdefault(user_id, set()).add(day)
+            while len(self._items) > self.max_items:
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def invalidate(self, user_id: int, days: Optional[Set[date]] = ALL_DAYS) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            cached = self._days.get(user_id, set())
+            for day in list(cached if days is ALL_DAYS else cached & days):
+                self._drop((user_id, day))
+                self.invalidations += 1
+
+    def _drop(self, key: Key) -> None:
+        del self._items[key]
+        user_days = self._days.get(key[0])
+        if user_days is not None:
+            user_days.discard(key[1])
+            if not user_days:
+                del self._days[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "items": len(self._items),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+dashboard_cache = DashboardCache(
+    settings.DASHBOARD_CACHE_ITEMS if settings.DASHBOARD_CACHE_ENABLED else 0,
+    settings.DASHBOARD_CACHE_TTL_SECONDS,
+)
+
+
+def _cache_metrics() -> List[str]:
+    stats = dashboard_cache.stats()
+    lines = ["# TYPE app_dashboard_cache_items gauge", f"app_dashboard_cache_items {stats['items']}"]
+    for name in ("hits", "misses", "evictions", "invalidations"):
+        lines += [f"# TYPE app_dashboard_cache_{name}_total counter", f"app_dashboard_cache_{name}_total {stats[name]}"]
+    return lines
+
+
+register_collector(_cache_metrics)
+
+
+# ======================================================
+#  Write-through invalidation
+# ======================================================
+
+def mark_dirty(session: OrmSession, user_id: int, day: Optional[date] = ALL_DAYS) -> None:
+    """Отмечает ключи, которые нужно сбросить после коммита транзакции `session`."""
+    dirty: Dict[int, Optional[Set[date]]] = session.info.setdefault(_INFO_KEY, {})
+    if day is ALL_DAYS or dirty.get(user_id, set()) is ALL_DAYS:
+        dirty[user_id] = ALL_DAYS
+    else:
+        dirty.setdefault(user_id, set()).add(day)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_committed(session: OrmSession) -> None:
+    # отметки откаченных SAVEPOINT (задачи WriteQueue) не снимаются: лишняя инвалидация безопасна
+    for user_id, days in session.info.pop(_INFO_KEY, {}).items():
+        dashboard_cache.invalidate(user_id, days)
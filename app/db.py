@@ -0,0 +1,123 @@
+# app/db.py
+import os
+from functools import lru_cache
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import create_engine
+
+from .config import settings
+from .writer import WriteQueue
+
+
+def _sqlite_pragmas() -> list[str]:
+    if not settings.SQLITE_TUNED:
+        return []
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",  # отрицательное значение — в KiB
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+    ]
+
+
+def _configure_sqlite(engine: Engine) -> None:
+    """PRAGMA на каждое соединение и явный BEGIN вместо неявного от pysqlite.
+
+    pysqlite сам решает, когда открыть транзакцию, и ломает SAVEPOINT, на которых
+    построен групповой коммит; поэтому транзакции начинает SQLAlchemy. Писатель
+    открывает их как BEGIN IMMEDIATE (execution option `sqlite_begin`), чтобы
+    блокировка записи бралась сразу, а не при первом INSERT.
+    """
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(connection):
+        connection.exec_driver_sql(f"BEGIN {connection.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+
+def make_engine(url: str, create: Callable = create_engine):
+    """Создаёт engine по DATABASE_URL с настройками пула из Settings.
+
+    - PostgreSQL: QueuePool с DB_POOL_SIZE/DB_MAX_OVERFLOW, pre-ping и recycle,
+      чтобы несколько воркеров gunicorn/uvicorn делили одну базу.
+    - SQLite: файл базы создаётся в существующей папке, на каждое соединение
+      ставятся PRAGMA (WAL, synchronous, mmap, cache, busy_timeout — SQLITE_*);
+      in-memory база живёт в одном соединении (StaticPool), общем для всех потоков.
+
+    `create` — create_engine или create_async_engine (см. `get_async_engine`).
+    """
+    parsed = make_url(url)
+    kwargs = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+
+    if parsed.get_backend_name() == "sqlite":
+        database = parsed.database or ""
+        # сессии создаются в потоках threadpool, соединение может перейти между ними
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if database and database != ":memory:":
+            os.makedirs(os.path.dirname(database) or ".", exist_ok=True)
+        else:
+            # одно соединение на весь процесс: иначе поток писателя (db_writer) получил бы
+            # свою, пустую in-memory базу, а запросы читали бы другую
+            engine = create(url, poolclass=StaticPool, **kwargs)
+            _configure_sqlite(getattr(engine, "sync_engine", engine))
+            return engine
+
+    engine = create(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        **kwargs,
+    )
+    if parsed.get_backend_name() == "sqlite":
+        _configure_sqlite(getattr(engine, "sync_engine", engine))
+    return engine
+
+
+# Асинхронные драйверы для того же DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()!r}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+@lru_cache(maxsize=1)
+def get_async_engine() -> AsyncEngine:
+    """AsyncEngine для асинхронного роутера (ASYNC_DB); создаётся при первом обращении."""
+    return make_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL), create=create_async_engine)
+
+
+async def close_async_engine() -> None:
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+        get_async_engine.cache_clear()
+
+
+engine = make_engine(settings.DATABASE_URL)
+
+# Записи из эндпоинтов: на SQLite — один писатель с групповыми коммитами, иначе — напрямую
+db_writer = WriteQueue(
+    engine,
+    max_batch=settings.DB_WRITE_BATCH_SIZE,
+    window_ms=settings.DB_WRITE_BATCH_WINDOW_MS,
+    enabled=settings.DB_WRITE_QUEUE and engine.dialect.name == "sqlite",
+)
@@ -0,0 +1,43 @@
+# app/etags.py
+import hashlib
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+
+# Меняется вместе с форматом ответов, чтобы старые ETag не совпали с новым представлением
+ETAG_SCHEMA_VERSION = "1"
+
+CACHE_CONTROL = "private, no-cache"  # клиент хранит ответ, но каждый раз сверяет ETag
+
+
+def make_etag(*parts: object) -> str:
+    """Сильный ETag из версий данных (и параметров запроса, от которых зависит ответ)."""
+    raw = ":".join(str(p) for p in (ETAG_SCHEMA_VERSION, *parts))
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match сравнивается слабо (RFC 9110): W/-префикс не учитывается."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 без тела, если у клиента уже актуальная версия; иначе None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return None
+
+
+def etag_response(etag: str, body: bytes) -> Response:
+    """Готовое JSON-тело с ETag (для ответов, сериализованных заранее или взятых из кэша)."""
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
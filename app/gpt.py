@@ -0,0 +1,362 @@
+# app/gpt.py
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+import httpx
+from fastapi import HTTPException, Request, UploadFile
+from openai import AsyncOpenAI, APIError, APITimeoutError
+from pydantic import ValidationError
+
+from .cache import TwoTierCache
+from .config import settings
+from .images import ImagePart, preprocess_images, read_images
+from .metrics import timed
+from .schemas import MealAnalysisResult
+
+
+T = TypeVar("T")
+
+MEAL_ANALYSIS_SYSTEM_PROMPT = (
+    "I will send optionally one or more photos of food, a text description (e.g., “chicken cutlets with rice and tzatziki”).\n"
+    "Based on this, return the meal analysis with all the nutritional and contextual data filled out as consistently as possible.\n"
+    "Additional Instructions: If no weight is mentioned, estimate based on typical meal appearance. Prefer accuracy over completeness — return null if uncertain. Round macros to integers; round weight to nearest 5g or 0.1oz; estimate satiety_hours by macro balance. List ingredients_detected as plain ingredient names."
+)
+# Формат ответа задаёт JSON Schema (structured output), а не текст промпта
+MEAL_ANALYSIS_SCHEMA: Dict[str, Any] = MealAnalysisResult.model_json_schema()
+MEAL_ANALYSIS_TEXT_FORMAT: Dict[str, Any] = {
+    "format": {"type": "json_schema", "name": "meal_analysis", "schema": MEAL_ANALYSIS_SCHEMA, "strict": True},
+}
+# Меняется вместе с промптом и схемой — старые записи кэша перестают совпадать
+MEAL_ANALYSIS_PROMPT_VERSION = hashlib.sha256(
+    (MEAL_ANALYSIS_SYSTEM_PROMPT + json.dumps(MEAL_ANALYSIS_SCHEMA, sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
+
+
+# ======================================================
+#  Shared client
+# ======================================================
+
+_client: Optional[AsyncOpenAI] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Один AsyncOpenAI на процесс: общий пул HTTP-соединений вместо клиента на каждый запрос."""
+    global _client
+    if _client is None:
+        if not settings.OPENAI_API_KEY:
+            raise HTTPException(status_code=500, detail="Missing OPENAI_API_KEY in environment")
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            ),
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+@asynccontextmanager
+async def _model_slot() -> AsyncIterator[None]:
+    """Слот для вызова модели: ждёт семафор не дольше OPENAI_QUEUE_TIMEOUT_SECONDS (иначе 503)
+    и переводит ошибки OpenAI в HTTP-статусы (таймаут — 504, прочее — 502)."""
+    semaphore = _get_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.OPENAI_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Meal analysis is busy, please retry")
+    try:
+        with timed("openai"):
+            yield
+    except APITimeoutError:
+        raise HTTPException(status_code=504, detail="Meal analysis timed out")
+    except APIError as e:
+        raise HTTPException(status_code=502, detail=f"Meal analysis failed: {e.__class__.__name__}")
+    finally:
+        semaphore.release()
+
+
+async def close_openai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+# ======================================================
+#  Cancellation on client disconnect
+# ======================================================
+
+async def run_until_disconnected(request: Request, coro: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """Выполняет `coro`, отменяя его, если клиент закрыл соединение (ответ 499)."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# ======================================================
+#  Usage
+# ======================================================
+
+class GptUsage(NamedTuple):
+    """Расход одного вызова модели (пишется в MealDraft и в DailyGptUsage)."""
+    model: str
+    input_tokens: int
+    output_tokens: int
+    image_count: int
+    image_bytes: int  # размер изображений после уменьшения, как они ушли в модель
+    latency_ms: int
+
+
+class InvalidMealAnalysis(HTTPException):
+    """Ответ модели не прошёл валидацию по MealAnalysisResult (502); расход вызова сохраняется для учёта."""
+
+    def __init__(self, usage: Optional[GptUsage] = None):
+        super().__init__(status_code=502, detail="Meal analysis returned malformed data")
+        self.usage = usage
+
+
+def usage_from_response(response: Any, image_parts: List[ImagePart], started: float) -> GptUsage:
+    usage = getattr(response, "usage", None)
+    return GptUsage(
+        model=getattr(response, "model", None) or settings.OPENAI_MODEL,
+        input_tokens=getattr(usage, "input_tokens", 0) or 0,
+        output_tokens=getattr(usage, "output_tokens", 0) or 0,
+        image_count=len(image_parts),
+        image_bytes=sum(len(b) for _, b in image_parts),
+        latency_ms=int((time.perf_counter() - started) * 1000),
+    )
+
+
+# ======================================================
+#  Meal analysis
+# ======================================================
+
+def build_input_content(image_parts: List[ImagePart], text_description: Optional[str]) -> List[Dict[str, Any]]:
+    """Конвертирует изображения в data URL (`data:<mime>;base64,...`) и добавляет текст."""
+    input_content: List[Dict[str, Any]] = []
+    for content_type, file_bytes in image_parts:
+        b64 = base64.b64encode(file_bytes).decode("utf-8")
+        input_content.append({
+            "type": "input_image",
+            "image_url": f"data:{content_type};base64,{b64}",
+        })
+
+    if text_description:
+        input_content.append({"type": "input_text", "text": text_description})
+
+    if not input_content:
+        raise HTTPException(status_code=400, detail="No image or text provided for GPT analysis")
+    return input_content
+
+
+async def call_gpt_for_meal_analysis(image_parts: List[ImagePart], text_description: Optional[str]) -> Tuple[Dict[str, Any], GptUsage]:
+    """Отправляет изображения и/или текст в OpenAI Responses API и возвращает структурированный анализ блюда
+    вместе с расходом вызова (токены из `response.usage`, число изображений, задержка, модель).
+
+    Не держит поток из пула: вызов асинхронный, число одновременных вызовов ограничено
+    семафором (OPENAI_MAX_CONCURRENCY), ожидание слота — OPENAI_QUEUE_TIMEOUT_SECONDS (иначе 503),
+    сам вызов — OPENAI_TIMEOUT_SECONDS (иначе 504).
+    """
+    client = get_openai_client()
+    async with _model_slot():
+        started = time.perf_counter()  # без ожидания слота
+        response = await client.responses.create(
+            model=settings.OPENAI_MODEL,
+            input=_meal_analysis_input(image_parts, text_description),
+            text=MEAL_ANALYSIS_TEXT_FORMAT,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+        )
+    usage = usage_from_response(response, image_parts, started)
+    return parse_meal_analysis(response.output_text, usage), usage
+
+
+async def stream_gpt_for_meal_analysis(
+    image_parts: List[ImagePart],
+    text_description: Optional[str],
+    on_usage: Optional[Callable[[GptUsage], None]] = None,
+) -> AsyncIterator[str]:
+    """То же, что call_gpt_for_meal_analysis, но отдаёт текст ответа кусками по мере генерации;
+    расход вызова передаётся в `on_usage` по событию response.completed."""
+    client = get_openai_client()
+    async with _model_slot():
+        started = time.perf_counter()
+        stream = await client.responses.create(
+            model=settings.OPENAI_MODEL,
+            input=_meal_analysis_input(image_parts, text_description),
+            text=MEAL_ANALYSIS_TEXT_FORMAT,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            stream=True,
+        )
+        try:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.completed" and on_usage is not None:
+                    on_usage(usage_from_response(event.response, image_parts, started))
+        finally:
+            await stream.close()
+
+
+def _meal_analysis_input(image_parts: List[ImagePart], text_description: Optional[str]) -> List[Dict[str, Any]]:
+    return [
+        {"role": "system", "content": MEAL_ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": build_input_content(image_parts, text_description)},
+    ]
+
+
+def parse_meal_analysis(out_text: str, usage: Optional[GptUsage] = None) -> Dict[str, Any]:
+    """Разбор и валидация ответа модели за один проход pydantic-core; невалидный ответ (в т.ч. пустой
+    или отказ модели) — InvalidMealAnalysis, в БД и кэш он не попадает."""
+    try:
+        return MealAnalysisResult.model_validate_json(out_text or "").model_dump()
+    except ValidationError:
+        raise InvalidMealAnalysis(usage)
+
+
+# ======================================================
+#  Cached analysis
+# ======================================================
+
+_cache: Optional[TwoTierCache] = None
+
+
+def get_meal_analysis_cache() -> TwoTierCache:
+    global _cache
+    if _cache is None:
+        _cache = TwoTierCache(
+            path=settings.GPT_CACHE_PATH,
+            memory_items=settings.GPT_CACHE_MEMORY_ITEMS,
+            ttl_seconds=settings.GPT_CACHE_TTL_SECONDS,
+            max_bytes=settings.GPT_CACHE_MAX_BYTES,
+        )
+    return _cache
+
+
+class MealAnalysis(NamedTuple):
+    result: Dict[str, Any]
+    cache_hit: bool
+    image_bytes_in: int = 0    # размер загруженных изображений
+    image_bytes_sent: int = 0  # размер после уменьшения/перекодирования (0 при попадании в кэш)
+    usage: Optional[GptUsage] = None  # None при попадании в кэш
+
+    @property
+    def image_bytes_saved(self) -> int:
+        # файл с метаданными перекодируется даже когда это не уменьшает его — экономия не уходит в минус
+        return max(0, self.image_bytes_in - self.image_bytes_sent) if self.image_bytes_sent else 0
+
+
+def meal_analysis_cache_key(image_parts: List[ImagePart], text_description: Optional[str]) -> str:
+    """sha256 от нормализованного текста, исходных байтов изображений, модели, версии промпта
+    и настроек предобработки изображений."""
+    h = hashlib.sha256()
+    image_opts = f"{settings.IMAGE_MAX_EDGE_PX}:{settings.IMAGE_FORMAT}:{settings.IMAGE_QUALITY}"
+    for part in (settings.OPENAI_MODEL, MEAL_ANALYSIS_PROMPT_VERSION, image_opts):
+        h.update(part.encode("utf-8") + b"\0")
+    text = re.sub(r"\s+", " ", (text_description or "").strip().lower())
+    h.update(text.encode("utf-8") + b"\0")
+    for _, file_bytes in image_parts:
+        h.update(hashlib.sha256(file_bytes).digest())
+    return h.hexdigest()
+
+
+class MealRequest(NamedTuple):
+    image_parts: List[ImagePart]
+    text_description: Optional[str]
+    cache_key: str
+    image_bytes_in: int = 0  # размер загрузок до уменьшения
+    prepared: bool = False   # image_parts уже прошли preprocess_images
+
+    @property
+    def image_bytes_saved(self) -> int:
+        return max(0, self.image_bytes_in - sum(len(b) for _, b in self.image_parts)) if self.prepared else 0
+
+
+async def read_meal_request(images: Optional[List[UploadFile]], text_description: Optional[str]) -> MealRequest:
+    """Читает загрузки (с лимитами) и считает ключ кэша — всё, что нужно сделать до ответа клиенту."""
+    image_parts = await read_images(images)
+    if not image_parts and not text_description:
+        raise HTTPException(status_code=400, detail="No image or text provided for GPT analysis")
+    return MealRequest(image_parts, text_description, meal_analysis_cache_key(image_parts, text_description),
+                       sum(len(b) for _, b in image_parts))
+
+
+async def prepare_meal_request(req: MealRequest) -> MealRequest:
+    """Уменьшает изображения заранее — фоновой очереди достаются только уменьшенные байты, а не загрузки."""
+    if req.prepared:
+        return req
+    return req._replace(image_parts=await _prepared_images(req), prepared=True)
+
+
+async def _prepared_images(req: MealRequest) -> List[ImagePart]:
+    if req.prepared:
+        return req.image_parts
+    # Декодирование/ресайз — CPU-работа, не блокируем event loop
+    return await asyncio.to_thread(preprocess_images, req.image_parts)
+
+
+async def lookup_meal_analysis(req: MealRequest) -> Optional[MealAnalysis]:
+    if not settings.GPT_CACHE_ENABLED:
+        return None
+    cached = await asyncio.to_thread(get_meal_analysis_cache().get, req.cache_key)
+    if cached is None:
+        return None
+    return MealAnalysis(cached, True, req.image_bytes_in)
+
+
+async def run_meal_analysis(req: MealRequest) -> MealAnalysis:
+    """Уменьшение изображений -> GPT -> запись в кэш (без проверки кэша)."""
+    prepared = await _prepared_images(req)
+    bytes_sent = sum(len(b) for _, b in prepared)
+
+    result, usage = await call_gpt_for_meal_analysis(prepared, req.text_description)
+    await remember_meal_analysis(req, result)
+    return MealAnalysis(result, False, req.image_bytes_in, bytes_sent, usage)
+
+
+async def stream_meal_analysis(req: MealRequest, on_usage: Optional[Callable[[GptUsage], None]] = None) -> AsyncIterator[str]:
+    """Потоковый вариант run_meal_analysis: уменьшение изображений -> GPT (stream=True).
+    Результат в кэш кладёт вызывающий код (remember_meal_analysis) после сборки объекта."""
+    prepared = await _prepared_images(req)
+    async for delta in stream_gpt_for_meal_analysis(prepared, req.text_description, on_usage):
+        yield delta
+
+
+async def remember_meal_analysis(req: MealRequest, result: Dict[str, Any]) -> None:
+    if settings.GPT_CACHE_ENABLED:
+        await asyncio.to_thread(get_meal_analysis_cache().put, req.cache_key, result)
+
+
+def close_meal_analysis_cache() -> None:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
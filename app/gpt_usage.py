@@ -0,0 +1,144 @@
+# app/gpt_usage.py
+"""Учёт расхода GPT: поля MealDraft, дневной rollup DailyGptUsage и лимиты на пользователя.
+
+Расход пишется в той же транзакции, что и результат драфта (`record_draft_usage`).
+Лимиты GPT_USER_DAILY_* проверяются по строке DailyGptUsage за сегодня до вызова
+модели (`check_gpt_budget`); ответы из кэша бесплатны и не ограничиваются.
+Проверка не резервирует вызов, поэтому параллельные анализы одного пользователя
+могут превысить лимит не больше чем на число вызовов в полёте.
+"""
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from .config import settings
+from .gpt import GptUsage, MealAnalysis
+from .metrics import register_collector
+from .models import DailyGptUsage, MealDraft
+
+
+def gpt_cost_usd(usage: GptUsage) -> float:
+    return (
+        usage.input_tokens * settings.OPENAI_INPUT_USD_PER_1M_TOKENS
+        + usage.output_tokens * settings.OPENAI_OUTPUT_USD_PER_1M_TOKENS
+    ) / 1_000_000
+
+
+# ======================================================
+#  Recording
+# ======================================================
+
+def _upsert(session: Session, user_id: int, day: date, deltas: Dict[str, float]) -> None:
+    """INSERT ... ON CONFLICT (user_id, day) DO UPDATE: суммирует `deltas`."""
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    table = DailyGptUsage.__table__
+    stmt = insert(table).values(user_id=user_id, day=day, **deltas)
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+    session.execute(stmt.on_conflict_do_update(index_elements=["user_id", "day"], set_=set_))
+
+
+def record_usage(session: Session, user_id: int, usage: GptUsage) -> None:
+    """Добавляет вызов модели в дневной rollup пользователя."""
+    cost = gpt_cost_usd(usage)
+    _upsert(session, user_id, datetime.utcnow().date(), {
+        "calls": 1,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "images": usage.image_count,
+        "latency_ms": usage.latency_ms,
+        "cost_usd": cost,
+    })
+    _count(usage.model, "calls", 1)
+    _count(usage.model, "input_tokens", usage.input_tokens)
+    _count(usage.model, "output_tokens", usage.output_tokens)
+    _count(usage.model, "cost_usd", cost)
+
+
+def record_draft_usage(session: Session, draft: MealDraft, analysis: MealAnalysis) -> None:
+    """Пишет расход анализа в драфт и в дневной rollup (ответ из кэша — только счётчик cache_hits)."""
+    if analysis.cache_hit:
+        _upsert(session, draft.user_id, datetime.utcnow().date(), {"cache_hits": 1})
+        _count(None, "cache_hits", 1)
+        return
+    usage = analysis.usage
+    if usage is None:
+        return
+
+    draft.gpt_model = usage.model
+    draft.input_tokens = usage.input_tokens
+    draft.output_tokens = usage.output_tokens
+    draft.image_count = usage.image_count
+    draft.latency_ms = usage.latency_ms
+    session.add(draft)
+    record_usage(session, draft.user_id, usage)
+
+
+# ======================================================
+#  Limits
+# ======================================================
+
+def _seconds_until_tomorrow(now: datetime) -> int:
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+def check_gpt_budget(session: Session, user_id: int) -> None:
+    """429 с Retry-After до конца суток (UTC), если пользователь исчерпал дневной лимит вызовов, токенов или денег."""
+    limits = (settings.GPT_USER_DAILY_CALLS, settings.GPT_USER_DAILY_TOKENS, settings.GPT_USER_DAILY_COST_USD)
+    if not any(limits):
+        return
+    now = datetime.utcnow()
+    row = session.exec(
+        select(DailyGptUsage).where(DailyGptUsage.user_id == user_id).where(DailyGptUsage.day == now.date())
+    ).first()
+    if row is None:
+        return
+
+    exceeded = None
+    if settings.GPT_USER_DAILY_CALLS and row.calls >= settings.GPT_USER_DAILY_CALLS:
+        exceeded = "calls"
+    elif settings.GPT_USER_DAILY_TOKENS and row.input_tokens + row.output_tokens >= settings.GPT_USER_DAILY_TOKENS:
+        exceeded = "tokens"
+    elif settings.GPT_USER_DAILY_COST_USD and row.cost_usd >= settings.GPT_USER_DAILY_COST_USD:
+        exceeded = "budget"
+    if exceeded:
+        _count(None, "rejected", 1)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Daily meal analysis limit reached ({exceeded})",
+            headers={"Retry-After": str(_seconds_until_tomorrow(now))},
+        )
+
+
+# ======================================================
+#  Metrics
+# ======================================================
+
+_totals: Counter = Counter()  # (model, имя счётчика) -> значение с запуска процесса
+_totals_lock = threading.Lock()
+
+
+def _count(model: Optional[str], name: str, value: float) -> None:
+    with _totals_lock:
+        _totals[(model or "", name)] += value
+
+
+def _usage_metrics() -> List[str]:
+    with _totals_lock:
+        totals = dict(_totals)
+    lines: List[str] = []
+    for name in ("calls", "input_tokens", "output_tokens", "cost_usd"):
+        lines.append(f"# TYPE app_gpt_{name}_total counter")
+        lines += [f'app_gpt_{name}_total{{model="{model}"}} {value!r}' for (model, n), value in sorted(totals.items()) if n == name]
+    for name in ("cache_hits", "rejected"):
+        lines += [f"# TYPE app_gpt_{name}_total counter", f"app_gpt_{name}_total {totals.get(('', name), 0)!r}"]
+    return lines
+
+
+register_collector(_usage_metrics)
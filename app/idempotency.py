@@ -0,0 +1,170 @@
+# app/idempotency.py
+"""Заголовок Idempotency-Key для POST-эндпоинтов.
+
+Повтор запроса с тем же ключом (тот же пользователь, тот же маршрут) возвращает
+сохранённый ответ первого запроса: один поиск по уникальному индексу вместо
+второй записи в базу или второго платного вызова модели.
+
+- Сохраняются только успешные (2xx) JSON-ответы; ошибки можно повторить тем же ключом.
+- Тот же ключ с другим телом запроса (JSON или полями и файлами формы) — 422.
+- Пока первый запрос выполняется, повторы в этом же процессе ждут его результата.
+- Записи старше IDEMPOTENCY_TTL_SECONDS не учитываются и периодически удаляются.
+- Потоковые ответы (SSE/NDJSON) и запросы без Bearer-токена не кэшируются.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+from .auth import user_id_from_token
+from .config import settings
+from .db import db_writer, engine
+from .models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 128
+
+Handler = Callable[[Request], Coroutine[Any, Any, Response]]
+
+
+def _cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+
+
+def _lookup(user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    with Session(engine) as session:
+        return session.exec(
+            select(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id)
+            .where(IdempotencyKey.scope == scope)
+            .where(IdempotencyKey.key == key)
+            .where(IdempotencyKey.created_at >= _cutoff())
+        ).first()
+
+
+_last_purge = 0.0
+
+
+def _save(user_id: int, scope: str, key: str, request_hash: str, status_code: int, body: Any) -> None:
+    global _last_purge
+    purge = time.monotonic() - _last_purge >= settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS
+    if purge:
+        _last_purge = time.monotonic()
+
+    def write(session: Session) -> None:
+        if purge:
+            session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < _cutoff()))
+        insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+        # параллельный запрос из другого процесса мог успеть первым — его ответ и остаётся
+        session.execute(
+            insert(IdempotencyKey.__table__)
+            .values(user_id=user_id, scope=scope, key=key, request_hash=request_hash,
+                    status_code=status_code, response=body, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["user_id", "scope", "key"])
+        )
+
+    db_writer.run(write)
+
+
+def _replay(record: IdempotencyKey, request_hash: str) -> Response:
+    if record.request_hash and record.request_hash != request_hash:
+        raise HTTPException(status_code=422, detail=f"{HEADER} was already used with a different request")
+    return ORJSONResponse(record.response, status_code=record.status_code, headers={REPLAYED_HEADER: "true"})
+
+
+def _user_id(request: Request) -> Optional[int]:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return user_id_from_token(token)
+
+
+READ_CHUNK_BYTES = 1024 * 1024
+FORM_TYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+
+def _feed(digest: Any, *values: str) -> None:
+    # длина перед значением — чтобы ("ab", "c") и ("a", "bc") давали разные хэши
+    for value in values:
+        data = value.encode("utf-8")
+        digest.update(f"{len(data)}:".encode("ascii") + data)
+
+
+async def _request_hash(request: Request) -> str:
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{request.url.query}".encode("utf-8"))
+    content_type = request.headers.get("content-type", "")
+    # JSON-тело FastAPI всё равно читает целиком (и кэширует в Request)
+    if content_type.startswith("application/json"):
+        digest.update(await request.body())
+    elif content_type.startswith(FORM_TYPES):
+        # форму Starlette тоже кэширует в Request; файлы хэшируются по частям
+        # и перематываются, так что эндпоинт читает их как обычно
+        form = await request.form()
+        for name, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                files = hashlib.sha256()
+                await value.seek(0)
+                while chunk := await value.read(READ_CHUNK_BYTES):
+                    files.update(chunk)
+                await value.seek(0)
+                _feed(digest, name, value.filename or "", value.content_type or "", files.hexdigest())
+            else:
+                _feed(digest, name, value)
+    return digest.hexdigest()
+
+
+_in_flight: Dict[Tuple[int, str, str], asyncio.Event] = {}
+
+
+class IdempotentRoute(APIRoute):
+    """APIRoute, который учитывает Idempotency-Key у POST-запросов (route_class роутера)."""
+
+    def get_route_handler(self) -> Handler:
+        handler = super().get_route_handler()
+        if "POST" not in self.methods:
+            return handler
+        scope = f"POST {self.path}"
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(HEADER)
+            user_id = _user_id(request) if key else None
+            if not key or user_id is None:
+                return await handler(request)
+            if len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(status_code=400, detail=f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+            request_hash = await _request_hash(request)
+            slot = (user_id, scope, key)
+            while slot in _in_flight:
+                await _in_flight[slot].wait()
+            _in_flight[slot] = event = asyncio.Event()
+            try:
+                record = await run_in_threadpool(_lookup, user_id, scope, key)
+                if record is not None:
+                    return _replay(record, request_hash)
+
+                response = await handler(request)
+                if 200 <= response.status_code < 300 and response.media_type == "application/json" and hasattr(response, "body"):
+                    await run_in_threadpool(_save, user_id, scope, key, request_hash, response.status_code, orjson.loads(response.body))
+                return response
+            finally:
+                del _in_flight[slot]
+                event.set()
+                # форма, разобранная для хэша, при повторе до эндпоинта не доходит — закрываем её сами
+                await request.close()
+
+        return idempotent_handler
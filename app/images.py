@@ -0,0 +1,96 @@
+# app/images.py
+import io
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .config import settings
+
+
+# (content_type, bytes) изображения
+ImagePart = Tuple[str, bytes]
+
+READ_CHUNK_BYTES = 64 * 1024
+
+_FORMAT_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# форматы, которые можно отправить модели как есть, если перекодирование их не уменьшает
+_SOURCE_MIME = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+_METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "icc_profile", "comment")
+
+
+async def read_images(images: Optional[List[UploadFile]]) -> List[ImagePart]:
+    """Читает загрузки по частям, проверяя лимиты до того, как файл целиком окажется в памяти.
+
+    - не больше IMAGE_MAX_COUNT файлов (иначе 400);
+    - не больше IMAGE_MAX_BYTES на файл и IMAGE_MAX_TOTAL_BYTES на запрос (иначе 413).
+    """
+    images = images or []
+    if len(images) > settings.IMAGE_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"Too many images: at most {settings.IMAGE_MAX_COUNT} per request")
+
+    parts: List[ImagePart] = []
+    total = 0
+    for idx, img in enumerate(images):
+        buf = bytearray()
+        try:
+            await img.seek(0)
+            while chunk := await img.read(READ_CHUNK_BYTES):
+                buf += chunk
+                total += len(chunk)
+                if len(buf) > settings.IMAGE_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Uploaded image #{idx+1} exceeds {settings.IMAGE_MAX_BYTES} bytes")
+                if total > settings.IMAGE_MAX_TOTAL_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Uploaded images exceed {settings.IMAGE_MAX_TOTAL_BYTES} bytes in total")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to prepare image #{idx+1} for GPT: {e}")
+        if not buf:
+            raise HTTPException(status_code=400, detail=f"Uploaded image #{idx+1} is empty")
+        parts.append((img.content_type or "image/jpeg", bytes(buf)))
+    return parts
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """RGB без альфа-канала: прозрачные области — белым фоном, а не чёрным/мусором от convert("RGB")."""
+    if img.has_transparency_data:
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    return img
+
+
+def preprocess_image(file_bytes: bytes, idx: int = 0) -> ImagePart:
+    """Уменьшает изображение до IMAGE_MAX_EDGE_PX по длинной стороне и перекодирует без EXIF.
+
+    Ориентация из EXIF применяется к пикселям до удаления метаданных. Если перекодирование
+    не уменьшило уже небольшой файл без метаданных, отправляется исходный файл.
+    """
+    max_edge = settings.IMAGE_MAX_EDGE_PX
+    fmt = settings.IMAGE_FORMAT.upper()
+    try:
+        img = Image.open(io.BytesIO(file_bytes))
+        source_format, source_size = img.format, img.size
+        has_metadata = any(key in img.info for key in _METADATA_KEYS)
+        # JPEG умеет декодировать сразу в уменьшенном масштабе (1/2, 1/4, 1/8)
+        img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        img = _flatten(img)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Uploaded image #{idx+1} is not a valid image: {e.__class__.__name__}")
+
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=settings.IMAGE_QUALITY)
+    if (len(out.getvalue()) >= len(file_bytes) and img.size == source_size
+            and not has_metadata and source_format in _SOURCE_MIME):
+        return _SOURCE_MIME[source_format], file_bytes
+    return _FORMAT_MIME.get(fmt, f"image/{fmt.lower()}"), out.getvalue()
+
+
+def preprocess_images(image_parts: List[ImagePart]) -> List[ImagePart]:
+    return [preprocess_image(file_bytes, idx) for idx, (_, file_bytes) in enumerate(image_parts)]
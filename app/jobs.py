@@ -0,0 +1,97 @@
+# app/jobs.py
+import asyncio
+from collections import Counter
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+
+Job = Callable[[], Awaitable[None]]
+
+
+class JobQueue:
+    """Внутрипроцессная очередь фоновых задач с фиксированным пулом asyncio-воркеров.
+
+    Воркеры стартуют лениво при первой задаче (или явно через `start()`), поэтому
+    очередь привязывается к тому event loop, в котором работает приложение.
+    Подписчики могут ждать завершения задачи по ключу через `listen()` и `wait()`.
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 100):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._events: Dict[object, asyncio.Event] = {}
+        self._listeners: Counter = Counter()
+
+    def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, job: Job) -> None:
+        """Ставит задачу в очередь; при переполнении — 503, чтобы клиент повторил позже."""
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many pending jobs, please retry")
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # задача сама отвечает за запись ошибки; воркер не должен умирать
+                pass
+            finally:
+                self._queue.task_done()
+
+    # --- ожидание результата ---
+
+    @contextmanager
+    def listen(self, key: object) -> Iterator[asyncio.Event]:
+        """Подписка на `notify(key)` на время блока.
+
+        Подписываться нужно до проверки состояния (например, статуса драфта в базе):
+        тогда `notify` между проверкой и `wait()` не теряется. Событие удаляется
+        при `notify` или когда уходит последний подписчик, так что ключи, которые
+        никто не уведомит (драфты других процессов), не копятся.
+        """
+        event = self._events.setdefault(key, asyncio.Event())
+        self._listeners[key] += 1
+        try:
+            yield event
+        finally:
+            self._listeners[key] -= 1
+            if not self._listeners[key]:
+                del self._listeners[key]
+                if self._events.get(key) is event:
+                    del self._events[key]
+
+    def notify(self, key: object) -> None:
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    async def wait(event: asyncio.Event, timeout: float) -> bool:
+        """Ждёт событие из `listen()` не дольше `timeout` секунд; True, если дождались."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
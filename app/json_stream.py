@@ -0,0 +1,60 @@
+# app/json_stream.py
+import json
+from typing import Any, List, Tuple
+
+
+class JsonFieldStream:
+    """Инкрементальный разбор JSON-объекта верхнего уровня по мере поступления текста.
+
+    `feed()` возвращает пары (ключ, значение) для полей, значение которых уже
+    полностью пришло, — например, `total_kcal` можно показать клиенту до того,
+    как модель допишет `ingredients_detected`. Текст вне объекта (```json и т.п.)
+    игнорируется.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = -1
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        fields: List[Tuple[str, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1 and c == "{":
+                    self._member_start = i + 1
+            elif c in "}]":
+                if self._depth == 1 and c == "}":
+                    fields.extend(self._member(self._member_start, i))
+                    self._member_start = -1
+                self._depth -= 1
+            elif c == "," and self._depth == 1:
+                fields.extend(self._member(self._member_start, i))
+                self._member_start = i + 1
+        self._pos = len(text)
+        return fields
+
+    def _member(self, start: int, end: int) -> List[Tuple[str, Any]]:
+        member = self.text[start:end].strip()
+        if start < 0 or not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except ValueError:
+            return []
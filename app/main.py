@@ -1,8 +1,36 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api import router as api_router
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from .api import router as api_router, draft_jobs, fail_stale_meal_drafts
+from .auth import load_jwt_keys
+from .passwords import password_hasher
+from .db import db_writer, close_async_engine
+from .config import settings
+from .metrics import MetricsMiddleware
+from .query_audit import QueryAuditMiddleware
+from .gpt import close_openai_client, close_meal_analysis_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_jwt_keys()
+    await run_in_threadpool(fail_stale_meal_drafts)
+    draft_jobs.start()
+    yield
+    await draft_jobs.stop()
+    await run_in_threadpool(db_writer.stop)
+    await close_async_engine()
+    await close_openai_client()
+    close_meal_analysis_cache()
+    password_hasher.shutdown()
 
-app = FastAPI(title="Calorie Tracker Backend", version="1.0.0")
+
+# orjson для всех JSON-ответов (эндпоинты с готовыми схемами — через responses.trusted_json)
+app = FastAPI(title="Calorie Tracker Backend", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,4 +40,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(api_router)
\ No newline at end of file
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+if settings.QUERY_AUDIT:
+    app.add_middleware(QueryAuditMiddleware)
+
+if settings.ASYNC_DB:
+    # дашборд и логи — через AsyncSession, остальное — синхронные эндпоинты
+    from .api_async import include_routers
+    include_routers(app, api_router)
+else:
+    app.include_router(api_router)
\ No newline at end of file
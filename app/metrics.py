@@ -0,0 +1,313 @@
+# app/metrics.py
+"""Метрики запросов: время, SQL, загруженные строки, OpenAI, JWT и байты.
+
+MetricsMiddleware заводит на каждый HTTP-запрос RequestStats в contextvar; его
+пополняют события SQLAlchemy (время и число запросов на любом Engine, загрузка
+ORM-объектов) и участки, обёрнутые в `timed(...)` (вызов модели, проверка JWT).
+Контекст переходит в threadpool синхронных эндпоинтов, в AsyncSession и в
+задачи WriteQueue, поэтому всё это попадает в статистику своего запроса.
+
+Итоги пишутся в гистограммы с метками по шаблону маршрута (GET /metrics, формат
+Prometheus), по желанию — в заголовок Server-Timing, а каждый N-й запрос можно
+снять выборочным профилировщиком в файл свёрнутых стеков для flamegraph.pl /
+speedscope.
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+
+# ======================================================
+#  Per-request stats
+# ======================================================
+
+class RequestStats:
+    __slots__ = ("started", "db_seconds", "db_statements", "rows_hydrated", "timers")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.db_statements = 0
+        self.rows_hydrated = 0
+        self.timers: Dict[str, float] = {}
+
+    def add_time(self, component: str, seconds: float) -> None:
+        self.timers[component] = self.timers.get(component, 0.0) + seconds
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def timed(component: str) -> Iterator[None]:
+    """Учитывает время блока в статистике текущего запроса (вне запроса — ничего не делает)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_time(component, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    stats = _current.get()
+    started = conn.info.get("metrics_started")
+    if stats is None or not started:
+        return
+    stats.db_seconds += time.perf_counter() - started.pop()
+    stats.db_statements += 1
+
+
+@event.listens_for(Engine, "handle_error")
+def _on_error(context: Any) -> None:
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+@event.listens_for(Mapper, "load")
+def _on_load(target: Any, context: Any) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.rows_hydrated += 1
+
+
+# ======================================================
+#  Histograms (Prometheus text format)
+# ======================================================
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # значения меток -> [счётчики бакетов..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, series in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            sep = "," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{_number(bound)}"}} {_number(count)}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {_number(series[-1])}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]!r}")
+            lines.append(f"{self.name}_count{{{labels}}} {_number(series[-1])}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+REQUEST_SECONDS = Histogram("app_request_duration_seconds", "Wall time of HTTP requests.", ("method", "route", "status"), SECONDS_BUCKETS)
+DB_SECONDS = Histogram("app_request_db_seconds", "Time spent executing SQL per request.", ("route",), SECONDS_BUCKETS)
+DB_STATEMENTS = Histogram("app_request_db_statements", "SQL statements executed per request.", ("route",), COUNT_BUCKETS)
+ROWS_HYDRATED = Histogram("app_request_rows_hydrated", "ORM objects loaded from result rows per request.", ("route",), COUNT_BUCKETS)
+COMPONENT_SECONDS = Histogram("app_request_component_seconds", "Time per request in instrumented components (openai, auth, bcrypt).", ("route", "component"), SECONDS_BUCKETS)
+BYTES_IN = Histogram("app_request_bytes_in", "Request body size.", ("route",), BYTES_BUCKETS)
+BYTES_OUT = Histogram("app_response_bytes_out", "Response body size.", ("route",), BYTES_BUCKETS)
+
+HISTOGRAMS = (REQUEST_SECONDS, DB_SECONDS, DB_STATEMENTS, ROWS_HYDRATED, COMPONENT_SECONDS, BYTES_IN, BYTES_OUT)
+
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    """Дополнительные строки для /metrics (например, счётчики кэшей)."""
+    _collectors.append(fn)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+# ======================================================
+#  Sampling profiler
+# ======================================================
+
+class StackSampler:
+    """Снимает стеки всех потоков процесса каждые `interval` секунд, пока запущен.
+
+    Результат — свёрнутые стеки (`frame;frame;frame count` на строку), вход для
+    flamegraph.pl и speedscope. Стеки соседних запросов тоже попадают в выборку.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def dump(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_profile_lock = threading.Lock()
+_request_counter = 0
+
+
+def _maybe_start_profiler() -> Optional[StackSampler]:
+    """Каждый PROFILE_EVERY_N-й запрос (не больше одного профиля одновременно)."""
+    global _request_counter
+    if settings.PROFILE_EVERY_N <= 0:
+        return None
+    _request_counter += 1
+    if _request_counter % settings.PROFILE_EVERY_N or not _profile_lock.acquire(blocking=False):
+        return None
+    sampler = StackSampler(settings.PROFILE_INTERVAL_MS / 1000)
+    sampler.start()
+    return sampler
+
+
+def _finish_profiler(sampler: StackSampler, method: str, route: str) -> None:
+    try:
+        sampler.stop()
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", f"{method}{route}").strip("_")
+        sampler.dump(os.path.join(settings.PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{slug}.folded"))
+    finally:
+        _profile_lock.release()
+
+
+# ======================================================
+#  Middleware
+# ======================================================
+
+def _server_timing(stats: RequestStats) -> bytes:
+    parts = [f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.db_statements} queries"']
+    parts += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.timers.items()]
+    parts.append(f"app;dur={(time.perf_counter() - stats.started) * 1000:.2f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: собирает RequestStats запроса и пишет их в гистограммы."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        sampler = _maybe_start_profiler()
+        status = 500
+        bytes_in = 0
+        bytes_out = 0
+
+        async def receive_counted() -> Dict[str, Any]:
+            nonlocal bytes_in
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Dict[str, Any]) -> None:
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.SERVER_TIMING:
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", _server_timing(stats))]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            _current.reset(token)
+            route_obj = scope.get("route")
+            route = getattr(route_obj, "path", None) or "<unmatched>"
+            method = scope.get("method", "")
+            REQUEST_SECONDS.observe(time.perf_counter() - stats.started, method, route, str(status))
+            DB_SECONDS.observe(stats.db_seconds, route)
+            DB_STATEMENTS.observe(stats.db_statements, route)
+            ROWS_HYDRATED.observe(stats.rows_hydrated, route)
+            for component, seconds in stats.timers.items():
+                COMPONENT_SECONDS.observe(seconds, route, component)
+            BYTES_IN.observe(bytes_in, route)
+            BYTES_OUT.observe(bytes_out, route)
+            if sampler is not None:
+                # join потока-сэмплера и запись файла — в threadpool; shield, чтобы при отмене
+                # запроса профиль всё равно дописался и блокировка освободилась
+                await asyncio.shield(run_in_threadpool(_finish_profiler, sampler, method, route))
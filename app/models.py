@@ -1,9 +1,13 @@
 from datetime import date, datetime
 from enum import Enum
 from typing import Optional, Any
-from sqlalchemy import Column, JSON as SA_JSON
+from sqlalchemy import Column, Index, JSON as SA_JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import SQLModel, Field as SQLField
 
+# JSON на SQLite, JSONB на PostgreSQL (бинарное хранение, индексы GIN)
+JSON_TYPE = SA_JSON().with_variant(JSONB(), "postgresql")
+
 
 # ======================================================
 #  User
@@ -12,7 +16,7 @@ from sqlmodel import SQLModel, Field as SQLField
 class User(SQLModel, table=True):
     """Базовый профиль пользователя + текущее состояние"""
     id: Optional[int] = SQLField(default=None, primary_key=True)
-    name: str
+    name: str = SQLField(index=True)  # вход по имени
 
     # --- аутентификация ---
     password_hash: str
@@ -29,6 +33,7 @@ class User(SQLModel, table=True):
     created_at: datetime = SQLField(default_factory=datetime.utcnow)
     updated_at: datetime = SQLField(default_factory=datetime.utcnow)
     current_goal_id: Optional[int] = SQLField(default=None, index=True)  # ссылка на активную цель
+    version: int = 0  # растёт при изменении профиля, цели или веса (ETag дашборда и списка веса)
 
 
 # ======================================================
@@ -67,6 +72,8 @@ class Goal(SQLModel, table=True):
 
 class MealLog(SQLModel, table=True):
     """Подтверждённый приём пищи (из драфта или вручную)"""
+    __table_args__ = (Index("ix_meallog_user_id_eaten_at", "user_id", "eaten_at"),)
+
     id: Optional[int] = SQLField(default=None, primary_key=True)
     user_id: int = SQLField(index=True)
     draft_id: Optional[int] = SQLField(default=None, index=True)  # связь с MealDraft
@@ -85,7 +92,7 @@ class MealLog(SQLModel, table=True):
     water_ml: Optional[float] = 0
 
     # --- состав и контекст ---
-    ingredients: Optional[list[str]] = SQLField(default=None, sa_column=Column(SA_JSON))
+    ingredients: Optional[list[str]] = SQLField(default=None, sa_column=Column(JSON_TYPE))
     cooking_method: Optional[str] = None
     portion_weight_grams: Optional[float] = None
     portion_weight_oz: Optional[float] = None
@@ -94,12 +101,14 @@ class MealLog(SQLModel, table=True):
     location: Optional[str] = None
 
     # --- дополнительные данные ---
-    extra_data: Optional[dict] = SQLField(default=None, sa_column=Column(SA_JSON))
+    extra_data: Optional[dict] = SQLField(default=None, sa_column=Column(JSON_TYPE))
     created_at: datetime = SQLField(default_factory=datetime.utcnow, index=True)
 
 
 class WaterLog(SQLModel, table=True):
     """Лог потребления воды"""
+    __table_args__ = (Index("ix_waterlog_user_id_drank_at", "user_id", "drank_at"),)
+
     id: Optional[int] = SQLField(default=None, primary_key=True)
     user_id: int = SQLField(index=True)
     drank_at: datetime = SQLField(index=True)
@@ -108,12 +117,46 @@ class WaterLog(SQLModel, table=True):
 
 class WeightLog(SQLModel, table=True):
     """Измерение веса"""
+    __table_args__ = (Index("ix_weightlog_user_id_on_date", "user_id", "on_date"),)
+
     id: Optional[int] = SQLField(default=None, primary_key=True)
     user_id: int = SQLField(index=True)
     on_date: date = SQLField(index=True)
     kg: float
 
 
+# ======================================================
+#  Daily rollup
+# ======================================================
+
+class DailySummary(SQLModel, table=True):
+    """Агрегаты за день по пользователю (обновляются дельтами при записи логов)"""
+    __table_args__ = (Index("ix_dailysummary_user_id_day", "user_id", "day", unique=True),)
+
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    user_id: int
+    day: date
+
+    # --- суммы по MealLog ---
+    kcal: float = 0.0
+    protein_g: float = 0.0
+    fat_g: float = 0.0
+    carbs_g: float = 0.0
+    sugar_g: float = 0.0
+    fiber_g: float = 0.0
+    salt_g: float = 0.0
+    meal_count: int = 0
+
+    # --- сумма по WaterLog ---
+    water_ml: int = 0
+
+    # --- последнее измерение веса за день ---
+    weight_kg: Optional[float] = None
+
+    # растёт при каждом изменении логов этого дня (ETag дашборда)
+    version: int = 0
+
+
 # ======================================================
 #  Onboarding
 # ======================================================
@@ -153,7 +196,7 @@ class OnboardingSubmission(SQLModel, table=True):
     sugar_g: Optional[int] = None
 
     # --- оригинальный payload ---
-    data: dict = SQLField(sa_column=Column(SA_JSON))
+    data: dict = SQLField(sa_column=Column(JSON_TYPE))
 
 
 # ======================================================
@@ -163,68 +206,103 @@ class OnboardingSubmission(SQLModel, table=True):
 class MealDraft(SQLModel, table=True):
     """Черновик распознавания блюда (полный ответ GPT + видимые поля)
 
-    Поле `gpt_result` хранит исходный JSON, возвращённый моделью (ожидаемый формат):
+    Поле `gpt_result` хранит ответ модели, провалидированный по schemas.MealAnalysisResult
+    (по той же модели строится JSON Schema structured output), для драфта в статусе failed —
+    {"error": "..."}:
     {
-      "meals": [
-        {
-          "title": "Dish name or product (if known)",
-          "total_kcal": 0,
-          "portion_weight_grams": 0,
-          "portion_weight_oz": 0,
-          "cooking_method": "steamed",
-          "macros": {
-            "protein_g": 0,
-            "fat_g": 0,
-            "carbohydrates_g": 0,
-            "sugar_g": 0,
-            "fiber_g": 0,
-            "salt_g": 0,
-            "water_ml": 0
-          },
-          "satiety_hours": 0,
-          "ingredients_detected": [],
-          "time_of_day": "morning",
-          "date": "YYYY-MM-DD",
-          "time": "HH:MM",
-          "location": "home"
-        }
-      ],
-      "total": {
-        "total_kcal": 0,
-        "portion_weight_grams": 0,
-        "portion_weight_oz": 0,
-        "satiety_hours": 0,
-        "macros": {
-          "protein_g": 0,
-          "fat_g": 0,
-          "carbohydrates_g": 0,
-          "sugar_g": 0,
-          "fiber_g": 0,
-          "salt_g": 0,
-          "water_ml": 0
-        },
-        "macro_distribution_percent_weight": {
-          "protein_percent": 0,
-          "fat_percent": 0,
-          "carbohydrates_percent": 0
-        },
-        "macro_distribution_percent_kcal": {
-          "protein_percent": 0,
-          "fat_percent": 0,
-          "carbohydrates_percent": 0
-        }
-      }
+      "title": "Dish name or product (if known)",
+      "total_kcal": 0,
+      "portion_weight_grams": 0,
+      "portion_weight_oz": 0,
+      "cooking_method": "steamed",
+      "macros": {
+        "protein_g": 0,
+        "fat_g": 0,
+        "carbohydrates_g": 0,
+        "sugar_g": 0,
+        "fiber_g": 0,
+        "salt_g": 0,
+        "water_ml": 0
+      },
+      "satiety_hours": 0,
+      "ingredients_detected": [],
+      "time_of_day": "morning",
+      "location": "home"
     }
+    Любое поле, кроме macros и ingredients_detected, может быть null.
     """
     id: Optional[int] = SQLField(default=None, primary_key=True)
     user_id: int = SQLField(index=True)
     created_at: datetime = SQLField(default_factory=datetime.utcnow, index=True)
 
     # Полный ответ от GPT (как есть)
-    gpt_result: dict = SQLField(sa_column=Column(SA_JSON))
+    gpt_result: dict = SQLField(sa_column=Column(JSON_TYPE))
 
     # Короткая сводка для UI (например, name/kcal/БЖУ)
-    visible_data: Optional[dict] = SQLField(default=None, sa_column=Column(SA_JSON))
+    visible_data: Optional[dict] = SQLField(default=None, sa_column=Column(JSON_TYPE))
 
     # Статус жизненного цикла драфта
-    status: str = SQLField(default="pending", index=True)  # pending | confirmed | discarded
\ No newline at end of file
+    status: str = SQLField(default="pending", index=True)  # analyzing | pending | failed | confirmed | deleted
+
+    # --- расход вызова модели (пусто, если ответ взят из кэша) ---
+    gpt_model: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    image_count: Optional[int] = None
+    latency_ms: Optional[int] = None
+    image_bytes_saved: Optional[int] = None  # уменьшение изображений перед отправкой
+
+
+class DailyGptUsage(SQLModel, table=True):
+    """Расход GPT за день по пользователю (обновляется upsert-дельтами при записи драфта)"""
+    __table_args__ = (Index("ix_dailygptusage_user_id_day", "user_id", "day", unique=True),)
+
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    user_id: int
+    day: date
+
+    calls: int = 0          # вызовы модели
+    cache_hits: int = 0     # анализы из кэша (без вызова)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    images: int = 0
+    latency_ms: int = 0     # сумма по вызовам
+    cost_usd: float = 0.0   # по ценам OPENAI_*_USD_PER_1M_TOKENS на момент вызова
+
+# ======================================================
+#  Idempotency
+# ======================================================
+
+class IdempotencyKey(SQLModel, table=True):
+    """Результат уже выполненной операции по ключу клиента (повтор возвращает его же)"""
+    __table_args__ = (Index("ix_idempotencykey_user_id_scope_key", "user_id", "scope", "key", unique=True),)
+
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    user_id: int
+    scope: str                      # sync — элемент POST /api/sync/batch; "POST /api/..." — заголовок Idempotency-Key
+    key: str = SQLField(max_length=128)
+    request_hash: Optional[str] = SQLField(default=None, max_length=64)  # sha256 метода, пути и JSON-тела
+    status_code: int = 200
+    response: dict = SQLField(sa_column=Column(JSON_TYPE))
+    created_at: datetime = SQLField(default_factory=datetime.utcnow, index=True)
+
+
+# ======================================================
+#  Change log (delta sync)
+# ======================================================
+
+class ChangeLog(SQLModel, table=True):
+    """Журнал изменений MealLog/WaterLog/WeightLog/Goal; id — курсор дельта-синхронизации клиента"""
+    __table_args__ = (
+        Index("ix_changelog_user_id_id", "user_id", "id"),
+        Index("ix_changelog_changed_at", "changed_at"),  # чистка по сроку хранения
+        Index("ix_changelog_entity_entity_id_id", "entity", "entity_id", "id"),  # последняя запись строки
+        {"sqlite_autoincrement": True},  # id не переиспользуются — курсор только растёт
+    )
+
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    user_id: int
+    entity: str        # meal | water | weight | goal
+    entity_id: int
+    op: str            # upsert | delete
+    changed_at: datetime = SQLField(default_factory=datetime.utcnow)
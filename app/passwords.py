@@ -0,0 +1,94 @@
+# app/passwords.py
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+from fastapi import HTTPException
+
+from .config import settings
+
+
+# ======================================================
+#  Worker functions (выполняются в дочерних процессах)
+# ======================================================
+
+def _encode(password: str) -> bytes:
+    # bcrypt учитывает только первые 72 байта
+    return password[:72].encode("utf-8")[:72]
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode("utf-8"))
+    except Exception:
+        return False
+
+
+# ======================================================
+#  Pool
+# ======================================================
+
+class PasswordHasher:
+    """bcrypt в отдельном пуле процессов ограниченного размера.
+
+    Каждый вызов занимает ~250 мс CPU, поэтому работа уходит из процессов веб-сервера,
+    а число ожидающих задач ограничено `max_pending`: сверх лимита сразу отвечаем 429,
+    не занимая поток запроса в очереди.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(status_code=429, detail="Too many authentication requests, please retry", headers={"Retry-After": "1"})
+            self._pending += 1
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, settings.BCRYPT_ROUNDS)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run(_verify, password, password_hash)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True, если хэш создан с другим work factor, чем BCRYPT_ROUNDS ($2b$<rounds>$...)."""
+    try:
+        return int(password_hash.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
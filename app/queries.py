@@ -0,0 +1,182 @@
+# app/queries.py
+from datetime import date, datetime, time, timedelta
+from typing import Tuple
+
+from sqlalchemy import Date, func, true
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlmodel import select
+
+from .models import User, Goal, MealLog, WaterLog, WeightLog, DailySummary
+
+
+# ======================================================
+#  Day windows
+# ======================================================
+
+def day_window(day: date) -> Tuple[datetime, datetime]:
+    """Границы календарного дня в виде полуинтервала [start, end).
+
+    Сравнение `col >= start AND col < end` по голой колонке позволяет SQLite
+    использовать составные индексы (user_id, eaten_at) / (user_id, drank_at),
+    в отличие от `DATE(col) = ...`, которое приводит к полному сканированию.
+    """
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+class day_of(FunctionElement):
+    """Календарный день datetime-колонки для GROUP BY (только для агрегаций, не для WHERE)."""
+    type = Date()
+    name = "day_of"
+    inherit_cache = True
+
+
+@compiles(day_of)
+def _day_of_default(element, compiler, **kw):
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_of, "postgresql")
+def _day_of_postgresql(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+# ======================================================
+#  Per-day selects
+# ======================================================
+
+def weight_for_day(user_id: int, day: date):
+    """Измерения веса за день, последнее — первым."""
+    return (
+        select(WeightLog)
+        .where(WeightLog.user_id == user_id)
+        .where(WeightLog.on_date == day)
+        .order_by(WeightLog.id.desc())
+    )
+
+
+# ======================================================
+#  Dashboard assembly
+# ======================================================
+
+def meal_rows_for_day(user_id: int, day: date):
+    """Только колонки, нужные дашборду — без гидрации объектов MealLog."""
+    start, end = day_window(day)
+    return (
+        select(
+            MealLog.eaten_at, MealLog.name, MealLog.kcal, MealLog.protein_g,
+            MealLog.fat_g, MealLog.carbs_g, MealLog.sugar_g, MealLog.fiber_g,
+        )
+        .where(MealLog.user_id == user_id)
+        .where(MealLog.eaten_at >= start)
+        .where(MealLog.eaten_at < end)
+        .order_by(MealLog.eaten_at.asc())
+    )
+
+
+def water_rows_for_day(user_id: int, day: date):
+    start, end = day_window(day)
+    return (
+        select(WaterLog.drank_at, WaterLog.ml)
+        .where(WaterLog.user_id == user_id)
+        .where(WaterLog.drank_at >= start)
+        .where(WaterLog.drank_at < end)
+        .order_by(WaterLog.drank_at.asc())
+    )
+
+
+def dashboard_summary(user_id: int, day: date):
+    """Один запрос: последняя цель, стартовый вес и готовые итоги дня из DailySummary.
+
+    Агрегат без GROUP BY всегда возвращает ровно одну строку (даже если сводки
+    за день ещё нет), поэтому он служит основой выборки; цель присоединяется
+    через LEFT JOIN и может быть NULL.
+    """
+    day_totals = (
+        select(
+            func.coalesce(func.sum(DailySummary.kcal), 0.0).label("kcal"),
+            func.coalesce(func.sum(DailySummary.protein_g), 0.0).label("protein_g"),
+            func.coalesce(func.sum(DailySummary.fat_g), 0.0).label("fat_g"),
+            func.coalesce(func.sum(DailySummary.carbs_g), 0.0).label("carbs_g"),
+            func.coalesce(func.sum(DailySummary.sugar_g), 0.0).label("sugar_g"),
+            func.coalesce(func.sum(DailySummary.fiber_g), 0.0).label("fiber_g"),
+            func.coalesce(func.sum(DailySummary.water_ml), 0).label("water_ml"),
+            func.max(DailySummary.weight_kg).label("today_kg"),
+        )
+        .where(DailySummary.user_id == user_id)
+        .where(DailySummary.day == day)
+        .subquery("day_totals")
+    )
+    goal = (
+        select(
+            Goal.goal_type, Goal.calories_kcal, Goal.protein_g, Goal.fat_g,
+            Goal.carbs_g, Goal.sugar_g, Goal.fiber_g,
+        )
+        .where(Goal.user_id == user_id)
+        .order_by(Goal.created_at.desc())
+        .limit(1)
+        .subquery("goal")
+    )
+    start_weight = select(User.start_weight_kg).where(User.id == user_id).scalar_subquery()
+
+    return (
+        select(
+            goal.c.goal_type.label("goal_type"),
+            goal.c.calories_kcal.label("goal_calories"),
+            goal.c.protein_g.label("goal_protein_g"),
+            goal.c.fat_g.label("goal_fat_g"),
+            goal.c.carbs_g.label("goal_carbs_g"),
+            goal.c.sugar_g.label("goal_sugar_g"),
+            goal.c.fiber_g.label("goal_fiber_g"),
+            start_weight.label("start_weight_kg"),
+            day_totals.c.today_kg,
+            day_totals.c.kcal,
+            day_totals.c.protein_g,
+            day_totals.c.fat_g,
+            day_totals.c.carbs_g,
+            day_totals.c.sugar_g,
+            day_totals.c.fiber_g,
+            day_totals.c.water_ml,
+        )
+        .select_from(day_totals)
+        .outerjoin(goal, true())
+    )
+
+
+# ======================================================
+#  History
+# ======================================================
+
+def goal_history(user_id: int):
+    return select(Goal).where(Goal.user_id == user_id).order_by(Goal.created_at.asc())
+
+
+def summaries_for_range(user_id: int, date_from: date, date_to: date):
+    """Готовые дневные сводки за date_from..date_to включительно (индекс user_id, day)."""
+    return (
+        select(DailySummary)
+        .where(DailySummary.user_id == user_id)
+        .where(DailySummary.day >= date_from)
+        .where(DailySummary.day <= date_to)
+        .order_by(DailySummary.day.asc())
+    )
+
+
+# ======================================================
+#  Version stamps (ETag)
+# ======================================================
+
+def dashboard_version(user_id: int, day: date):
+    """(версия пользователя, версия дня) — без обращения к таблицам логов."""
+    day_version = (
+        select(DailySummary.version)
+        .where(DailySummary.user_id == user_id)
+        .where(DailySummary.day == day)
+        .scalar_subquery()
+    )
+    return select(User.version.label("user_version"), func.coalesce(day_version, 0).label("day_version")).where(User.id == user_id)
+
+
+def user_version(user_id: int):
+    return select(User.version).where(User.id == user_id)
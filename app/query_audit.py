@@ -0,0 +1,217 @@
+# app/query_audit.py
+"""Отладочный детектор N+1 и медленных запросов (QUERY_AUDIT=true, для разработки и CI).
+
+QueryAuditMiddleware собирает SQL каждого HTTP-запроса (события
+before/after_cursor_execute на всех Engine, включая задачи WriteQueue и
+AsyncSession) и после ответа отмечает нарушения:
+
+- statements — запрос выполнил больше QUERY_AUDIT_MAX_STATEMENTS команд;
+- repeated — одна и та же команда (с разными параметрами) больше
+  QUERY_AUDIT_MAX_REPEATS раз — типичный N+1;
+- rows — загружено больше QUERY_AUDIT_MAX_ROWS ORM-объектов (например, все
+  записи пользователя, которые потом не используются);
+- full_scan — в плане есть полный проход по таблице (SQLite: `SCAN <table>` в
+  EXPLAIN QUERY PLAN, PostgreSQL: `Seq Scan on <table>`). План строится один раз
+  на каждый новый текст SELECT/UPDATE/DELETE и кэшируется.
+
+Нарушения пишутся в лог и копятся в `violations`; pytest-плагин
+app/query_audit_plugin.py валит тесты, после которых список не пуст.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+from .config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Violation(NamedTuple):
+    method: str
+    route: str
+    kind: str  # statements | repeated | rows | full_scan
+    detail: str
+
+    def __str__(self) -> str:
+        return f"{self.method} {self.route}: {self.kind}: {self.detail}"
+
+
+violations: List[Violation] = []
+_violations_lock = threading.Lock()
+
+
+class _RequestQueries:
+    __slots__ = ("statements", "scans", "rows")
+
+    def __init__(self) -> None:
+        self.statements: Counter = Counter()  # текст команды -> сколько раз выполнена
+        self.scans: Set[Tuple[str, str]] = set()  # (таблица, текст команды)
+        self.rows = 0
+
+
+_current: ContextVar[Optional[_RequestQueries]] = ContextVar("query_audit", default=None)
+
+
+# ======================================================
+#  Query plans
+# ======================================================
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+_TRANSACTION = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?:TABLE )?(\w+)")
+_SQLITE_SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+_PG_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+_scans: Dict[str, Set[str]] = {}  # текст команды -> таблицы с полным проходом
+_scans_lock = threading.Lock()
+
+
+def _allowed_scans() -> Set[str]:
+    return {t.strip().lower() for t in settings.QUERY_AUDIT_SCAN_ALLOW.split(",") if t.strip()}
+
+
+def _explain(conn: Any, statement: str, parameters: Any) -> Set[str]:
+    """Таблицы, которые команда читает целиком (по плану, без выполнения самой команды)."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        sql, pattern, column = "EXPLAIN QUERY PLAN " + statement, _SQLITE_SCAN, 3
+    elif dialect == "postgresql":
+        sql, pattern, column = "EXPLAIN " + statement, _PG_SCAN, 0
+    else:
+        return set()
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(sql, parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    tables, subqueries = set(), set()
+    for row in rows:
+        detail = str(row[column])
+        match = pattern.search(detail)
+        if match:
+            tables.add(match.group(1).lower())
+        elif dialect == "sqlite":
+            # проход по однострочному подзапросу (`SCAN day_totals`) — не проход по таблице
+            match = _SQLITE_SUBQUERY.search(detail)
+            if match:
+                subqueries.add(match.group(1).lower())
+    return tables - subqueries - _allowed_scans()
+
+
+def _scanned_tables(conn: Any, statement: str, parameters: Any) -> Set[str]:
+    with _scans_lock:
+        known = _scans.get(statement)
+    if known is not None:
+        return known
+    try:
+        tables = _explain(conn, statement, parameters)
+    except Exception as e:  # план — подсказка; сбой EXPLAIN не должен ломать запрос
+        logger.debug("EXPLAIN failed for %r: %s", statement, e)
+        tables = set()
+    with _scans_lock:
+        _scans[statement] = tables
+    return tables
+
+
+# ======================================================
+#  Engine hooks
+# ======================================================
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    queries = _current.get()
+    if queries is not None and not _TRANSACTION.match(statement):
+        queries.statements[statement] += 1
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    queries = _current.get()
+    if queries is None or executemany or not settings.QUERY_AUDIT_EXPLAIN or not _EXPLAINABLE.match(statement):
+        return
+    # сами EXPLAIN выполняются на курсоре DBAPI мимо событий, так что не считаются
+    for table in _scanned_tables(conn, statement, parameters):
+        queries.scans.add((table, statement))
+
+
+def _on_load(target: Any, context: Any) -> None:
+    queries = _current.get()
+    if queries is not None:
+        queries.rows += 1
+
+
+_installed = False
+
+
+def install() -> None:
+    global _installed
+    if not _installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Mapper, "load", _on_load)
+        _installed = True
+
+
+# ======================================================
+#  Middleware
+# ======================================================
+
+def _short(statement: str, limit: int = 160) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+def _find_violations(method: str, route: str, queries: _RequestQueries) -> List[Violation]:
+    found: List[Violation] = []
+    total = sum(queries.statements.values())
+    if total > settings.QUERY_AUDIT_MAX_STATEMENTS:
+        found.append(Violation(method, route, "statements", f"{total} SQL statements (limit {settings.QUERY_AUDIT_MAX_STATEMENTS})"))
+    for statement, count in queries.statements.items():
+        if count > settings.QUERY_AUDIT_MAX_REPEATS:
+            found.append(Violation(method, route, "repeated", f"{count}x {_short(statement)}"))
+    if queries.rows > settings.QUERY_AUDIT_MAX_ROWS:
+        found.append(Violation(method, route, "rows", f"{queries.rows} ORM rows loaded (limit {settings.QUERY_AUDIT_MAX_ROWS})"))
+    for table, statement in sorted(queries.scans):
+        found.append(Violation(method, route, "full_scan", f"{table}: {_short(statement)}"))
+    return found
+
+
+class QueryAuditMiddleware:
+    """ASGI-middleware: собирает SQL запроса и проверяет его после ответа."""
+
+    def __init__(self, app: Any):
+        self.app = app
+        install()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = _RequestQueries()
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or scope.get("path", "")
+            found = _find_violations(scope.get("method", ""), route, queries)
+            for violation in found:
+                logger.warning("query audit: %s", violation)
+            if found:
+                with _violations_lock:
+                    violations.extend(found)
+
+
+def take_violations() -> List[Violation]:
+    """Забирает накопленные нарушения (и очищает список)."""
+    with _violations_lock:
+        found = list(violations)
+        violations.clear()
+    return found
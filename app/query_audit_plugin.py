@@ -0,0 +1,30 @@
+# app/query_audit_plugin.py
+"""pytest-плагин детектора запросов: тест, после которого app.query_audit нашёл
+нарушения (N+1, лишние команды, полный проход по таблице), падает.
+
+    pytest -p app.query_audit_plugin
+
+Плагин включает QUERY_AUDIT до импорта приложения, поэтому FastAPI-приложение,
+поднятое в тестах через TestClient, собирается уже с QueryAuditMiddleware.
+Отдельный тест можно освободить меткой `@pytest.mark.query_audit_skip`.
+"""
+import os
+
+import pytest
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    os.environ.setdefault("QUERY_AUDIT", "true")
+    config.addinivalue_line("markers", "query_audit_skip: do not fail the test on query audit violations")
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item: pytest.Item):
+    from .query_audit import take_violations
+
+    take_violations()
+    result = yield
+    found = take_violations()
+    if found and item.get_closest_marker("query_audit_skip") is None:
+        pytest.fail("query audit violations:\n" + "\n".join(f"  {v}" for v in found), pytrace=False)
+    return result
@@ -0,0 +1,26 @@
+# app/responses.py
+"""Сериализация JSON-ответов.
+
+Приложение по умолчанию отвечает через ORJSONResponse (default_response_class).
+Эндпоинты, которые сами собирают объект схемы или словарь ровно по схеме,
+возвращают его через `trusted_json`: FastAPI не валидирует такой ответ повторно
+по response_model и не прогоняет его через jsonable_encoder, а response_model
+остаётся в декораторе для OpenAPI. Замеры — bench/serialization.py.
+"""
+from typing import Any, Dict, Mapping, Optional, Union
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def trusted_json(
+    content: Union[BaseModel, Dict[str, Any]],
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Готовый JSON-ответ без валидации; словарь должен содержать все поля схемы (включая значения по умолчанию)."""
+    if isinstance(content, BaseModel):
+        # Rust-сериализатор pydantic быстрее, чем model_dump() + orjson
+        return Response(content.model_dump_json(), status_code=status_code, headers=headers, media_type="application/json")
+    return ORJSONResponse(content, status_code=status_code, headers=headers)
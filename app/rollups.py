@@ -0,0 +1,204 @@
+# app/rollups.py
+"""Инкрементальное обновление DailySummary и его пересборка из сырых логов.
+
+Таблицу по существующим логам заполняет миграция 8f2d6c0b5e41; пересборка нужна
+только для починки (например, после правки логов в обход приложения):
+`python -m app.rollups [--user-id N ...] [--chunk-size 500]`
+"""
+import argparse
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from .dashboard_cache import mark_dirty
+from .models import DailySummary, MealLog, WaterLog, WeightLog, User
+from .queries import day_of, weight_for_day
+
+
+MEAL_FIELDS = ("kcal", "protein_g", "fat_g", "carbs_g", "sugar_g", "fiber_g", "salt_g")
+
+
+# ======================================================
+#  Deltas (вызываются в той же транзакции, что и запись лога)
+# ======================================================
+
+def _upsert(session: Session, user_id: int, day: date, deltas: Dict[str, float], replace: Dict[str, Optional[float]] = None) -> None:
+    """INSERT ... ON CONFLICT (user_id, day) DO UPDATE: суммирует `deltas`, перезаписывает `replace`.
+
+    Каждый вызов увеличивает version дня — по ней строится ETag дашборда.
+    """
+    replace = replace or {}
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    table = DailySummary.__table__
+
+    stmt = insert(table).values(user_id=user_id, day=day, version=1, **deltas, **replace)
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+    set_.update({name: stmt.excluded[name] for name in replace})
+    set_["version"] = table.c.version + 1
+    session.execute(stmt.on_conflict_do_update(index_elements=["user_id", "day"], set_=set_))
+    mark_dirty(session, user_id, day)
+
+
+def meal_delta(meal: MealLog, sign: int = 1) -> Dict[str, float]:
+    deltas = {name: sign * float(getattr(meal, name) or 0) for name in MEAL_FIELDS}
+    deltas["meal_count"] = sign
+    return deltas
+
+
+def water_delta(log: WaterLog, sign: int = 1) -> Dict[str, float]:
+    return {"water_ml": sign * int(log.ml)}
+
+
+def apply_meal_delta(session: Session, meal: MealLog, sign: int = 1) -> None:
+    """Добавляет (sign=1) или вычитает (sign=-1) приём пищи из сводки его дня."""
+    _upsert(session, meal.user_id, meal.eaten_at.date(), meal_delta(meal, sign))
+
+
+def apply_water_delta(session: Session, log: WaterLog, sign: int = 1) -> None:
+    _upsert(session, log.user_id, log.drank_at.date(), water_delta(log, sign))
+
+
+class DeltaBatch:
+    """Копит дельты по (user_id, день) и пишет их одним upsert на день.
+
+    Для пакетных операций: сотня логов воды за один день — один UPSERT, а не сто.
+    """
+
+    def __init__(self) -> None:
+        self.deltas: Dict[Tuple[int, date], Dict[str, float]] = {}
+        self.weight_days: set = set()
+
+    def add(self, user_id: int, day: date, deltas: Dict[str, float]) -> None:
+        acc = self.deltas.setdefault((user_id, day), {})
+        for name, value in deltas.items():
+            acc[name] = acc.get(name, 0) + value
+
+    def meal(self, meal: MealLog, sign: int = 1) -> None:
+        self.add(meal.user_id, meal.eaten_at.date(), meal_delta(meal, sign))
+
+    def water(self, log: WaterLog, sign: int = 1) -> None:
+        self.add(log.user_id, log.drank_at.date(), water_delta(log, sign))
+
+    def weight(self, user_id: int, day: date) -> None:
+        self.weight_days.add((user_id, day))
+
+    def apply(self, session: Session) -> None:
+        """Вызывать после flush, чтобы refresh_day_weight видел новые измерения."""
+        for (user_id, day), deltas in sorted(self.deltas.items()):
+            # даже нулевая сумма (например, перенос времени приёма) меняет день — upsert поднимет version
+            _upsert(session, user_id, day, deltas)
+        for user_id, day in sorted(self.weight_days):
+            refresh_day_weight(session, user_id, day)
+        self.deltas.clear()
+        self.weight_days.clear()
+
+
+def bump_user_version(session: Session, user_id: int) -> None:
+    """Профиль, цель или список веса изменились — сбрасывает ETag дашборда и /api/weight."""
+    session.execute(update(User).where(User.id == user_id).values(version=User.version + 1))
+    mark_dirty(session, user_id)
+
+
+def refresh_day_weight(session: Session, user_id: int, day: date) -> None:
+    """Вес нельзя сложить дельтой — перечитываем последнее измерение за день."""
+    row = session.exec(weight_for_day(user_id, day)).first()
+    _upsert(session, user_id, day, {}, replace={"weight_kg": row.kg if row else None})
+    bump_user_version(session, user_id)
+
+
+# ======================================================
+#  Rebuild
+# ======================================================
+
+def _rebuild_chunk(session: Session, user_ids: List[int]) -> int:
+    rows: Dict[Tuple[int, date], Dict[str, object]] = {}
+
+    def row_for(user_id: int, day: date) -> Dict[str, object]:
+        return rows.setdefault((user_id, day), {"user_id": user_id, "day": day})
+
+    meal_day = day_of(MealLog.eaten_at)
+    meal_stmt = (
+        select(
+            MealLog.user_id, meal_day.label("day"),
+            *[func.coalesce(func.sum(getattr(MealLog, name)), 0.0).label(name) for name in MEAL_FIELDS],
+            func.count().label("meal_count"),
+        )
+        .where(MealLog.user_id.in_(user_ids))
+        .group_by(MealLog.user_id, meal_day)
+    )
+    for r in session.exec(meal_stmt):
+        row_for(r.user_id, r.day).update({name: getattr(r, name) for name in (*MEAL_FIELDS, "meal_count")})
+
+    water_day = day_of(WaterLog.drank_at)
+    water_stmt = (
+        select(WaterLog.user_id, water_day.label("day"), func.sum(WaterLog.ml).label("water_ml"))
+        .where(WaterLog.user_id.in_(user_ids))
+        .group_by(WaterLog.user_id, water_day)
+    )
+    for r in session.exec(water_stmt):
+        row_for(r.user_id, r.day)["water_ml"] = r.water_ml
+
+    weight_stmt = (
+        select(WeightLog.user_id, WeightLog.on_date, WeightLog.kg)
+        .where(WeightLog.user_id.in_(user_ids))
+        .order_by(WeightLog.id.asc())
+    )
+    for r in session.exec(weight_stmt):
+        row_for(r.user_id, r.on_date)["weight_kg"] = r.kg  # последнее измерение побеждает
+
+    # version продолжает расти и после пересборки, чтобы старые ETag не совпали с новыми итогами
+    versions = {
+        (r.user_id, r.day): r.version
+        for r in session.exec(
+            select(DailySummary.user_id, DailySummary.day, DailySummary.version).where(DailySummary.user_id.in_(user_ids))
+        )
+    }
+    for key in versions:
+        row_for(*key)  # опустевшие дни остаются нулевой строкой, чтобы не потерять их version
+    session.execute(delete(DailySummary).where(DailySummary.user_id.in_(user_ids)))
+    for user_id in user_ids:
+        mark_dirty(session, user_id)
+    if rows:
+        session.execute(DailySummary.__table__.insert(), [
+            {**{name: 0.0 for name in MEAL_FIELDS}, "meal_count": 0, "water_ml": 0, "weight_kg": None,
+             "version": versions.get(key, 0) + 1, **r}
+            for key, r in rows.items()
+        ])
+    return len(rows)
+
+
+def rebuild_daily_summaries(session: Session, user_ids: Optional[Iterable[int]] = None, chunk_size: int = 500) -> int:
+    """Пересчитывает DailySummary из MealLog/WaterLog/WeightLog пачками по `chunk_size` пользователей.
+
+    Каждая пачка — отдельная транзакция. Возвращает число записанных строк.
+    """
+    if user_ids is None:
+        user_ids = session.exec(select(User.id).order_by(User.id)).all()
+    user_ids = list(user_ids)
+
+    written = 0
+    for i in range(0, len(user_ids), chunk_size):
+        written += _rebuild_chunk(session, user_ids[i:i + chunk_size])
+        session.commit()
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild DailySummary rollups from raw logs.")
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids", help="Only rebuild these users (repeatable)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Users per transaction")
+    args = parser.parse_args()
+
+    from .db import engine
+
+    with Session(engine) as session:
+        written = rebuild_daily_summaries(session, args.user_ids, args.chunk_size)
+    print(f"Rebuilt {written} daily summary rows")
+
+
+if __name__ == "__main__":
+    main()
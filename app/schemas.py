@@ -1,6 +1,6 @@
 from datetime import date, datetime
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
 
 from .models import GoalType
 
@@ -59,6 +59,25 @@ class DashboardResponse(BaseModel):
     totals: Totals
 
 
+# ======================================================
+#  History (multi-day)
+# ======================================================
+
+class HistoryDay(BaseModel):
+    date: date
+    targets: Optional[Targets] = None
+    totals: Totals
+    meal_count: int = 0
+    weight_kg: Optional[float] = None
+
+
+class HistoryResponse(BaseModel):
+    status: str = "ok"
+    date_from: date
+    date_to: date
+    days: List[HistoryDay]
+
+
 # ======================================================
 #  Meal Drafts & Logs
 # ======================================================
@@ -73,6 +92,43 @@ class MealMacros(BaseModel):
     water_ml: Optional[float] = 0
 
 
+# Ответ модели (structured output): по этой схеме строится JSON Schema запроса к
+# Responses API, и ей же валидируется ответ. Все поля обязательны (strict-режим),
+# неизвестное — null.
+
+CookingMethod = Literal[
+    "raw", "boiled", "steamed", "baked", "grilled", "fried", "air-fried", "roasted", "sous-vide", "microwaved",
+    "blanched", "stewed", "braised", "poached", "deep-fried", "pan-seared", "slow-cooked", "mixed-method",
+]
+
+
+class AnalysisMacros(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    protein_g: Optional[float]
+    fat_g: Optional[float]
+    carbohydrates_g: Optional[float]
+    sugar_g: Optional[float]
+    fiber_g: Optional[float]
+    salt_g: Optional[float]
+    water_ml: Optional[float]
+
+
+class MealAnalysisResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    title: Optional[str] = Field(description="Dish name or product (if known)")
+    total_kcal: Optional[float]
+    portion_weight_grams: Optional[float]
+    portion_weight_oz: Optional[float]
+    cooking_method: Optional[CookingMethod]
+    macros: AnalysisMacros
+    satiety_hours: Optional[float]
+    ingredients_detected: List[str]
+    time_of_day: Optional[str] = Field(description="morning, afternoon, evening or night, if it can be inferred")
+    location: Optional[str] = Field(description="e.g. home, restaurant, office, if it can be inferred")
+
+
 class MealDraftCreateRequest(BaseModel):
     image_base64: Optional[str] = None  # картинка от пользователя
     text_description: Optional[str] = None  # текстовое описание еды (если без фото или в дополнение)
@@ -81,7 +137,19 @@ class MealDraftCreateRequest(BaseModel):
 class MealDraftResponse(BaseModel):
     status: str = "ok"
     draft_id: int
-    suggestion: Dict[str, Any]  # данные от GPT для фронта (фильтрованные)
+    draft_status: str = "pending"  # analyzing — результат придёт позже (см. GET /api/meal/draft/{id})
+    suggestion: Optional[Dict[str, Any]] = None  # данные от GPT для фронта (фильтрованные)
+    cache: str = "miss"  # hit | miss — найден ли ответ GPT в кэше
+    image_bytes_saved: int = 0  # на сколько байт уменьшились изображения перед отправкой в GPT
+
+
+class MealDraftStatusResponse(BaseModel):
+    status: str = "ok"
+    draft_id: int
+    draft_status: str  # analyzing | pending | failed | confirmed | deleted
+    suggestion: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    image_bytes_saved: int = 0  # как в MealDraftResponse; для фонового анализа известно после его завершения
 
 
 class MacrosPayload(BaseModel):
@@ -186,4 +254,71 @@ class OnboardingSubmitResponse(BaseModel):
     """Ответ после онбординга: токен, статус операции и сообщение"""
     status: str = "ok"
     token: Optional[str] = None
-    message: Optional[str] = None
\ No newline at end of file
+    message: Optional[str] = None
+
+
+# ======================================================
+#  Offline sync (POST /api/sync/batch)
+# ======================================================
+
+class SyncWaterData(BaseModel):
+    ml: Optional[int] = Field(None, gt=0)
+    drank_at: Optional[datetime] = None
+
+
+class SyncWeightData(BaseModel):
+    kg: Optional[float] = Field(None, gt=0)
+    on_date: Optional[date] = None
+
+
+class SyncMealData(BaseModel):
+    name: Optional[str] = None
+    kcal: Optional[float] = Field(None, ge=0)
+    protein_g: Optional[float] = None
+    fat_g: Optional[float] = None
+    carbs_g: Optional[float] = None
+    sugar_g: Optional[float] = None
+    fiber_g: Optional[float] = None
+    salt_g: Optional[float] = None
+    water_ml: Optional[float] = None
+    eaten_at: Optional[datetime] = None
+    time_of_day: Optional[str] = None
+    location: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    extra_data: Optional[Dict[str, Any]] = None
+
+
+class SyncOperation(BaseModel):
+    """Одна операция из офлайн-очереди клиента"""
+    idempotency_key: str = Field(..., min_length=1, max_length=128)  # генерирует клиент; повтор вернёт тот же результат
+    op: Literal["create", "update", "delete"]
+    type: Literal["water", "weight", "meal"]
+    id: Optional[int] = None  # серверный id — для update/delete
+    data: Dict[str, Any] = {}
+
+
+class SyncBatchRequest(BaseModel):
+    operations: List[SyncOperation]
+
+
+class SyncItemResult(BaseModel):
+    idempotency_key: str
+    status: str  # created | updated | deleted | not_found | invalid
+    id: Optional[int] = None
+    replayed: bool = False  # результат взят из предыдущей отправки того же ключа
+    error: Optional[str] = None
+
+
+class SyncBatchResponse(BaseModel):
+    status: str = "ok"
+    results: List[SyncItemResult]
+
+
+class DeltaSyncResponse(BaseModel):
+    """Изменения после курсора: актуальные строки и id удалённых, по типам (meal | water | weight | goal)"""
+    status: str = "ok"
+    cursor: int  # передать как since в следующем запросе
+    has_more: bool
+    reset: bool = False  # курсор устарел: это первая страница полной синхронизации, локальную копию сбросить
+    changes: Dict[str, List[Dict[str, Any]]]
+    deleted: Dict[str, List[int]]
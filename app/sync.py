@@ -0,0 +1,159 @@
+# app/sync.py
+"""Пакетное применение офлайн-операций клиента (POST /api/sync/batch).
+
+Все операции пачки выполняются в одной транзакции: создания группируются по типу
+и вставляются одним executemany с RETURNING, изменения и удаления читают свои
+строки одним SELECT на тип, а сводки DailySummary обновляются одним upsert на день.
+Результат каждой операции сохраняется в IdempotencyKey под ключом клиента, так что
+повторная отправка той же очереди ничего не дублирует.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, select
+
+from .changes import record_changes
+from .models import IdempotencyKey, MealLog, WaterLog, WeightLog
+from .rollups import DeltaBatch, MEAL_FIELDS
+from .schemas import SyncItemResult, SyncMealData, SyncOperation, SyncWaterData, SyncWeightData
+
+
+SYNC_SCOPE = "sync"
+
+MODELS: Dict[str, Type[SQLModel]] = {"water": WaterLog, "weight": WeightLog, "meal": MealLog}
+DATA_SCHEMAS: Dict[str, Type[BaseModel]] = {"water": SyncWaterData, "weight": SyncWeightData, "meal": SyncMealData}
+REQUIRED_ON_CREATE = {"water": ("ml",), "weight": ("kg",), "meal": ("name", "kcal")}
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+def _row_for_create(kind: str, user_id: int, data: BaseModel, now: datetime) -> Dict[str, Any]:
+    if kind == "water":
+        return {"user_id": user_id, "ml": data.ml, "drank_at": data.drank_at or now}
+    if kind == "weight":
+        return {"user_id": user_id, "kg": float(data.kg), "on_date": data.on_date or date.today()}
+    row = {name: 0.0 for name in MEAL_FIELDS}
+    row.update({"water_ml": 0.0, "time_of_day": None, "location": None, "ingredients": None, "extra_data": None})
+    row.update(data.model_dump(exclude_none=True))
+    row.update({"user_id": user_id, "eaten_at": data.eaten_at or now, "created_at": now})
+    return row
+
+
+def _track(batch: DeltaBatch, kind: str, obj: Any, sign: int) -> None:
+    if kind == "water":
+        batch.water(obj, sign)
+    elif kind == "weight":
+        batch.weight(obj.user_id, obj.on_date)
+    else:
+        batch.meal(obj, sign)
+
+
+def apply_sync_batch(session: Session, user_id: int, operations: List[SyncOperation]) -> List[SyncItemResult]:
+    """Применяет операции (без commit) и возвращает результаты в порядке запроса."""
+    now = datetime.utcnow()
+    results: List[Optional[SyncItemResult]] = [None] * len(operations)
+
+    keys = {op.idempotency_key for op in operations}
+    stored = {
+        r.key: r.response
+        for r in session.exec(
+            select(IdempotencyKey.key, IdempotencyKey.response)
+            .where(IdempotencyKey.user_id == user_id)
+            .where(IdempotencyKey.scope == SYNC_SCOPE)
+            .where(IdempotencyKey.key.in_(keys))
+        )
+    } if keys else {}
+
+    first_by_key: Dict[str, int] = {}
+    duplicates: List[Tuple[int, int]] = []
+    creates: Dict[str, List[Tuple[int, Dict[str, Any]]]] = defaultdict(list)
+    changes: List[Tuple[int, SyncOperation, BaseModel]] = []
+
+    for i, op in enumerate(operations):
+        key = op.idempotency_key
+        if key in stored:
+            results[i] = SyncItemResult(**{**stored[key], "replayed": True})
+            continue
+        if key in first_by_key:
+            duplicates.append((i, first_by_key[key]))
+            continue
+        first_by_key[key] = i
+
+        try:
+            data = DATA_SCHEMAS[op.type].model_validate(op.data)
+        except ValidationError as e:
+            results[i] = SyncItemResult(idempotency_key=key, status="invalid", error=_validation_message(e))
+            continue
+
+        if op.op == "create":
+            missing = [name for name in REQUIRED_ON_CREATE[op.type] if getattr(data, name) is None]
+            if missing:
+                results[i] = SyncItemResult(idempotency_key=key, status="invalid", error=f"Missing fields: {', '.join(missing)}")
+                continue
+            creates[op.type].append((i, _row_for_create(op.type, user_id, data, now)))
+        elif op.id is None:
+            results[i] = SyncItemResult(idempotency_key=key, status="invalid", error=f"id is required for {op.op}")
+        else:
+            changes.append((i, op, data))
+
+    batch = DeltaBatch()
+
+    # --- создания: один INSERT ... RETURNING на тип ---
+    for kind, items in creates.items():
+        model = MODELS[kind]
+        ids = session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, row in items],
+        ).all()
+        for (i, row), new_id in zip(items, ids):
+            results[i] = SyncItemResult(idempotency_key=operations[i].idempotency_key, status="created", id=new_id)
+            _track(batch, kind, model(**row), 1)
+        record_changes(session, user_id, kind, ids)  # вставка мимо ORM — after_flush её не видит
+
+    # --- изменения и удаления: один SELECT на тип, применяются в порядке запроса ---
+    targets: Dict[str, Dict[int, Any]] = {}
+    for kind in {op.type for _, op, _ in changes}:
+        model = MODELS[kind]
+        ids = {op.id for _, op, _ in changes if op.type == kind}
+        targets[kind] = {
+            obj.id: obj
+            for obj in session.exec(select(model).where(model.user_id == user_id).where(model.id.in_(ids)))
+        }
+
+    for i, op, data in changes:
+        obj = targets[op.type].get(op.id)
+        if obj is None:
+            results[i] = SyncItemResult(idempotency_key=op.idempotency_key, status="not_found", id=op.id)
+            continue
+        _track(batch, op.type, obj, -1)
+        if op.op == "delete":
+            session.delete(obj)
+            del targets[op.type][op.id]
+            results[i] = SyncItemResult(idempotency_key=op.idempotency_key, status="deleted", id=op.id)
+            continue
+        for name, value in data.model_dump(exclude_none=True).items():
+            setattr(obj, name, value)
+        session.add(obj)
+        _track(batch, op.type, obj, 1)
+        results[i] = SyncItemResult(idempotency_key=op.idempotency_key, status="updated", id=op.id)
+
+    session.flush()
+    batch.apply(session)
+
+    for i, first in duplicates:
+        results[i] = results[first].model_copy(update={"idempotency_key": operations[i].idempotency_key, "replayed": True})
+
+    records = [
+        {"user_id": user_id, "scope": SYNC_SCOPE, "key": r.idempotency_key, "request_hash": None, "status_code": 200,
+         "response": r.model_dump(mode="json", exclude={"replayed"}), "created_at": now}
+        for i, r in enumerate(results)
+        if not r.replayed and r.status != "invalid"
+    ]
+    if records:
+        session.execute(insert(IdempotencyKey), records)
+    return results
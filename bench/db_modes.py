@@ -0,0 +1,153 @@
+# bench/db_modes.py
+"""Сравнение синхронного (Session в threadpool) и асинхронного (AsyncSession) режимов.
+
+Поднимает uvicorn дважды — с ASYNC_DB=false и ASYNC_DB=true — на одной и той же
+свежей базе, создаёт пользователя через онбординг и гоняет смесь запросов
+(дашборд + логи воды) с фиксированной конкуренцией.
+
+    python bench/db_modes.py --concurrency 200 --duration 20 --write-ratio 0.2
+    DATABASE_URL=postgresql+psycopg://... python bench/db_modes.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ONBOARDING = {
+    "auth": {"name": "bench", "password": "bench-password"},
+    "profile": {"gender": "male", "age": 30, "height_cm": 180, "weight_kg": 80.0},
+    "goal": {"goal_type": "lose", "target_weight_kg": 75},
+    "experience": {"counted_calories_before": None, "training_frequency": None, "steps_per_day": None, "work_type": None},
+    "macros": {"target_calories": 2200, "protein_g": 150, "fat_g": 70, "carbs_g": 250, "fiber_g": 30, "sugar_g": 35},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _prepare_database(env: Dict[str, str]) -> None:
+    code = "from app.db import engine; from app.models import SQLModel; SQLModel.metadata.create_all(engine)"
+    subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, check=True)
+
+
+async def _wait_ready(base_url: str, proc: subprocess.Popen) -> None:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if (await client.get("/healthz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn did not become ready")
+
+
+async def _token(client: httpx.AsyncClient) -> str:
+    await client.post("/api/onboarding/submit", json=ONBOARDING)  # повторный запуск: пользователь уже есть
+    r = await client.post("/api/auth/login", json={"name": ONBOARDING["auth"]["name"], "password": ONBOARDING["auth"]["password"]})
+    r.raise_for_status()
+    return r.json()["token"]
+
+
+async def _load(base_url: str, concurrency: int, duration: float, write_ratio: float) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        client.headers["Authorization"] = f"Bearer {await _token(client)}"
+        latencies: List[float] = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def worker() -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if random.random() < write_ratio:
+                        r = await client.post("/api/water", json={"ml": 100})
+                    else:
+                        r = await client.get("/api/dashboard")
+                    if r.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+    }
+
+
+async def _run_mode(async_db: bool, env: Dict[str, str], args: argparse.Namespace) -> Dict[str, Any]:
+    port = _free_port()
+    env = {**env, "ASYNC_DB": "true" if async_db else "false"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        env=env, cwd=ROOT,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        await _wait_ready(base_url, proc)
+        return {"mode": "async" if async_db else "sync", **await _load(base_url, args.concurrency, args.duration, args.write_ratio)}
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per mode")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of POST /api/water among requests")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-db-")
+    env = {
+        "SECRET_KEY": "bench-secret-key-bench-secret-key",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "OPENAI_API_KEY": "sk-bench",
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "GPT_CACHE_PATH": f"{workdir}/gpt_cache.db",
+        **os.environ,
+        "PYTHONPATH": ROOT,
+    }
+    _prepare_database(env)
+
+    results = [await _run_mode(False, env, args), await _run_mode(True, env, args)]
+    print(json.dumps({"concurrency": args.concurrency, "duration_s": args.duration, "write_ratio": args.write_ratio,
+                      "database": env["DATABASE_URL"].split("://")[0], "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
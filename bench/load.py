@@ -0,0 +1,444 @@
+# bench/load.py
+"""Нагрузочный прогон API: задержки p50/p95/p99, RPS и число SQL-запросов по эндпоинтам.
+
+1. Создаёт свежую базу и засевает `--users` пользователей с историей за `--days`
+   дней — те же блюда, вода и вес, что в init_db_with_seed, пакетными INSERT
+   с пересборкой DailySummary. Токены выпускаются напрямую, без логина.
+2. Поднимает заглушку OpenAI Responses API с фиксированной задержкой
+   (`--gpt-delay-ms`), чтобы POST /api/meal/draft не ходил в сеть.
+3. Запускает uvicorn с этим же файлом в режиме `--serve`: приложение плюс
+   ASGI-обёртка, которая считает SQL-запросы запроса (включая задачи WriteQueue)
+   и отдаёт их в заголовке X-Bench-Queries.
+4. Гоняет смесь запросов с фиксированной конкуренцией и печатает JSON.
+
+    python bench/load.py --users 200 --days 90 --concurrency 50 --duration 20
+    python bench/load.py --mix dashboard=80,water=20 --out before.json
+    python bench/load.py --baseline before.json --max-regression 0.2   # код 1 при росте p95 больше чем на 20%
+    DATABASE_URL=postgresql+psycopg://... python bench/load.py --async-db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from datetime import date, datetime, time as dtime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERY_HEADER = "X-Bench-Queries"
+PASSWORD = "bench-password"
+
+# как в init_db_with_seed: (название, kcal, белки, жиры, углеводы, сахар, клетчатка) и время приёма
+MENUS = [
+    (dtime(8, 0), ("Овсянка с ягодами", 400, 18, 10, 60, 15, 8)),
+    (dtime(13, 0), ("Курица с рисом и овощами", 600, 45, 15, 70, 6, 6)),
+    (dtime(16, 30), ("Йогурт с орехами", 250, 12, 10, 20, 10, 2)),
+    (dtime(19, 0), ("Рыба с картофелем и салатом", 550, 40, 20, 50, 4, 7)),
+]
+WATER = [(dtime(9, 30), 400), (dtime(14, 0), 500), (dtime(20, 0), 300)]
+
+DEFAULT_MIX = "dashboard=60,water=15,weight=10,login=5,meal_draft=10"
+
+
+# ======================================================
+#  Seed
+# ======================================================
+
+def seed(users: int, days: int, chunk: int = 5000) -> Dict[str, Any]:
+    """Засевает базу из DATABASE_URL; возвращает {user_id: token} и время засева."""
+    from sqlalchemy import insert
+    from sqlmodel import Session, SQLModel
+
+    from app.auth import create_access_token, hash_password
+    from app.db import engine
+    from app.models import Goal, GoalType, MealLog, User, WaterLog, WeightLog
+    from app.passwords import password_hasher
+    from app.rollups import rebuild_daily_summaries
+
+    started = time.perf_counter()
+    SQLModel.metadata.create_all(engine)
+    password_hash = hash_password(PASSWORD)  # один bcrypt на всех
+    password_hasher.shutdown()
+    now = datetime.utcnow()
+    today = date.today()
+
+    with Session(engine) as session:
+        user_ids = session.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{"name": f"load-{i}", "password_hash": password_hash, "start_weight_kg": 78.0, "gender": "male",
+              "height_cm": 182, "age": 34, "created_at": now, "updated_at": now, "version": 0} for i in range(users)],
+        ).all()
+        for user_id in user_ids:
+            goal = Goal(user_id=user_id, goal_type=GoalType.lose, calories_kcal=2200, protein_g=150, fat_g=70,
+                        carbs_g=250, sugar_g=35, fiber_g=30)
+            session.add(goal)
+            session.flush()
+            session.get(User, user_id).current_goal_id = goal.id
+        session.commit()
+
+        meals: List[Dict[str, Any]] = []
+        water: List[Dict[str, Any]] = []
+        weight: List[Dict[str, Any]] = []
+
+        def flush(force: bool = False) -> None:
+            for model, rows in ((MealLog, meals), (WaterLog, water), (WeightLog, weight)):
+                if rows and (force or len(rows) >= chunk):
+                    session.execute(insert(model), rows)
+                    rows.clear()
+
+        for user_id in user_ids:
+            for i in range(days):
+                d = today - timedelta(days=i)
+                for at, (name, kcal, protein, fat, carbs, sugar, fiber) in MENUS:
+                    meals.append({"user_id": user_id, "eaten_at": datetime.combine(d, at), "name": name, "kcal": kcal,
+                                  "protein_g": protein, "fat_g": fat, "carbs_g": carbs, "sugar_g": sugar, "fiber_g": fiber,
+                                  "salt_g": 0, "water_ml": 0, "created_at": now})
+                for at, ml in WATER:
+                    water.append({"user_id": user_id, "drank_at": datetime.combine(d, at), "ml": ml})
+                weight.append({"user_id": user_id, "on_date": d, "kg": round(78.0 - i * 0.05, 2)})
+            flush()
+        flush(force=True)
+        session.commit()
+        rebuild_daily_summaries(session)
+
+    tokens = {user_id: create_access_token({"sub": str(user_id)}) for user_id in user_ids}
+    return {"tokens": tokens, "seconds": round(time.perf_counter() - started, 1)}
+
+
+# ======================================================
+#  OpenAI stub
+# ======================================================
+
+def _stub_response(text: str) -> Dict[str, Any]:
+    return {
+        "id": "resp_bench", "object": "response", "created_at": 0, "model": "bench", "status": "completed",
+        "output": [{"type": "message", "id": "msg_bench", "role": "assistant", "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+        "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+        "usage": {"input_tokens": 900, "output_tokens": 150, "total_tokens": 1050,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+
+def start_openai_stub(delay_seconds: float) -> Tuple[ThreadingHTTPServer, str]:
+    """Заглушка POST /v1/responses (без стриминга) с задержкой; возвращает сервер и base_url."""
+    suggestion = json.dumps({
+        "title": "Chicken with rice", "total_kcal": 640, "portion_weight_grams": 420, "portion_weight_oz": 14.8,
+        "cooking_method": "grilled",
+        "macros": {"protein_g": 42, "fat_g": 21, "carbohydrates_g": 68, "sugar_g": 6, "fiber_g": 7, "salt_g": 2, "water_ml": 180},
+        "satiety_hours": 4, "ingredients_detected": ["chicken", "rice", "cucumber"], "time_of_day": None, "location": None,
+    })
+    body = json.dumps(_stub_response(suggestion)).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(delay_seconds)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# ======================================================
+#  Server mode (--serve): приложение + счётчик SQL
+# ======================================================
+
+_queries: ContextVar[Optional[List[int]]] = ContextVar("bench_queries", default=None)
+
+
+def _count_query(*args: Any) -> None:
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class QueryCounter:
+    """ASGI-обёртка: число SQL-запросов, выполненных в контексте запроса, в заголовке ответа."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counter = [0]
+        token = _queries.set(counter)
+
+        async def send_with_count(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (QUERY_HEADER.lower().encode(), str(counter[0]).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _queries.reset(token)
+
+
+def serve(port: int) -> None:
+    import uvicorn
+    from sqlalchemy import event
+
+    from app.config import settings
+    from app.db import engine, get_async_engine
+    from app.main import app
+
+    event.listen(engine, "before_cursor_execute", _count_query)
+    if settings.ASYNC_DB:
+        event.listen(get_async_engine().sync_engine, "before_cursor_execute", _count_query)
+    uvicorn.run(QueryCounter(app), host="127.0.0.1", port=port, log_level="warning")
+
+
+# ======================================================
+#  Load
+# ======================================================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ACTIONS:
+            raise SystemExit(f"unknown endpoint in --mix: {name!r} (known: {', '.join(ACTIONS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def _dashboard(client: httpx.AsyncClient, token: str, args: argparse.Namespace) -> httpx.Response:
+    params = {}
+    if random.random() < args.history_share:
+        params["date"] = (date.today() - timedelta(days=random.randrange(args.days))).isoformat()
+    return await client.get("/api/dashboard", params=params, headers={"Authorization": f"Bearer {token}"})
+
+
+async def _water(client: httpx.AsyncClient, token: str, args: argparse.Namespace) -> httpx.Response:
+    return await client.post("/api/water", json={"ml": 250}, headers={"Authorization": f"Bearer {token}"})
+
+
+async def _weight(client: httpx.AsyncClient, token: str, args: argparse.Namespace) -> httpx.Response:
+    return await client.post("/api/weight", json={"kg": round(random.uniform(70, 80), 1)}, headers={"Authorization": f"Bearer {token}"})
+
+
+async def _login(client: httpx.AsyncClient, token: str, args: argparse.Namespace) -> httpx.Response:
+    return await client.post("/api/auth/login", json={"name": f"load-{random.randrange(args.users)}", "password": PASSWORD})
+
+
+async def _meal_draft(client: httpx.AsyncClient, token: str, args: argparse.Namespace) -> httpx.Response:
+    # уникальный текст — промах кэша GPT, запрос идёт в заглушку
+    text = f"chicken with rice #{random.getrandbits(48)}"
+    return await client.post("/api/meal/draft", params={"wait": "true"}, data={"text_description": text},
+                             headers={"Authorization": f"Bearer {token}"})
+
+
+ACTIONS: Dict[str, Callable[[httpx.AsyncClient, str, argparse.Namespace], Any]] = {
+    "dashboard": _dashboard,
+    "water": _water,
+    "weight": _weight,
+    "login": _login,
+    "meal_draft": _meal_draft,
+}
+
+
+async def _wait_ready(base_url: str, proc: subprocess.Popen) -> None:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(200):
+            if proc.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                if (await client.get("/healthz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+async def run_load(base_url: str, tokens: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    samples: Dict[str, Dict[str, List[Any]]] = {name: {"ms": [], "queries": [], "errors": []} for name in names}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        recording = False
+
+        async def worker(deadline: float) -> None:
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    r = await ACTIONS[name](client, random.choice(tokens), args)
+                    status, queries = r.status_code, r.headers.get(QUERY_HEADER)
+                except httpx.HTTPError as e:
+                    status, queries = type(e).__name__, None
+                if not recording:
+                    continue
+                s = samples[name]
+                s["ms"].append((time.perf_counter() - started) * 1000)
+                if queries is not None:
+                    s["queries"].append(int(queries))
+                if status != 200:
+                    s["errors"].append(status)
+
+        if args.warmup > 0:
+            await asyncio.gather(*(worker(time.perf_counter() + args.warmup) for _ in range(args.concurrency)))
+        recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + args.duration) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        cache = (await client.get("/healthz/cache")).json().get("dashboard")
+
+    endpoints = {}
+    for name, s in samples.items():
+        ms, queries = s["ms"], s["queries"]
+        errors: Dict[str, int] = {}
+        for status in s["errors"]:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+        endpoints[name] = {
+            "requests": len(ms),
+            "errors": errors,
+            "rps": round(len(ms) / elapsed, 1),
+            "p50_ms": round(_percentile(ms, 50), 2),
+            "p95_ms": round(_percentile(ms, 95), 2),
+            "p99_ms": round(_percentile(ms, 99), 2),
+            "max_ms": round(max(ms), 2) if ms else 0.0,
+            "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "queries_max": max(queries) if queries else None,
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "endpoints": endpoints,
+        "dashboard_cache": cache,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Эндпоинты, у которых p95 вырос больше чем на `max_regression` относительно baseline."""
+    failures = []
+    for name, current in result["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before["p95_ms"] or not current["requests"]:
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1
+        current["p95_change"] = round(change, 3)
+        if change > max_regression:
+            failures.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms ({change:+.0%})")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=60, help="Days of history per user")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--history-share", type=float, default=0.3, help="Share of dashboard requests for a past day")
+    parser.add_argument("--gpt-delay-ms", type=float, default=300.0, help="Latency of the OpenAI stub")
+    parser.add_argument("--async-db", action="store_true", help="Run the server with ASYNC_DB=true")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the request mix")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="Previous JSON report to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 growth vs baseline (0.2 = 20%%)")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.insert(0, ROOT)
+        serve(args.serve)
+        return
+
+    parse_mix(args.mix)
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    stub, stub_url = start_openai_stub(args.gpt_delay_ms / 1000)
+    env = {
+        "SECRET_KEY": "bench-secret-key-bench-secret-key",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "600",
+        "OPENAI_API_KEY": "sk-bench",
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        **os.environ,
+        "GPT_CACHE_PATH": f"{workdir}/gpt_cache.db",
+        "OPENAI_BASE_URL": stub_url,
+        "ASYNC_DB": "true" if args.async_db else "false",
+        "PYTHONPATH": ROOT,
+    }
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    seeded = seed(args.users, args.days)
+
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], env=env, cwd=workdir)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(_wait_ready(base_url, proc))
+        result = asyncio.run(run_load(base_url, list(seeded["tokens"].values()), args))
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        stub.shutdown()
+
+    report = {
+        "config": {
+            "users": args.users, "days": args.days, "concurrency": args.concurrency, "duration_s": args.duration,
+            "warmup_s": args.warmup, "mix": parse_mix(args.mix), "history_share": args.history_share,
+            "gpt_delay_ms": args.gpt_delay_ms, "async_db": args.async_db,
+            "database": env["DATABASE_URL"].split("://")[0], "seed_s": seeded["seconds"],
+        },
+        **result,
+    }
+    failures = compare(report, json.load(open(args.baseline)), args.max_regression) if args.baseline else []
+    if args.baseline:
+        report["regressions"] = failures
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
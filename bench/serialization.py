@@ -0,0 +1,164 @@
+# bench/serialization.py
+"""Стоимость сериализации ответа по эндпоинтам: до и после перехода на orjson.
+
+"before" — путь FastAPI по умолчанию: валидация и сериализация по response_model
+(или по аннотации возвращаемого типа) в serialize_response, затем JSONResponse (json.dumps).
+"after" — trusted_json, которым эти эндпоинты отвечают теперь. База и сеть не
+участвуют — только сборка тела ответа из уже готовых данных.
+
+    python bench/serialization.py --number 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# настройки без .env: ключи нужны только для импорта приложения
+os.environ.setdefault("SECRET_KEY", "bench-" + "x" * 32)
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.responses import trusted_json  # noqa: E402
+from app.schemas import (  # noqa: E402
+    DashboardResponse, DeltaSyncResponse, HistoryDay, HistoryResponse, MealItem, SyncBatchResponse,
+    SyncItemResult, Targets, Totals, WaterItem, WeightBlock,
+)
+
+
+# ======================================================
+#  Payloads (типичные размеры ответов)
+# ======================================================
+
+def _targets() -> Targets:
+    return Targets(goal="lose", calories=2200, protein_g=150, fat_g=70, carbs_g=250, sugar_g=35, fiber_g=30)
+
+
+def dashboard() -> DashboardResponse:
+    meals = [MealItem(time=f"{8 + i:02d}:00", name=f"meal {i}", kcal=450.5, protein_g=30.0, fat_g=15.0,
+                      carbs_g=50.0, sugar_g=5.0, fiber_g=4.0) for i in range(8)]
+    water = [WaterItem(time=f"{9 + i:02d}:30", ml=250) for i in range(6)]
+    totals = Totals(kcal=3604.0, protein_g=240.0, fat_g=120.0, carbs_g=400.0, sugar_g=40.0, fiber_g=32.0, water_ml=1500)
+    return DashboardResponse(date=date.today(), targets=_targets(), meals=meals, water=water,
+                             weight=WeightBlock(start_kg=80.0, today_kg=78.4), totals=totals)
+
+
+def history(days: int = 31) -> HistoryResponse:
+    start = date.today() - timedelta(days=days - 1)
+    totals = Totals(kcal=2100.0, protein_g=140.0, fat_g=70.0, carbs_g=230.0, sugar_g=30.0, fiber_g=25.0, water_ml=2000)
+    items = [HistoryDay(date=start + timedelta(days=i), targets=_targets(), totals=totals, meal_count=4, weight_kg=78.0)
+             for i in range(days)]
+    return HistoryResponse(date_from=start, date_to=date.today(), days=items)
+
+
+def meal_draft() -> Dict[str, Any]:
+    suggestion = {
+        "title": "Chicken with rice", "total_kcal": 640.0, "portion_weight_grams": 420.0, "portion_weight_oz": 14.8,
+        "cooking_method": "grilled",
+        "macros": {"protein_g": 42.0, "fat_g": 21.0, "carbohydrates_g": 68.0, "sugar_g": 6.0, "fiber_g": 7.0, "salt_g": 2.1, "water_ml": 180.0},
+        "satiety_hours": 4.0,
+        "ingredients_detected": [f"ingredient {i}" for i in range(12)],
+        "time_of_day": "evening", "location": "home",
+    }
+    return {"status": "ok", "draft_id": 1, "draft_status": "pending", "suggestion": suggestion, "cache": "miss", "image_bytes_saved": 0}
+
+
+def sync_batch(n: int = 500) -> SyncBatchResponse:
+    return SyncBatchResponse(results=[SyncItemResult(idempotency_key=f"k{i}", status="created", id=i) for i in range(n)])
+
+
+def delta_sync(n: int = 500) -> DeltaSyncResponse:
+    now = datetime.utcnow()
+    meals = [{"id": i, "user_id": 1, "name": f"meal {i}", "kcal": 500.0, "protein_g": 30.0, "fat_g": 15.0, "carbs_g": 50.0,
+              "sugar_g": 5.0, "fiber_g": 4.0, "salt_g": 1.0, "water_ml": 0.0, "eaten_at": now, "created_at": now,
+              "draft_id": None, "time_of_day": None, "location": None, "ingredients": None, "extra_data": None}
+             for i in range(n)]
+    return DeltaSyncResponse(cursor=n, has_more=False, changes={"meal": meals, "water": [], "weight": [], "goal": []},
+                             deleted={"meal": [], "water": [], "weight": [], "goal": []})
+
+
+def weight_list(n: int = 365) -> Dict[str, Any]:
+    start = date.today() - timedelta(days=n)
+    return {"status": "ok", "items": [{"id": i, "on_date": start + timedelta(days=i), "kg": 80.0 - i * 0.01} for i in range(n)]}
+
+
+# ======================================================
+#  Before / after
+# ======================================================
+
+def _route(path: str, method: str) -> APIRoute:
+    return next(r for r in app.routes if isinstance(r, APIRoute) and r.path == path and method in r.methods)
+
+
+def _run_sync(coro: Any) -> Any:
+    """serialize_response при is_coroutine=True ничего не ждёт — выполняем без цикла событий."""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("serialize_response suspended unexpectedly")
+
+
+def _default_path(path: str, method: str) -> Callable[[Any], bytes]:
+    """Старый путь: response_model-валидация (если есть) + jsonable_encoder + JSONResponse."""
+    field = _route(path, method).response_field
+
+    def render(content: Any) -> bytes:
+        data = _run_sync(serialize_response(field=field, response_content=content)) if field else jsonable_encoder(content)
+        return JSONResponse(data).body
+    return render
+
+
+CASES: List[Tuple[str, str, str, Callable[[], Any], Callable[[Any], bytes]]] = [
+    ("GET", "/api/dashboard", "dashboard", dashboard, lambda c: trusted_json(c).body),
+    ("GET", "/api/history", "history (31 days)", history, lambda c: trusted_json(c).body),
+    ("POST", "/api/meal/draft", "meal draft (GPT suggestion)", meal_draft, lambda c: trusted_json(c).body),
+    ("POST", "/api/sync/batch", "sync batch (500 results)", sync_batch, lambda c: trusted_json(c).body),
+    ("GET", "/api/sync", "delta sync (500 meals)", delta_sync, lambda c: trusted_json(c).body),
+    ("GET", "/api/weight", "weight list (365 items)", weight_list, lambda c: trusted_json(c).body),
+]
+
+
+def _per_call_us(fn: Callable[[], Any], number: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=1000, help="iterations per case")
+    args = parser.parse_args()
+
+    results = []
+    for method, path, name, payload, after in CASES:
+        content = payload()
+        before = _default_path(path, method)
+        before_us = _per_call_us(lambda: before(content), args.number)
+        after_us = _per_call_us(lambda: after(content), args.number)
+        same = json.loads(before(content)) == json.loads(after(content))
+        results.append({
+            "endpoint": f"{method} {path}",
+            "case": name,
+            "bytes": len(after(content)),
+            "before_us": round(before_us, 1),
+            "after_us": round(after_us, 1),
+            "speedup": round(before_us / after_us, 2) if after_us else None,
+            "same_json": same,
+        })
+    print(json.dumps({"number": args.number, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,15 @@ import sqlalchemy as sa
 import sqlmodel
 from sqlmodel.sql import sqltypes
 from app.models import SQLModel
+from app.config import settings
 
 # Alembic config
 config = context.config
 
+# URL базы берём из Settings (DATABASE_URL), как и приложение; alembic.ini — только запасной вариант
+if settings.DATABASE_URL:
+    config.set_main_option("sqlalchemy.url", settings.DATABASE_URL.replace("%", "%%"))
+
 # Logging config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
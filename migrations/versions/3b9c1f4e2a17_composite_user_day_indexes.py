@@ -0,0 +1,32 @@
+"""composite user/day indexes
+
+Revision ID: 3b9c1f4e2a17
+Revises: e7fd6addd923
+Create Date: 2026-10-18 09:12:05.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9c1f4e2a17'
+down_revision: Union[str, Sequence[str], None] = 'e7fd6addd923'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_meallog_user_id_eaten_at', 'meallog', ['user_id', 'eaten_at'], unique=False)
+    op.create_index('ix_waterlog_user_id_drank_at', 'waterlog', ['user_id', 'drank_at'], unique=False)
+    op.create_index('ix_weightlog_user_id_on_date', 'weightlog', ['user_id', 'on_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_weightlog_user_id_on_date', table_name='weightlog')
+    op.drop_index('ix_waterlog_user_id_drank_at', table_name='waterlog')
+    op.drop_index('ix_meallog_user_id_eaten_at', table_name='meallog')
@@ -0,0 +1,41 @@
+"""add idempotencykey
+
+Revision ID: 5d8e2b7c9f10
+Revises: c41a7d9e0b23
+Create Date: 2026-10-18 15:20:44.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8e2b7c9f10'
+down_revision: Union[str, Sequence[str], None] = 'c41a7d9e0b23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('idempotencykey',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('scope', sa.String(), nullable=False),
+    sa.Column('key', sa.String(length=128), nullable=False),
+    sa.Column('response', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_idempotencykey_user_id_scope_key', 'idempotencykey', ['user_id', 'scope', 'key'], unique=True)
+    op.create_index(op.f('ix_idempotencykey_created_at'), 'idempotencykey', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_idempotencykey_created_at'), table_name='idempotencykey')
+    op.drop_index('ix_idempotencykey_user_id_scope_key', table_name='idempotencykey')
+    op.drop_table('idempotencykey')
@@ -0,0 +1,70 @@
+"""add dailysummary
+
+Revision ID: 8f2d6c0b5e41
+Revises: 3b9c1f4e2a17
+Create Date: 2026-10-18 11:47:29.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2d6c0b5e41'
+down_revision: Union[str, Sequence[str], None] = '3b9c1f4e2a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MEAL_FIELDS = ('kcal', 'protein_g', 'fat_g', 'carbs_g', 'sugar_g', 'fiber_g', 'salt_g')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('dailysummary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('kcal', sa.Float(), nullable=False),
+    sa.Column('protein_g', sa.Float(), nullable=False),
+    sa.Column('fat_g', sa.Float(), nullable=False),
+    sa.Column('carbs_g', sa.Float(), nullable=False),
+    sa.Column('sugar_g', sa.Float(), nullable=False),
+    sa.Column('fiber_g', sa.Float(), nullable=False),
+    sa.Column('salt_g', sa.Float(), nullable=False),
+    sa.Column('meal_count', sa.Integer(), nullable=False),
+    sa.Column('water_ml', sa.Integer(), nullable=False),
+    sa.Column('weight_kg', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dailysummary_user_id_day', 'dailysummary', ['user_id', 'day'], unique=True)
+
+    # Сводки по уже существующим логам: дашборд и история читают итоги только отсюда
+    if op.get_bind().dialect.name == 'postgresql':
+        day_of = lambda col: f"CAST({col} AS DATE)"  # noqa: E731
+    else:
+        day_of = lambda col: f"date({col})"  # noqa: E731
+    zeros = ", ".join(f"0.0 AS {name}" for name in MEAL_FIELDS)
+    meals = ", ".join(f"COALESCE({name}, 0.0) AS {name}" for name in MEAL_FIELDS)
+    sums = ", ".join(f"SUM({name})" for name in MEAL_FIELDS)
+    op.execute(
+        f"INSERT INTO dailysummary (user_id, day, {', '.join(MEAL_FIELDS)}, meal_count, water_ml, weight_kg) "
+        f"SELECT user_id, day, {sums}, SUM(meal_count), SUM(water_ml), MAX(weight_kg) FROM ("
+        f"  SELECT user_id, {day_of('eaten_at')} AS day, {meals}, 1 AS meal_count, 0 AS water_ml, CAST(NULL AS FLOAT) AS weight_kg"
+        f"  FROM meallog"
+        f"  UNION ALL"
+        f"  SELECT user_id, {day_of('drank_at')}, {zeros}, 0, ml, NULL FROM waterlog"
+        f"  UNION ALL"
+        # последнее измерение за день, как в app/rollups.py
+        f"  SELECT w.user_id, w.on_date, {zeros}, 0, 0, w.kg FROM weightlog w"
+        f"  WHERE w.id = (SELECT MAX(x.id) FROM weightlog x WHERE x.user_id = w.user_id AND x.on_date = w.on_date)"
+        f") AS logs GROUP BY user_id, day"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dailysummary_user_id_day', table_name='dailysummary')
+    op.drop_table('dailysummary')
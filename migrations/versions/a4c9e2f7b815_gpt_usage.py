@@ -0,0 +1,54 @@
+"""gpt usage accounting
+
+Revision ID: a4c9e2f7b815
+Revises: f3a8d1c6b247
+Create Date: 2026-10-18 21:26:53.804119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f7b815'
+down_revision: Union[str, Sequence[str], None] = 'f3a8d1c6b247'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('dailygptusage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('calls', sa.Integer(), nullable=False),
+    sa.Column('cache_hits', sa.Integer(), nullable=False),
+    sa.Column('input_tokens', sa.Integer(), nullable=False),
+    sa.Column('output_tokens', sa.Integer(), nullable=False),
+    sa.Column('images', sa.Integer(), nullable=False),
+    sa.Column('latency_ms', sa.Integer(), nullable=False),
+    sa.Column('cost_usd', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dailygptusage_user_id_day', 'dailygptusage', ['user_id', 'day'], unique=True)
+    with op.batch_alter_table('mealdraft') as batch_op:
+        batch_op.add_column(sa.Column('gpt_model', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('input_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('output_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('latency_ms', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('mealdraft') as batch_op:
+        batch_op.drop_column('latency_ms')
+        batch_op.drop_column('image_count')
+        batch_op.drop_column('output_tokens')
+        batch_op.drop_column('input_tokens')
+        batch_op.drop_column('gpt_model')
+    op.drop_index('ix_dailygptusage_user_id_day', table_name='dailygptusage')
+    op.drop_table('dailygptusage')
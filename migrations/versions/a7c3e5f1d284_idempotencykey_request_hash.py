@@ -0,0 +1,32 @@
+"""idempotencykey request hash and status code
+
+Revision ID: a7c3e5f1d284
+Revises: 5d8e2b7c9f10
+Create Date: 2026-10-18 16:41:09.227310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f1d284'
+down_revision: Union[str, Sequence[str], None] = '5d8e2b7c9f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('idempotencykey') as batch_op:
+        batch_op.add_column(sa.Column('request_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('status_code', sa.Integer(), nullable=False, server_default='200'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('idempotencykey') as batch_op:
+        batch_op.drop_column('status_code')
+        batch_op.drop_column('request_hash')
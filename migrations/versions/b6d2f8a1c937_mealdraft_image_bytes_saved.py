@@ -0,0 +1,30 @@
+"""mealdraft image bytes saved
+
+Revision ID: b6d2f8a1c937
+Revises: a4c9e2f7b815
+Create Date: 2026-10-19 10:05:12.417730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2f8a1c937'
+down_revision: Union[str, Sequence[str], None] = 'a4c9e2f7b815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('mealdraft') as batch_op:
+        batch_op.add_column(sa.Column('image_bytes_saved', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('mealdraft') as batch_op:
+        batch_op.drop_column('image_bytes_saved')
@@ -0,0 +1,47 @@
+"""jsonb on postgresql
+
+Revision ID: c41a7d9e0b23
+Revises: 8f2d6c0b5e41
+Create Date: 2026-10-18 14:05:12.381954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a7d9e0b23'
+down_revision: Union[str, Sequence[str], None] = '8f2d6c0b5e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# На SQLite JSON и JSONB хранятся одинаково — миграция меняет тип только на PostgreSQL
+JSON_COLUMNS = [
+    ('mealdraft', 'gpt_result'),
+    ('mealdraft', 'visible_data'),
+    ('meallog', 'ingredients'),
+    ('meallog', 'extra_data'),
+    ('onboardingsubmission', 'data'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in JSON_COLUMNS:
+        op.alter_column(table, column, type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                        postgresql_using=f'{column}::jsonb')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in JSON_COLUMNS:
+        op.alter_column(table, column, type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                        postgresql_using=f'{column}::json')
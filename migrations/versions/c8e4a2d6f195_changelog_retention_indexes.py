@@ -0,0 +1,30 @@
+"""changelog retention indexes
+
+Revision ID: c8e4a2d6f195
+Revises: b6d2f8a1c937
+Create Date: 2026-10-19 16:42:08.213954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e4a2d6f195'
+down_revision: Union[str, Sequence[str], None] = 'b6d2f8a1c937'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_changelog_changed_at', 'changelog', ['changed_at'], unique=False)
+    op.create_index('ix_changelog_entity_entity_id_id', 'changelog', ['entity', 'entity_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_changelog_entity_entity_id_id', table_name='changelog')
+    op.drop_index('ix_changelog_changed_at', table_name='changelog')
@@ -0,0 +1,49 @@
+"""add changelog
+
+Revision ID: d2f6a8b4c013
+Revises: a7c3e5f1d284
+Create Date: 2026-10-18 17:58:31.640275
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6a8b4c013'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e5f1d284'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRACKED = [('meallog', 'meal'), ('waterlog', 'water'), ('weightlog', 'weight'), ('goal', 'goal')]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('changelog',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_changelog_user_id_id', 'changelog', ['user_id', 'id'], unique=False)
+
+    # Существующие строки попадают в журнал, чтобы первая синхронизация (since=0) их вернула
+    for table, entity in TRACKED:
+        op.execute(
+            f"INSERT INTO changelog (user_id, entity, entity_id, op, changed_at) "
+            f"SELECT user_id, '{entity}', id, 'upsert', CURRENT_TIMESTAMP FROM {table} ORDER BY id"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_changelog_user_id_id', table_name='changelog')
+    op.drop_table('changelog')
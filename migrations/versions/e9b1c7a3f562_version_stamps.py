@@ -0,0 +1,34 @@
+"""version stamps for etags
+
+Revision ID: e9b1c7a3f562
+Revises: d2f6a8b4c013
+Create Date: 2026-10-18 19:12:47.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9b1c7a3f562'
+down_revision: Union[str, Sequence[str], None] = 'd2f6a8b4c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+    with op.batch_alter_table('dailysummary') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('dailysummary') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,28 @@
+"""user name index
+
+Revision ID: f3a8d1c6b247
+Revises: e9b1c7a3f562
+Create Date: 2026-10-18 20:41:09.527361
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8d1c6b247'
+down_revision: Union[str, Sequence[str], None] = 'e9b1c7a3f562'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_user_name'), 'user', ['name'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_name'), table_name='user')
@@ -0,0 +1,61 @@
+# tests/conftest.py
+"""Общие фикстуры: приложение на временной SQLite-базе с включённым QUERY_AUDIT.
+
+Переменные окружения ставятся до импорта app (Settings читаются один раз при импорте),
+поэтому app импортируется только внутри фикстур.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+
+pytest_plugins = ["app.query_audit_plugin"]
+
+_data_dir = tempfile.mkdtemp(prefix="calorie-tracker-tests-")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-test-secret-key-0000")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_data_dir}/test.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("GPT_CACHE_PATH", f"{_data_dir}/gpt_cache.db")
+# модель в тестах недоступна: фоновый анализ драфта быстро падает с ошибкой соединения
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+
+ONBOARDING = {
+    "auth": {"name": "tester", "password": "secret"},
+    "profile": {"gender": "male", "age": 34, "height_cm": 182, "weight_kg": 78.0},
+    "goal": {"goal_type": "lose", "target_weight_kg": 72},
+    "experience": {"counted_calories_before": None, "training_frequency": None, "steps_per_day": None, "work_type": None},
+    "macros": {"target_calories": 2200, "protein_g": 150, "fat_g": 70, "carbs_g": 250, "fiber_g": 30, "sugar_g": 35},
+}
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from sqlmodel import SQLModel
+
+    from app.db import engine
+    from app.main import app
+
+    SQLModel.metadata.create_all(engine)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(client):
+    """Новый пользователь на каждый тестовый модуль — модули не видят данных друг друга."""
+    payload = {**ONBOARDING, "auth": {**ONBOARDING["auth"], "name": f"tester-{uuid.uuid4().hex[:8]}"}}
+    r = client.post("/api/onboarding/submit", json=payload)
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture(scope="module")
+def user_id(auth_headers):
+    from app.auth import user_id_from_token
+
+    return user_id_from_token(auth_headers["Authorization"].split()[1])
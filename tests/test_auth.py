@@ -0,0 +1,41 @@
+# tests/test_auth.py
+"""Вход и прозрачное перехэширование пароля при смене BCRYPT_ROUNDS."""
+import bcrypt
+import pytest
+from sqlmodel import Session, SQLModel
+
+from app import auth
+from app.config import settings
+from app.db import make_engine
+from app.models import User
+from app.writer import WriteQueue
+
+
+@pytest.mark.parametrize("tuned", [True, False], ids=["wal", "rollback-journal"])
+def test_login_rehashes_password(client, tmp_path, monkeypatch, tuned):
+    # без WAL открытая читающая транзакция логина не даёт писателю закоммитить новый хэш
+    monkeypatch.setattr(settings, "SQLITE_TUNED", tuned)
+    engine = make_engine(f"sqlite:///{tmp_path}/auth.db")
+    SQLModel.metadata.create_all(engine)
+    writer = WriteQueue(engine)
+    monkeypatch.setattr(auth, "engine", engine)
+    monkeypatch.setattr(auth, "db_writer", writer)
+
+    old_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS + 1)).decode()
+    with Session(engine) as session:
+        session.add(User(name="rehash", password_hash=old_hash))
+        session.commit()
+
+    try:
+        r = client.post("/api/auth/login", json={"name": "rehash", "password": "secret"})
+        assert r.status_code == 200, r.text
+        with Session(engine) as session:
+            user = session.get(User, 1)
+            assert user.password_hash != old_hash
+            assert not auth.needs_rehash(user.password_hash)
+
+        assert client.post("/api/auth/login", json={"name": "rehash", "password": "secret"}).status_code == 200
+        assert client.post("/api/auth/login", json={"name": "rehash", "password": "wrong"}).status_code == 401
+    finally:
+        writer.stop()
+        engine.dispose()
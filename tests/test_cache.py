@@ -0,0 +1,27 @@
+# tests/test_cache.py
+"""TwoTierCache: вытеснение по размеру по счётчику и пересчёт при перезапуске."""
+from app.cache import TwoTierCache
+
+
+def _disk_total(cache: TwoTierCache) -> int:
+    return cache._db().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+
+def test_evicts_least_recently_read_over_max_bytes(tmp_path):
+    cache = TwoTierCache(str(tmp_path / "cache.db"), memory_items=0, max_bytes=400)
+    for i in range(5):
+        cache.put(f"k{i}", {"v": "x" * 80})
+        if i == 1:
+            assert cache.get("k0") is not None  # k0 прочитан — вытесняется позже k1
+    assert cache._total == _disk_total(cache) <= 400
+    assert cache.get("k1") is None
+    assert cache.get("k0") is not None and cache.get("k4") is not None
+
+    cache.put("k4", {"v": "y"})  # перезапись уменьшает счётчик на старый размер
+    assert cache._total == _disk_total(cache)
+    cache.close()
+
+    reopened = TwoTierCache(str(tmp_path / "cache.db"), max_bytes=400)
+    assert reopened.get("k4") == {"v": "y"}
+    assert reopened._total == _disk_total(reopened)
+    reopened.close()
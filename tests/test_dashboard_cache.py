@@ -0,0 +1,80 @@
+# tests/test_dashboard_cache.py
+"""Кэш дашборда: повторный GET из памяти, запись сбрасывает кэш после коммита."""
+from datetime import date, datetime
+
+import pytest
+from sqlmodel import Session
+
+from app.dashboard_cache import dashboard_cache
+from app.db import db_writer
+from app.models import MealLog
+from app.rollups import apply_meal_delta
+
+
+def _dashboard(client, auth_headers):
+    """(ответ, было ли попадание в кэш)."""
+    hits = dashboard_cache.stats()["hits"]
+    r = client.get("/api/dashboard", headers=auth_headers)
+    assert r.status_code == 200
+    return r.json(), dashboard_cache.stats()["hits"] == hits + 1
+
+
+@pytest.fixture
+def warm(client, auth_headers):
+    _dashboard(client, auth_headers)
+    body, hit = _dashboard(client, auth_headers)
+    assert hit
+    return body
+
+
+def test_water_invalidates(client, auth_headers, warm):
+    client.post("/api/water", json={"ml": 300}, headers=auth_headers)
+    body, hit = _dashboard(client, auth_headers)
+    assert not hit
+    assert body["totals"]["water_ml"] == warm["totals"]["water_ml"] + 300
+
+
+def test_meal_write_and_delete_invalidate(client, auth_headers, user_id, warm):
+    def write(session: Session) -> int:
+        log = MealLog(user_id=user_id, eaten_at=datetime.now(), name="soup",
+                      kcal=250, protein_g=8, fat_g=6, carbs_g=30, sugar_g=4, fiber_g=3)
+        session.add(log)
+        session.flush()
+        apply_meal_delta(session, log)
+        return log.id
+
+    meal_id = db_writer.run(write)
+    body, hit = _dashboard(client, auth_headers)
+    assert not hit
+    assert body["totals"]["kcal"] == warm["totals"]["kcal"] + 250
+
+    _dashboard(client, auth_headers)
+    assert client.delete(f"/api/meal/{meal_id}", headers=auth_headers).json()["status"] == "deleted"
+    body, hit = _dashboard(client, auth_headers)
+    assert not hit
+    assert body["totals"]["kcal"] == warm["totals"]["kcal"]
+
+
+def test_profile_and_weight_invalidate(client, auth_headers, warm):
+    client.patch("/api/user", json={"calories_kcal": 2100}, headers=auth_headers)
+    body, hit = _dashboard(client, auth_headers)
+    assert not hit
+    assert body["targets"]["calories"] == 2100
+
+    _dashboard(client, auth_headers)
+    client.post("/api/weight", json={"kg": 77.0}, headers=auth_headers)
+    _, hit = _dashboard(client, auth_headers)
+    assert not hit
+
+
+def test_stale_put_is_dropped():
+    # читатель взял токен до записи — его ответ в кэш не попадает
+    user_id, day = -1, date(2020, 1, 1)
+    token = dashboard_cache.token(user_id)
+    dashboard_cache.invalidate(user_id)
+    dashboard_cache.put(user_id, day, '"stale"', b"{}", token)
+    assert dashboard_cache.get(user_id, day) is None
+
+    dashboard_cache.put(user_id, day, '"fresh"', b"{}", dashboard_cache.token(user_id))
+    assert dashboard_cache.get(user_id, day) == ('"fresh"', b"{}")
+    dashboard_cache.invalidate(user_id)
@@ -0,0 +1,48 @@
+# tests/test_etags.py
+"""ETag / If-None-Match для дашборда и списка веса."""
+from datetime import date
+
+
+def test_dashboard_304_until_day_changes(client, auth_headers):
+    first = client.get("/api/dashboard", headers=auth_headers)
+    etag = first.headers["ETag"]
+    conditional = {**auth_headers, "If-None-Match": etag}
+
+    r = client.get("/api/dashboard", headers=conditional)
+    assert r.status_code == 304 and r.content == b""
+    assert r.headers["ETag"] == etag
+
+    client.post("/api/water", json={"ml": 200}, headers=auth_headers)
+    r = client.get("/api/dashboard", headers=conditional)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()["totals"]["water_ml"] == first.json()["totals"]["water_ml"] + 200
+
+    # другой день — свой ETag
+    other = client.get("/api/dashboard", params={"date": "2020-01-01"}, headers=conditional)
+    assert other.status_code == 200
+
+
+def test_profile_change_invalidates_dashboard_etag(client, auth_headers):
+    etag = client.get("/api/dashboard", headers=auth_headers).headers["ETag"]
+    client.patch("/api/user", json={"calories_kcal": 1900}, headers=auth_headers)
+    r = client.get("/api/dashboard", headers={**auth_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["targets"]["calories"] == 1900
+
+
+def test_weight_list_304_until_weight_changes(client, auth_headers):
+    client.post("/api/weight", json={"kg": 80.5}, headers=auth_headers)
+    first = client.get("/api/weight", headers=auth_headers)
+    etag = first.headers["ETag"]
+    conditional = {**auth_headers, "If-None-Match": etag}
+    assert client.get("/api/weight", headers=conditional).status_code == 304
+
+    # фильтр по датам — другой ответ и другой ETag
+    ranged = client.get("/api/weight", params={"date_from": date.today().isoformat()}, headers=conditional)
+    assert ranged.status_code == 200
+
+    client.post("/api/weight", json={"kg": 80.1}, headers=auth_headers)
+    r = client.get("/api/weight", headers=conditional)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
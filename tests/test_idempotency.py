@@ -0,0 +1,47 @@
+# tests/test_idempotency.py
+"""Idempotency-Key: повтор возвращает сохранённый ответ, другое тело с тем же ключом — 422."""
+import io
+import uuid
+
+from PIL import Image
+
+
+def _jpeg(color) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def _key(headers):
+    return {**headers, "Idempotency-Key": uuid.uuid4().hex}
+
+
+def test_json_replay_and_mismatch(client, auth_headers):
+    headers = _key(auth_headers)
+    first = client.post("/api/water", json={"ml": 300}, headers=headers)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    again = client.post("/api/water", json={"ml": 300}, headers=headers)
+    assert again.status_code == 200
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+
+    assert client.post("/api/water", json={"ml": 400}, headers=headers).status_code == 422
+
+
+def test_multipart_replay_and_mismatch(client, auth_headers):
+    headers = _key(auth_headers)
+    photo = ("images", ("meal.jpg", _jpeg("red"), "image/jpeg"))
+    first = client.post("/api/meal/draft", data={"text_description": "oats"}, files=[photo], headers=headers)
+    assert first.status_code == 200, first.text
+
+    again = client.post("/api/meal/draft", data={"text_description": "oats"}, files=[photo], headers=headers)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json()["draft_id"] == first.json()["draft_id"]
+
+    other_photo = ("images", ("meal.jpg", _jpeg("green"), "image/jpeg"))
+    r = client.post("/api/meal/draft", data={"text_description": "oats"}, files=[other_photo], headers=headers)
+    assert r.status_code == 422
+    r = client.post("/api/meal/draft", data={"text_description": "rice"}, files=[photo], headers=headers)
+    assert r.status_code == 422
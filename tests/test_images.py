@@ -0,0 +1,39 @@
+# tests/test_images.py
+"""Предобработка фото перед отправкой модели."""
+import io
+
+from PIL import Image
+
+from app.images import preprocess_image
+
+
+def _encode(img: Image.Image, fmt: str, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format=fmt, **params)
+    return out.getvalue()
+
+
+def test_transparency_is_flattened_onto_white():
+    img = Image.effect_noise((2048, 1024), 90).convert("RGBA")
+    alpha = Image.new("L", img.size, 255)
+    alpha.paste(0, (0, 0, 1024, 1024))  # левая половина прозрачная
+    img.putalpha(alpha)
+
+    mime, data = preprocess_image(_encode(img, "PNG"))
+    out = Image.open(io.BytesIO(data))
+    assert mime == "image/jpeg"
+    assert max(out.size) == 1024
+    assert all(channel > 245 for channel in out.getpixel((10, 10)))
+
+
+def test_small_jpeg_is_sent_as_is():
+    original = _encode(Image.new("RGB", (40, 40), "red"), "JPEG", quality=30)
+    assert preprocess_image(original) == ("image/jpeg", original)
+
+
+def test_large_photo_is_downscaled():
+    original = _encode(Image.effect_noise((3000, 2000), 80).convert("RGB"), "JPEG", quality=95)
+    mime, data = preprocess_image(original)
+    assert mime == "image/jpeg"
+    assert len(data) < len(original)
+    assert max(Image.open(io.BytesIO(data)).size) == 1024
@@ -0,0 +1,30 @@
+# tests/test_jobs.py
+"""JobQueue: уведомление не теряется между проверкой и ожиданием, события не копятся."""
+import asyncio
+
+from app.jobs import JobQueue
+
+
+def test_notify_before_wait_is_not_lost():
+    async def scenario():
+        jobs = JobQueue()
+        with jobs.listen("draft") as finished:
+            jobs.notify("draft")  # воркер успел между чтением статуса и ожиданием
+            assert await jobs.wait(finished, 0.01)
+        assert not jobs._events and not jobs._listeners
+
+    asyncio.run(scenario())
+
+
+def test_timeout_drops_event_after_last_listener():
+    async def scenario():
+        jobs = JobQueue()
+        with jobs.listen("other-process") as first:
+            with jobs.listen("other-process") as second:
+                assert first is second
+                assert not await jobs.wait(second, 0.01)
+            assert "other-process" in jobs._events
+            assert not await jobs.wait(first, 0.01)
+        assert not jobs._events and not jobs._listeners
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+# tests/test_json_stream.py
+"""JsonFieldStream: поля не зависят от того, как текст порезан на дельты."""
+import json
+import random
+
+import pytest
+
+from app import api
+from app.json_stream import JsonFieldStream
+
+
+ANSWER = {
+    "title": 'Борщ "домашний", {с} [сметаной]',
+    "total_kcal": 320.5,
+    "portion_weight_grams": 350,
+    "portion_weight_oz": None,
+    "cooking_method": "stewed",
+    "macros": {"protein_g": 12, "fat_g": 14.5, "carbohydrates_g": 30, "sugar_g": 8, "fiber_g": 5, "salt_g": 1.2,
+               "water_ml": 280},
+    "satiety_hours": 3,
+    "ingredients_detected": ["свёкла", "капуста", "a\\b", "}", ""],
+    "time_of_day": None,
+    "location": "home",
+}
+RAW = json.dumps(ANSWER, ensure_ascii=False)  # structured output — голый JSON
+TEXT = "```json\n" + json.dumps(ANSWER, ensure_ascii=False, indent=1) + "\n```"
+
+
+def _split(text, sizes):
+    pos = 0
+    for size in sizes:
+        yield text[pos:pos + size]
+        pos += size
+    yield text[pos:]
+
+
+def _parse(chunks):
+    parser = JsonFieldStream()
+    fields = [field for chunk in chunks for field in parser.feed(chunk)]
+    return parser, fields
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_fixed_chunks(size):
+    parser, fields = _parse(TEXT[i:i + size] for i in range(0, len(TEXT), size))
+    assert fields == list(ANSWER.items())
+    assert parser.text == TEXT
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunks(seed):
+    rnd = random.Random(seed)
+    _, fields = _parse(_split(TEXT, [rnd.randint(0, 9) for _ in range(len(TEXT))]))
+    assert fields == list(ANSWER.items())
+
+
+def test_field_emitted_before_object_ends():
+    parser = JsonFieldStream()
+    assert parser.feed('{"a": "x,}\\"y", "b": {"c": [1,') == [("a", 'x,}"y')]
+    assert parser.feed('2]}, "d": [], "e"') == [("b", {"c": [1, 2]}), ("d", [])]
+    assert parser.feed(": null}\n```") == [("e", None)]
+
+
+def test_stream_endpoint_emits_fields(client, auth_headers, monkeypatch):
+    async def fake_stream(req, on_usage=None):
+        for chunk in _split(RAW, [3] * (len(RAW) // 3)):
+            yield chunk
+
+    monkeypatch.setattr(api, "stream_meal_analysis", fake_stream)
+    r = client.post("/api/meal/draft/stream", data={"text_description": "борщ для test_json_stream"}, headers=auth_headers)
+    assert r.status_code == 200
+
+    events = []
+    for block in r.text.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    assert [name for name, _ in events] == ["draft"] + ["field"] * len(ANSWER) + ["done"]
+    assert [(e["name"], e["value"]) for _, e in events[1:-1]] == list(ANSWER.items())
+
+    done = events[-1][1]
+    assert done["cache"] == "miss" and done["draft_status"] == "pending"
+    assert done["suggestion"]["total_kcal"] == ANSWER["total_kcal"]
+    draft = client.get(f"/api/meal/draft/{done['draft_id']}", headers=auth_headers).json()
+    assert draft["draft_status"] == "pending"
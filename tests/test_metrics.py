@@ -0,0 +1,13 @@
+# tests/test_metrics.py
+"""Выборочный профилировщик MetricsMiddleware."""
+from app.config import settings
+
+
+def test_profile_is_written_for_every_nth_request(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_EVERY_N", 1)
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/healthz").status_code == 200
+    profiles = sorted(p.name for p in tmp_path.iterdir())
+    assert len(profiles) == 2
+    assert all(name.endswith("-GET_healthz.folded") for name in profiles)
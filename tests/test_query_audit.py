@@ -0,0 +1,82 @@
+# tests/test_query_audit.py
+"""Горячие эндпоинты под детектором запросов (app/query_audit_plugin.py валит тест при нарушении)."""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.db import db_writer, engine
+from app.models import MealLog
+from app.query_audit import QueryAuditMiddleware, take_violations
+from app.queries import day_window
+from app.rollups import apply_meal_delta
+
+
+@pytest.fixture(scope="module", autouse=True)
+def meals(user_id):
+    """Три приёма пищи в день за неделю — достаточно, чтобы N+1 по дням был виден."""
+    def write(session: Session) -> None:
+        for i in range(7):
+            day = date.today() - timedelta(days=i)
+            for hour, kcal in ((8, 400), (13, 600), (19, 550)):
+                log = MealLog(user_id=user_id, eaten_at=datetime.combine(day, time(hour)), name="meal", kcal=kcal,
+                              protein_g=10, fat_g=5, carbs_g=50, sugar_g=3, fiber_g=2)
+                session.add(log)
+                apply_meal_delta(session, log)
+
+    db_writer.run(write)
+
+
+def test_dashboard(client, auth_headers):
+    r = client.get("/api/dashboard", headers=auth_headers)
+    assert r.status_code == 200
+    assert r.json()["totals"]["kcal"] == 1550
+
+
+def test_water(client, auth_headers):
+    before = client.get("/api/dashboard", headers=auth_headers).json()["totals"]["water_ml"]
+    r = client.post("/api/water", json={"ml": 250}, headers=auth_headers)
+    assert r.status_code == 200
+    r = client.get("/api/dashboard", headers=auth_headers)
+    assert r.json()["totals"]["water_ml"] == before + 250
+
+
+def test_history(client, auth_headers):
+    r = client.get("/api/history", headers=auth_headers)
+    assert r.status_code == 200
+    days = r.json()["days"]
+    assert len(days) == 7
+    assert all(day["totals"]["kcal"] == 1550 for day in days)
+
+
+def _audited_app(where) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(QueryAuditMiddleware)
+
+    @app.get("/meals")
+    def meals_for_today() -> int:
+        with Session(engine) as session:
+            return len(session.exec(select(MealLog).where(where(date.today()))).all())
+
+    return app
+
+
+def test_date_filter_is_full_scan():
+    """`DATE(eaten_at) = ...` не использует индекс — детектор должен это поймать."""
+    with TestClient(_audited_app(lambda day: func.date(MealLog.eaten_at) == day.isoformat())) as client:
+        assert client.get("/meals").json() == 3
+    found = take_violations()
+    assert [(v.kind, v.detail.split(":")[0]) for v in found] == [("full_scan", "meallog")]
+
+
+def test_day_window_uses_index():
+    def where(day):
+        start, end = day_window(day)
+        return (MealLog.eaten_at >= start) & (MealLog.eaten_at < end)
+
+    with TestClient(_audited_app(where)) as client:
+        assert client.get("/meals").json() == 3
+    assert take_violations() == []
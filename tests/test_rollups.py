@@ -0,0 +1,87 @@
+# tests/test_rollups.py
+"""Пересборка DailySummary из сырых логов (python -m app.rollups)."""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.db import db_writer, engine
+from app.models import DailySummary, MealLog, WaterLog, WeightLog
+from app.rollups import rebuild_daily_summaries
+
+
+DAY = date.today() - timedelta(days=10)
+NEXT = DAY + timedelta(days=1)
+
+
+def _write_raw_logs(user_id: int) -> None:
+    """Логи в обход приложения — без дельт, DailySummary о них не знает."""
+    def write(session: Session) -> None:
+        for hour, kcal in ((9, 300), (14, 700.5)):
+            session.add(MealLog(user_id=user_id, eaten_at=datetime.combine(DAY, time(hour)), name="raw", kcal=kcal,
+                                protein_g=20, fat_g=10, carbs_g=40, sugar_g=5, fiber_g=3))
+        session.add(MealLog(user_id=user_id, eaten_at=datetime.combine(NEXT, time(12)), name="raw", kcal=450,
+                            protein_g=15, fat_g=12, carbs_g=55, sugar_g=6, fiber_g=4))
+        session.add(WaterLog(user_id=user_id, drank_at=datetime.combine(DAY, time(10)), ml=250))
+        session.add(WaterLog(user_id=user_id, drank_at=datetime.combine(DAY, time(18)), ml=500))
+        session.add(WeightLog(user_id=user_id, on_date=DAY, kg=81.0))
+        session.add(WeightLog(user_id=user_id, on_date=DAY, kg=80.4))
+
+    db_writer.run(write)
+
+
+def _summary(user_id: int, day: date) -> DailySummary:
+    with Session(engine) as session:
+        return session.exec(select(DailySummary).where(DailySummary.user_id == user_id).where(DailySummary.day == day)).one()
+
+
+def _rebuild(user_id: int) -> int:
+    with Session(engine) as session:
+        return rebuild_daily_summaries(session, [user_id])
+
+
+def test_rebuild_matches_raw_logs(client, auth_headers, user_id):
+    _write_raw_logs(user_id)
+    before = client.get("/api/dashboard", params={"date": DAY.isoformat()}, headers=auth_headers)
+    assert before.json()["totals"]["kcal"] == 0
+
+    assert _rebuild(user_id) >= 2
+
+    # кэш и ETag дашборда сброшены пересборкой
+    r = client.get("/api/dashboard", params={"date": DAY.isoformat()},
+                   headers={**auth_headers, "If-None-Match": before.headers["ETag"]})
+    assert r.status_code == 200
+    totals = r.json()["totals"]
+    assert totals["kcal"] == 1000.5
+    assert totals["protein_g"] == 40 and totals["carbs_g"] == 80
+    assert totals["water_ml"] == 750
+
+    history = client.get("/api/history", params={"from": DAY.isoformat(), "to": NEXT.isoformat()}, headers=auth_headers)
+    days = {d["date"]: d for d in history.json()["days"]}
+    assert days[DAY.isoformat()]["totals"] == totals
+    assert days[DAY.isoformat()]["meal_count"] == 2
+    assert days[DAY.isoformat()]["weight_kg"] == 80.4  # последнее измерение дня
+    assert days[NEXT.isoformat()]["totals"]["kcal"] == 450
+    assert days[NEXT.isoformat()]["meal_count"] == 1
+
+
+def test_rebuild_repairs_drift_and_keeps_incremental_totals(client, auth_headers, user_id):
+    client.post("/api/water", json={"ml": 330}, headers=auth_headers)
+    today = client.get("/api/dashboard", headers=auth_headers).json()["totals"]
+
+    def corrupt(session: Session) -> None:
+        session.execute(update(DailySummary).where(DailySummary.user_id == user_id).where(DailySummary.day == DAY)
+                        .values(kcal=9999, meal_count=7))
+
+    etag = client.get("/api/dashboard", params={"date": DAY.isoformat()}, headers=auth_headers).headers["ETag"]
+    db_writer.run(corrupt)
+    assert _summary(user_id, DAY).kcal == 9999
+
+    _rebuild(user_id)
+    assert _summary(user_id, DAY).meal_count == 2
+    r = client.get("/api/dashboard", params={"date": DAY.isoformat()}, headers={**auth_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["totals"]["kcal"] == 1000.5
+
+    # дельты из API и пересборка дают одно и то же
+    assert client.get("/api/dashboard", headers=auth_headers).json()["totals"] == today
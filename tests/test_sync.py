@@ -0,0 +1,58 @@
+# tests/test_sync.py
+"""Дельта-синхронизация GET /api/sync: курсоры, удаления и срок хранения журнала."""
+from datetime import datetime, timedelta
+
+from app.changes import purge_changes
+from app.config import settings
+from app.db import db_writer
+
+
+def _sync(client, headers, since, **params):
+    r = client.get("/api/sync", params={"since": since, **params}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _water_ids(page):
+    return {row["id"] for row in page["changes"]["water"]}
+
+
+def test_cursor_delivers_changes_and_deletes(client, auth_headers):
+    first = client.post("/api/water", json={"ml": 200}, headers=auth_headers).json()["id"]
+    second = client.post("/api/water", json={"ml": 300}, headers=auth_headers).json()["id"]
+
+    full = _sync(client, auth_headers, 0)
+    assert {first, second} <= _water_ids(full)
+    assert not full["has_more"] and not full["reset"]
+
+    client.delete(f"/api/water/{first}", headers=auth_headers)
+    delta = _sync(client, auth_headers, full["cursor"])
+    assert delta["deleted"]["water"] == [first]
+    assert _water_ids(delta) == set()
+    assert _sync(client, auth_headers, delta["cursor"])["cursor"] == delta["cursor"]
+
+    # постранично с since=0 приходит то же, что одним запросом
+    seen, cursor, has_more = set(), 0, True
+    while has_more:
+        page = _sync(client, auth_headers, cursor, limit=1)
+        seen |= _water_ids(page)
+        cursor, has_more = page["cursor"], page["has_more"]
+    assert seen == {second}
+
+
+def test_expired_cursor_gets_full_resync(client, auth_headers):
+    kept = client.post("/api/water", json={"ml": 250}, headers=auth_headers).json()["id"]
+    gone = client.post("/api/water", json={"ml": 150}, headers=auth_headers).json()["id"]
+    old_cursor = _sync(client, auth_headers, 0)["cursor"]
+    client.delete(f"/api/water/{gone}", headers=auth_headers)
+
+    later = datetime.utcnow() + timedelta(seconds=settings.CHANGELOG_RETENTION_SECONDS + 60)
+    db_writer.run(lambda session: purge_changes(session.connection(), later))
+
+    page = _sync(client, auth_headers, old_cursor)
+    assert page["reset"]
+    assert kept in _water_ids(page)  # живая строка пережила чистку журнала
+    assert gone not in _water_ids(page)
+
+    fresh = _sync(client, auth_headers, page["cursor"])
+    assert not fresh["reset"] and not fresh["has_more"]
@@ -0,0 +1,49 @@
+# tests/test_sync_batch.py
+"""POST /api/sync/batch: офлайн-очередь применяется одной транзакцией, повтор ключа не пишет второй раз."""
+import uuid
+from datetime import date
+
+
+def _batch(client, headers, *operations):
+    r = client.post("/api/sync/batch", json={"operations": list(operations)}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["results"]
+
+
+def _op(op, type_, data=None, id_=None):
+    return {"idempotency_key": uuid.uuid4().hex, "op": op, "type": type_, "id": id_, "data": data or {}}
+
+
+def test_batch_applies_operations_in_order(client, auth_headers):
+    day = date.today().isoformat()
+    water = _op("create", "water", {"ml": 330, "drank_at": f"{day}T10:00:00"})
+    meal = _op("create", "meal", {"name": "soup", "kcal": 250, "protein_g": 10, "fat_g": 8, "carbs_g": 30,
+                                  "sugar_g": 4, "fiber_g": 3, "eaten_at": f"{day}T12:30:00"})
+    missing = _op("delete", "water", id_=10 ** 9)
+    invalid = _op("create", "water", {"ml": "a lot"})
+    results = _batch(client, auth_headers, water, meal, missing, invalid)
+
+    assert [r["status"] for r in results] == ["created", "created", "not_found", "invalid"]
+    assert [r["idempotency_key"] for r in results] == [o["idempotency_key"] for o in (water, meal, missing, invalid)]
+    totals = client.get("/api/dashboard", headers=auth_headers).json()["totals"]
+    assert totals["water_ml"] == 330 and totals["kcal"] == 250
+
+    # повтор той же очереди (ответ потерялся) — те же id, без второй записи
+    again = _batch(client, auth_headers, water, meal)
+    assert [r["replayed"] for r in again] == [True, True]
+    assert [r["id"] for r in again] == [r["id"] for r in results[:2]]
+    assert client.get("/api/dashboard", headers=auth_headers).json()["totals"]["water_ml"] == 330
+
+    update = _op("update", "water", {"ml": 500}, id_=results[0]["id"])
+    delete = _op("delete", "meal", id_=results[1]["id"])
+    assert [r["status"] for r in _batch(client, auth_headers, update, delete)] == ["updated", "deleted"]
+    totals = client.get("/api/dashboard", headers=auth_headers).json()["totals"]
+    assert totals["water_ml"] == 500 and totals["kcal"] == 0
+
+
+def test_batch_size_limit(client, auth_headers, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SYNC_BATCH_MAX_OPERATIONS", 1)
+    r = client.post("/api/sync/batch", json={"operations": [_op("create", "water", {"ml": 1})] * 2}, headers=auth_headers)
+    assert r.status_code == 413